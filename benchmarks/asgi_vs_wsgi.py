@@ -0,0 +1,102 @@
+"""
+Throughput and latency of the WSGI and ASGI deployments at rising concurrency.
+
+    python benchmarks/asgi_vs_wsgi.py secure
+    python benchmarks/asgi_vs_wsgi.py vulnerable --levels 1 8 32 --iterations 2
+
+For every --levels value, run.py is started twice in a fresh process: once
+with --driver wsgi (threaded wsgiref server, config.settings) and once with
+--driver asgi (uvicorn, config.settings_asgi). The table shows total req/s
+and the p95 of the endpoints that matter most, per driver and concurrency.
+Both runs of a level use the same users, clients and iterations. The combined
+result is written to benchmarks/results/ next to the per-run files.
+
+uvicorn must be installed for the asgi runs: pip install "uvicorn[standard]".
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import harness
+
+DRIVERS = ("wsgi", "asgi")
+SHOWN = ("login", "dashboard", "forgot_password", "change_password")
+
+
+def run_one(project, driver, concurrency, args, output):
+    command = [
+        sys.executable, os.path.join(harness.BENCH_DIR, "run.py"), project,
+        "--driver", driver,
+        "--users", str(max(args.users, concurrency)),
+        "--clients", str(args.clients),
+        "--iterations", str(args.iterations),
+        "--concurrency", str(concurrency),
+        "--output", output,
+    ]
+    settings = args.wsgi_settings if driver == "wsgi" else args.asgi_settings
+    if settings:
+        command += ["--settings", settings]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project", help="secure, vulnerable, or a path to a project directory")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16], help="concurrency levels")
+    parser.add_argument("--users", type=int, default=16, help="virtual users (at least the concurrency level)")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--wsgi-settings", help="base settings for the wsgi runs (default config.settings)")
+    parser.add_argument("--asgi-settings", help="base settings for the asgi runs (default config.settings_asgi)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    project = harness.project_dir(args.project)
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        for concurrency in args.levels:
+            for driver in DRIVERS:
+                print(f"{driver} at concurrency {concurrency} ...", flush=True)
+                result = run_one(project, driver, concurrency, args, os.path.join(tmp, f"{driver}-{concurrency}.json"))
+                runs.append({
+                    "driver": driver,
+                    "concurrency": concurrency,
+                    "totals": result["totals"],
+                    "endpoints": result["endpoints"],
+                })
+
+    header = f"{'driver':<8}{'conc':>6}{'req/s':>9}{'errors':>8}" + "".join(f"{name[:14] + ' p95':>20}" for name in SHOWN)
+    print(header)
+    for run in runs:
+        p95 = "".join(f"{run['endpoints'].get(name, {}).get('p95_ms', 0.0):>20.1f}" for name in SHOWN)
+        print(f"{run['driver']:<8}{run['concurrency']:>6}{run['totals']['rps']:>9.2f}{run['totals']['errors']:>8}{p95}")
+
+    revision = harness.git_revision()
+    now = datetime.now(timezone.utc)
+    output = args.output
+    if output is None:
+        os.makedirs(harness.RESULTS_DIR, exist_ok=True)
+        name = f"asgi_vs_wsgi-{os.path.basename(project)}-{revision}-{now:%Y%m%dT%H%M%S}.json"
+        output = os.path.join(harness.RESULTS_DIR, name)
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": "asgi_vs_wsgi",
+            "project": os.path.basename(project),
+            "git_revision": revision,
+            "timestamp": now.isoformat(timespec="seconds"),
+            "config": {"levels": args.levels, "users": args.users, "clients": args.clients,
+                       "iterations": args.iterations},
+            "runs": runs,
+        }, f, indent=2)
+        f.write("\n")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
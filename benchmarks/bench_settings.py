@@ -0,0 +1,34 @@
+"""
+Settings used by benchmarks/run.py.
+
+Everything comes from the project's own settings module (BENCH_BASE_SETTINGS,
+config.settings by default), except:
+
+- the database is the throwaway SQLite file named by BENCH_DB (and a read
+  replica, if the base settings define one, is a copy next to it),
+- Communication_LTD is created with --run-syncdb, since migrations are not
+  kept in the repository,
+- mail is still queued, but delivered to django.core.mail.outbox by the
+  in-process dispatcher, where the runner reads reset codes.
+"""
+import importlib
+import os
+
+_base = importlib.import_module(os.environ.get("BENCH_BASE_SETTINGS", "config.settings"))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+DATABASES = {
+    **_base.DATABASES,
+    "default": {**_base.DATABASES["default"], "NAME": os.environ["BENCH_DB"]},
+}
+if "replica" in DATABASES:
+    _replica = os.path.join(os.path.dirname(os.environ["BENCH_DB"]), "db.replica.sqlite3")
+    DATABASES["replica"] = {**DATABASES["replica"], "NAME": f"file:{_replica}?mode=ro"}
+MIGRATION_MODULES = {"Communication_LTD": None}
+MAIL_QUEUE = {
+    **getattr(_base, "MAIL_QUEUE", {}),
+    "BACKEND": "Communication_LTD.mailqueue.StandInBackend",
+    "DISPATCHER": "thread",
+}
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "127.0.0.1", "localhost"]
@@ -0,0 +1,94 @@
+"""
+Compare two benchmark result files.
+
+    python benchmarks/compare.py results/auth-project_secure-abc123-....json \\
+                                 results/auth-project_vulnerable-abc123-....json
+    python benchmarks/compare.py base.json new.json --metric p95_ms --threshold 15
+
+Prints the chosen latency percentiles and throughput of every endpoint in
+both runs with the relative change. Exits with status 1 when any endpoint's
+--metric got worse by more than --threshold percent (or reported errors
+that the base run did not), so it can gate a commit in CI.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "rps")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(base, new):
+    if not base:
+        return None
+    return (new - base) / base * 100
+
+
+def format_change(value):
+    return "   n/a" if value is None else f"{value:+6.1f}%"
+
+
+def regressed(metric, delta, threshold):
+    if delta is None:
+        return False
+    # Latency should go down, throughput up
+    return delta < -threshold if metric == "rps" else delta > threshold
+
+
+def describe(result):
+    config = result.get("config", {})
+    return (f"{result['project']} @ {result['git_revision']} ({result['timestamp']}, "
+            f"driver={config.get('driver')}, concurrency={config.get('concurrency')})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--metric", choices=METRICS, default="p95_ms", help="metric checked against --threshold")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    print(f"base: {describe(base)}")
+    print(f"new:  {describe(new)}")
+    print()
+
+    header = f"{'endpoint':<22}" + "".join(f"{metric:>28}" for metric in METRICS)
+    print(header)
+
+    failures = []
+    for endpoint in sorted(set(base["endpoints"]) | set(new["endpoints"])):
+        old_row = base["endpoints"].get(endpoint)
+        new_row = new["endpoints"].get(endpoint)
+        if old_row is None or new_row is None:
+            print(f"{endpoint:<22}  only in {'new' if old_row is None else 'base'}")
+            continue
+
+        cells = []
+        for metric in METRICS:
+            delta = change(old_row[metric], new_row[metric])
+            cells.append(f"{old_row[metric]:>9.1f} -> {new_row[metric]:>9.1f} {format_change(delta)}")
+            if metric == args.metric and regressed(metric, delta, args.threshold):
+                failures.append(f"{endpoint}: {metric} {format_change(delta).strip()}")
+        if new_row["errors"] > old_row["errors"]:
+            failures.append(f"{endpoint}: {new_row['errors']} errors (base {old_row['errors']})")
+        print(f"{endpoint:<22}" + "".join(f"{cell:>28}" for cell in cells))
+
+    print()
+    print(f"total req/s: {base['totals']['rps']} -> {new['totals']['rps']} "
+          f"{format_change(change(base['totals']['rps'], new['totals']['rps'])).strip()}")
+
+    if failures:
+        print(f"\nRegressions beyond {args.threshold}% ({args.metric}):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Shared pieces of the benchmark scripts: Django setup against a throwaway
+database, data seeding, HTTP drivers, latency recording and JSON results.
+
+Only one project can be loaded per process (both define the `config` and
+`Communication_LTD` packages), so every script benchmarks one project and
+compare.py puts the result files side by side.
+"""
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+SEED_PASSWORD = "Bench!Seed0Pw"
+
+
+def project_dir(project):
+    """Accept "secure", "project_secure" or a path"""
+    for candidate in (project, os.path.join(REPO_DIR, project), os.path.join(REPO_DIR, f"project_{project}")):
+        if os.path.isfile(os.path.join(candidate, "manage.py")):
+            return os.path.abspath(candidate)
+    raise SystemExit(f"No Django project found for '{project}'")
+
+
+def setup_django(project, base_settings="config.settings", database=None):
+    """Load a project with bench_settings and create its schema in a fresh SQLite file"""
+    path = project_dir(project)
+    sys.path[:0] = [path, BENCH_DIR]
+    if database is None:
+        database = os.path.join(tempfile.mkdtemp(prefix="bench-"), "db.sqlite3")
+    os.environ["BENCH_DB"] = database
+    os.environ["BENCH_BASE_SETTINGS"] = base_settings
+    os.environ["DJANGO_SETTINGS_MODULE"] = "bench_settings"
+
+    import django
+    from django.core import mail
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    mail.outbox = []
+    return path
+
+
+def seed(users, clients, batch_size=1000):
+    """Create users bench0..benchN-1 (all with SEED_PASSWORD) and some clients"""
+    from Communication_LTD.models import Client, PasswordHistory, User
+    from Communication_LTD.utils import hash_password
+
+    # One real hash shared by every seeded user keeps seeding fast
+    password_hash, salt = hash_password(SEED_PASSWORD)
+
+    User.objects.bulk_create(
+        [
+            User(username=f"bench{i}", email=f"bench{i}@example.com", password_hash=password_hash, salt=salt)
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    created = list(User.objects.filter(username__startswith="bench").order_by("id"))
+    PasswordHistory.objects.bulk_create(
+        [PasswordHistory(user=user, password_hash=password_hash, salt=salt) for user in created],
+        batch_size=batch_size,
+    )
+    Client.objects.bulk_create(
+        [Client(name=f"Client {i}", email=f"client{i}@example.com", phone=f"05{i:08d}") for i in range(clients)],
+        batch_size=batch_size,
+    )
+    return [{"username": user.username, "email": user.email, "password": SEED_PASSWORD} for user in created]
+
+
+_outbox_lock = threading.Lock()
+
+
+def take_reset_code(email, timeout=10.0):
+    """
+    Remove the newest reset mail sent to email from the outbox and return its
+    code, waiting up to timeout seconds for the mail queue to deliver it.
+    """
+    from django.core import mail
+
+    deadline = time.monotonic() + timeout
+    while True:
+        with _outbox_lock:
+            for index in range(len(mail.outbox) - 1, -1, -1):
+                message = mail.outbox[index]
+                if email in message.to:
+                    del mail.outbox[index]
+                    found = re.search(r"code is: (\w+)", message.body)
+                    return found.group(1) if found else None
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.005)
+
+
+# DRIVERS
+# Both return (status code, Location header) and never follow redirects.
+
+class TestClientDriver:
+    """In-process requests through django.test.Client (no sockets, no CSRF checks)"""
+
+    name = "client"
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        self._consume(response)
+        return response.status_code, response.get("Location")
+
+    def post(self, path, data):
+        response = self.client.post(path, data)
+        self._consume(response)
+        return response.status_code, response.get("Location")
+
+    def _consume(self, response):
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Real HTTP requests with a cookie jar, sending the CSRF token like a browser"""
+
+    name = "http"
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+        # The login page sets the csrftoken cookie
+        self.get("/")
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get("Location")
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get("Location")
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        body = urllib.parse.urlencode({**data, "csrfmiddlewaretoken": self._csrf_token()}).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body, method="POST"))
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class WSGIServerThread:
+    """The project's WSGI application on 127.0.0.1, served from a background thread"""
+
+    def __init__(self):
+        from django.core.wsgi import get_wsgi_application
+
+        self.server = make_server(
+            "127.0.0.1", 0, get_wsgi_application(),
+            server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGIServerThread:
+    """The project's ASGI application on 127.0.0.1, served by uvicorn from a background thread"""
+
+    def __init__(self):
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit('The asgi driver needs uvicorn: pip install "uvicorn[standard]"')
+        from django.core.asgi import get_asgi_application
+
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.base_url = f"http://127.0.0.1:{self.socket.getsockname()[1]}"
+        config = uvicorn.Config(
+            get_asgi_application(), lifespan="off", log_level="warning", access_log=False, backlog=128,
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise SystemExit("uvicorn did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(10)
+        self.socket.close()
+
+
+# RECORDING
+
+class Recorder:
+    """Thread-safe latency samples per endpoint"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def timed(self, endpoint, fn, *args, expect=None):
+        """Call fn(*args), record its latency and return its result"""
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            self.record(endpoint, time.perf_counter() - started, ok=False)
+            raise
+        self.record(endpoint, time.perf_counter() - started, ok=expect is None or result == expect)
+        return result
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder, wall_seconds):
+    endpoints = {}
+    total = 0
+    for endpoint, samples in sorted(recorder.samples.items()):
+        values = sorted(samples)
+        total += len(values)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+            "rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+    return endpoints, {
+        "requests": total,
+        "errors": sum(recorder.errors.values()),
+        "wall_seconds": round(wall_seconds, 3),
+        "rps": round(total / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+
+def print_table(endpoints, totals):
+    print(f"{'endpoint':<22}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for endpoint, row in endpoints.items():
+        print(
+            f"{endpoint:<22}{row['count']:>7}{row['errors']:>8}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['rps']:>9.1f}"
+        )
+    print(f"{totals['requests']} requests, {totals['errors']} errors in {totals['wall_seconds']}s "
+          f"({totals['rps']} req/s)")
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def write_results(benchmark, project, config, endpoints, totals, output=None):
+    """Write a result file (benchmarks/results/ unless output is given) and return its path"""
+    import django
+
+    revision = git_revision()
+    now = datetime.now(timezone.utc)
+    result = {
+        "benchmark": benchmark,
+        "project": os.path.basename(project),
+        "git_revision": revision,
+        "timestamp": now.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "config": config,
+        "endpoints": endpoints,
+        "totals": totals,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{benchmark}-{os.path.basename(project)}-{revision}-{now:%Y%m%dT%H%M%S}.json"
+        output = os.path.join(RESULTS_DIR, name)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+        f.write("\n")
+    return output
@@ -0,0 +1,113 @@
+"""
+Database queries and latency per login attempt, by outcome.
+
+    python benchmarks/login.py vulnerable
+    python benchmarks/login.py secure --attempts 500 --fast-hash
+
+A fresh database is seeded with --users users. Then --attempts times, for a
+seeded user in turn, the runner posts to the login view in-process (through
+django.test.Client, each attempt from its own client address so the IP
+throttle never kicks in):
+
+- wrong_password: an existing user with a wrong password,
+- ok: the same user with the right password (which also resets the
+  failure count, so no account gets locked),
+- unknown_user: a username that does not exist.
+
+Every attempt runs inside CaptureQueriesContext, so the result has the mean
+number of queries per login next to p50/p95/p99 latency. To compare two
+revisions, run it against a checkout of the older one:
+
+    git worktree add /tmp/before <revision>
+    python benchmarks/login.py /tmp/before/project_vulnerable --output before.json
+    python benchmarks/login.py vulnerable --output after.json
+    python benchmarks/compare.py before.json after.json --metric p99_ms
+
+--fast-hash hashes with 1,000 PBKDF2 iterations on the request thread, so
+the latency shows the database work instead of the password hash.
+"""
+import argparse
+import time
+
+import harness
+
+FAST_HASH = {
+    "PASSWORD_HASHER": "pbkdf2_sha256",
+    "PASSWORD_HASHER_PARAMS": {"pbkdf2_sha256": {"iterations": 1000}},
+    "PASSWORD_HASHING_EXECUTOR": {"KIND": "inline"},
+}
+
+
+def client_address(number):
+    return f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project", help="secure, vulnerable, or a path to a project directory")
+    parser.add_argument("--settings", default="config.settings", help="base settings module of the project")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=200, help="logins of each outcome")
+    parser.add_argument("--fast-hash", action="store_true", help="cheap password hashing (see above)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    project = harness.setup_django(args.project, args.settings)
+
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    if args.fast_hash:
+        override_settings(**FAST_HASH).enable()
+    users = harness.seed(args.users, 0)
+
+    client = Client()
+    recorder = harness.Recorder()
+    queries = {}
+    number = 0
+
+    def attempt(outcome, username, password, expect):
+        nonlocal number
+        number += 1
+
+        def post():
+            response = client.post("/", {"username": username, "password": password},
+                                   REMOTE_ADDR=client_address(number))
+            return response.status_code, response.get("Location")
+
+        with CaptureQueriesContext(connection) as captured:
+            recorder.timed(outcome, post, expect=expect)
+        queries.setdefault(outcome, []).append(len(captured))
+
+    started = time.perf_counter()
+    for i in range(args.attempts):
+        user = users[i % len(users)]
+        attempt("wrong_password", user["username"], "Wrong!Passw0rd", (302, "/"))
+        attempt("ok", user["username"], user["password"], (302, "/dashboard/"))
+        attempt("unknown_user", f"nobody{i}", user["password"], (302, "/"))
+    wall = time.perf_counter() - started
+
+    endpoints, totals = harness.summarize(recorder, wall)
+    for outcome, row in endpoints.items():
+        row["queries"] = round(sum(queries[outcome]) / len(queries[outcome]), 2)
+
+    print(f"{'outcome':<22}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for outcome, row in endpoints.items():
+        print(f"{outcome:<22}{row['queries']:>9.2f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['errors']:>8}")
+
+    config = {
+        "driver": "client",
+        "settings": args.settings,
+        "users": args.users,
+        "attempts": args.attempts,
+        "fast_hash": args.fast_hash,
+        "concurrency": 1,
+    }
+    path = harness.write_results("login", project, config, endpoints, totals, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark the authentication flows of one project.
+
+    python benchmarks/run.py secure
+    python benchmarks/run.py vulnerable --driver wsgi --concurrency 8 --users 100
+
+A fresh database is seeded with --users users and --clients clients. Then
+every virtual user, --iterations times, logs in, loads the dashboard,
+changes their password, logs out, goes through forgot/verify/reset and
+registers a new account. Requests go either in-process through
+django.test.Client ("client"), over HTTP to a threaded wsgiref server
+running the project's WSGI application ("wsgi"), or over HTTP to uvicorn
+running its ASGI application ("asgi", needs uvicorn installed).
+
+p50/p95/p99 latency and throughput per endpoint are printed and saved as
+JSON under benchmarks/results/; compare runs with compare.py.
+"""
+import argparse
+import contextlib
+import itertools
+import threading
+import time
+
+import harness
+
+_numbers = itertools.count()
+_numbers_lock = threading.Lock()
+
+
+def next_number():
+    with _numbers_lock:
+        return next(_numbers)
+
+
+def next_password():
+    """A fresh password that satisfies the default policy and was never used"""
+    return f"Bench!{next_number():06d}Pw"
+
+
+def run_flow(driver, user, recorder):
+    """One pass through every authentication flow for a virtual user"""
+    timed = recorder.timed
+
+    timed("login", driver.post, "/", {"username": user["username"], "password": user["password"]},
+          expect=(302, "/dashboard/"))
+    timed("dashboard", driver.get, "/dashboard/", expect=(200, None))
+
+    new_password = next_password()
+    status = timed("change_password", driver.post, "/change_password/", {
+        "old_password": user["password"], "new_password": new_password, "confirm": new_password,
+    }, expect=(302, "/dashboard/"))
+    if status == (302, "/dashboard/"):
+        user["password"] = new_password
+
+    timed("logout", driver.get, "/logout/", expect=(302, "/"))
+
+    timed("forgot_password", driver.post, "/forgot_password/", {"username": user["username"]},
+          expect=(302, "/verify/"))
+    code = harness.take_reset_code(user["email"]) or ""
+    timed("verify", driver.post, "/verify/", {"code": code}, expect=(302, "/reset_password/"))
+    new_password = next_password()
+    status = timed("reset_password", driver.post, "/reset_password/", {
+        "password": new_password, "confirm": new_password,
+    }, expect=(302, "/"))
+    if status == (302, "/"):
+        user["password"] = new_password
+
+    username = f"new{next_number()}"
+    password = next_password()
+    timed("register", driver.post, "/register/", {
+        "username": username, "email": f"{username}@example.com", "password": password, "confirm": password,
+    }, expect=(302, "/"))
+
+
+def run(make_driver, users, iterations, concurrency):
+    recorder = harness.Recorder()
+    groups = [users[i::concurrency] for i in range(concurrency)]
+    failures = []
+
+    def worker(group):
+        driver = make_driver()
+        try:
+            for _ in range(iterations):
+                for user in group:
+                    run_flow(driver, user, recorder)
+        except Exception as exc:
+            failures.append(exc)
+        finally:
+            from django.db import connections
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(group,)) for group in groups if group]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    if failures:
+        raise failures[0]
+    return recorder, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project", help="secure, vulnerable, or a path to a project directory")
+    parser.add_argument("--driver", choices=["client", "wsgi", "asgi"], default="client")
+    parser.add_argument("--settings", help="base settings module of the project "
+                        "(default: config.settings_asgi for --driver asgi, else config.settings)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed flows before measuring")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+    if args.settings is None:
+        args.settings = "config.settings_asgi" if args.driver == "asgi" else "config.settings"
+
+    project = harness.setup_django(args.project, args.settings)
+    users = harness.seed(args.users + args.warmup, args.clients)
+    warmup_users, users = users[:args.warmup], users[args.warmup:]
+
+    if args.driver == "wsgi":
+        server = harness.WSGIServerThread()
+    elif args.driver == "asgi":
+        server = harness.ASGIServerThread()
+    else:
+        server = contextlib.nullcontext()
+    with server:
+        if args.driver in ("wsgi", "asgi"):
+            def make_driver():
+                return harness.HttpDriver(server.base_url)
+        else:
+            make_driver = harness.TestClientDriver
+
+        if warmup_users:
+            run(make_driver, warmup_users, 1, 1)
+        recorder, wall = run(make_driver, users, args.iterations, args.concurrency)
+
+    endpoints, totals = harness.summarize(recorder, wall)
+    harness.print_table(endpoints, totals)
+    config = {
+        "driver": args.driver,
+        "settings": args.settings,
+        "users": args.users,
+        "clients": args.clients,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+    }
+    path = harness.write_results("auth", project, config, endpoints, totals, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
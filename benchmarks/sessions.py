@@ -0,0 +1,153 @@
+"""
+Session table statements per login flow, Django's db backend against the
+project's session store.
+
+    python benchmarks/sessions.py secure
+    python benchmarks/sessions.py vulnerable --flows 200 --fast-hash
+
+A fresh database is seeded with --users users. Every flow, for a seeded
+user in turn and from a new client, logs in, loads the dashboard, logs in
+again, logs out, and goes through forgot/verify/reset before logging in
+with the new password. The flows run twice, once per profile:
+
+- django: django.contrib.sessions.backends.db with the default message
+  storage (FallbackStorage),
+- store: Communication_LTD.sessions with messages in a cookie
+  (CookieStorage).
+
+Every request runs inside CaptureQueriesContext, so the result has the
+mean number of writes (INSERT/UPDATE/DELETE) and reads on django_session
+per step and per flow next to p50/p95/p99 latency, and the rows left in
+the table after each profile.
+
+--fast-hash hashes with 1,000 PBKDF2 iterations on the request thread, so
+the latency shows the database work instead of the password hash.
+"""
+import argparse
+import time
+
+import harness
+from login import FAST_HASH
+
+PROFILES = {
+    "django": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "MESSAGE_STORAGE": "django.contrib.messages.storage.fallback.FallbackStorage",
+    },
+    "store": {
+        "SESSION_ENGINE": "Communication_LTD.sessions",
+        "MESSAGE_STORAGE": "django.contrib.messages.storage.cookie.CookieStorage",
+    },
+}
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+def session_statements(captured):
+    """(writes, reads) on the session table among the captured queries"""
+    kinds = [query["sql"].split(None, 1)[0].upper() for query in captured if "django_session" in query["sql"]]
+    writes = sum(kind in WRITES for kind in kinds)
+    return writes, len(kinds) - writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project", help="secure, vulnerable, or a path to a project directory")
+    parser.add_argument("--settings", default="config.settings", help="base settings module of the project")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--flows", type=int, default=50, help="login flows per profile")
+    parser.add_argument("--fast-hash", action="store_true", help="cheap password hashing (see above)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    project = harness.setup_django(args.project, args.settings)
+
+    from django.contrib.sessions.models import Session
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    if args.fast_hash:
+        override_settings(**FAST_HASH).enable()
+    users = harness.seed(args.users, 0)
+
+    recorder = harness.Recorder()
+    statements = {}
+    flows = {}
+    rows_left = {}
+    number = 0
+
+    def step(profile, name, request, expect):
+        """Time request() and count its session statements"""
+        with CaptureQueriesContext(connection) as captured:
+            result = recorder.timed(f"{profile}:{name}", request, expect=expect)
+        counted = session_statements(captured)
+        statements.setdefault(f"{profile}:{name}", []).append(counted)
+        flows[profile][-1] = tuple(map(sum, zip(flows[profile][-1], counted)))
+        return result
+
+    started = time.perf_counter()
+    for profile, profile_settings in PROFILES.items():
+        Session.objects.all().delete()
+        flows[profile] = []
+        with override_settings(**profile_settings):
+            for i in range(args.flows):
+                user = users[i % len(users)]
+                driver = harness.TestClientDriver()
+                flows[profile].append((0, 0))
+
+                def login():
+                    return driver.post("/", {"username": user["username"], "password": user["password"]})
+
+                step(profile, "login", login, (302, "/dashboard/"))
+                step(profile, "dashboard", lambda: driver.get("/dashboard/"), (200, None))
+                step(profile, "relogin", login, (302, "/dashboard/"))
+                step(profile, "logout", lambda: driver.get("/logout/"), (302, "/"))
+                step(profile, "forgot_password", lambda: driver.post("/forgot_password/", {"username": user["username"]}),
+                     (302, "/verify/"))
+                code = harness.take_reset_code(user["email"]) or ""
+                step(profile, "verify", lambda: driver.post("/verify/", {"code": code}), (302, "/reset_password/"))
+                number += 1
+                password = f"Sess!{number:06d}Pw"
+                status = step(profile, "reset_password",
+                              lambda: driver.post("/reset_password/", {"password": password, "confirm": password}),
+                              (302, "/"))
+                if status == (302, "/"):
+                    user["password"] = password
+                step(profile, "login_after_reset", login, (302, "/dashboard/"))
+        rows_left[profile] = Session.objects.count()
+    wall = time.perf_counter() - started
+
+    endpoints, totals = harness.summarize(recorder, wall)
+    for endpoint, samples in statements.items():
+        endpoints[endpoint]["session_writes"] = round(sum(writes for writes, _ in samples) / len(samples), 2)
+        endpoints[endpoint]["session_reads"] = round(sum(reads for _, reads in samples) / len(samples), 2)
+    totals["session_writes_per_flow"] = {
+        profile: round(sum(writes for writes, _ in samples) / len(samples), 2) for profile, samples in flows.items()
+    }
+    totals["session_reads_per_flow"] = {
+        profile: round(sum(reads for _, reads in samples) / len(samples), 2) for profile, samples in flows.items()
+    }
+    totals["rows_left"] = rows_left
+
+    print(f"{'step':<28}{'writes':>8}{'reads':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for endpoint, row in endpoints.items():
+        print(f"{endpoint:<28}{row['session_writes']:>8.2f}{row['session_reads']:>8.2f}{row['p50_ms']:>10.2f}"
+              f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['errors']:>8}")
+    for profile in PROFILES:
+        print(f"{profile}: {totals['session_writes_per_flow'][profile]} writes and "
+              f"{totals['session_reads_per_flow'][profile]} reads per flow, "
+              f"{rows_left[profile]} rows left in django_session")
+
+    config = {
+        "driver": "client",
+        "settings": args.settings,
+        "users": args.users,
+        "flows": args.flows,
+        "fast_hash": args.fast_hash,
+        "concurrency": 1,
+    }
+    path = harness.write_results("sessions", project, config, endpoints, totals, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
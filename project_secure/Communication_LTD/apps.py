@@ -4,3 +4,40 @@ class CommunicationLtdConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Communication_LTD'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_migrate, post_save
+        from .metrics import install_query_wrapper
+        from .replica import install_write_tracker
+        from .search import install_search_index_after_migrate
+        from .clientcache import clients_changed_on_save
+        from .sqlite import apply_sqlite_pragmas
+        from .usercache import invalidate_user_on_change
+        from . import warmup
+
+        # The FTS5 client search index is not a model, so create it after migrate
+        post_migrate.connect(install_search_index_after_migrate, sender=self)
+
+        # Drop a user from the session user cache whenever the row is saved or deleted
+        post_save.connect(invalidate_user_on_change, sender="Communication_LTD.User", dispatch_uid="Communication_LTD.usercache.save")
+        post_delete.connect(invalidate_user_on_change, sender="Communication_LTD.User", dispatch_uid="Communication_LTD.usercache.delete")
+
+        # New version of the cached dashboard client list whenever a client is saved or deleted
+        post_save.connect(clients_changed_on_save, sender="Communication_LTD.Client", dispatch_uid="Communication_LTD.clientcache.save")
+        post_delete.connect(clients_changed_on_save, sender="Communication_LTD.Client", dispatch_uid="Communication_LTD.clientcache.delete")
+
+        # settings.SQLITE_PRAGMAS on every new SQLite connection
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid="Communication_LTD.sqlite")
+
+        # Count queries per request on every database connection
+        connection_created.connect(install_query_wrapper, dispatch_uid="Communication_LTD.metrics")
+
+        # Pin a client to the primary database after it wrote (settings.READ_REPLICA)
+        connection_created.connect(install_write_tracker, dispatch_uid="Communication_LTD.replica")
+
+        # Import the views and compile templates, policy and dictionary while booting
+        # instead of on the first requests (settings.STARTUP_WARMUP)
+        options = warmup.get_options()
+        if options["ENABLED"]:
+            warmup.warm_up(options["TEMPLATES"])
+
@@ -0,0 +1,361 @@
+"""
+Async variants of the account and dashboard views, served by the ASGI entry
+point (config/asgi.py -> config/asgi_urls.py).
+
+They behave exactly like their counterparts in views.py, but use the async
+ORM, session and cache APIs, queue mail with asend_mail() and await the
+hashing pool, so a login that spends hundreds of milliseconds in the KDF
+does not hold up the event loop. What has no async API (keyset pagination,
+the FTS5 search, password history) runs through sync_to_async.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Q
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.html import escape
+
+from . import resetcodes
+from .clientcache import aclient_list_fragment, aget_clients_version, dashboard_etag
+from .executor import ahash_password, averify_password
+from .mailqueue import asend_mail
+from .models import Client, User
+from .pagination import keyset_paginate
+from .policy import get_policy
+from .resetcodes import acheck_reset_code, astore_reset_code
+from .search import search_clients
+from .throttle import get_login_throttle
+from .usercache import aget_session_user, alogin_session, invalidate_user
+from .utils import add_password_history, check_password_rules, is_valid_email, password_needs_rehash
+from .views import generate_sha1_code, sha1_hex
+
+acheck_password_rules = sync_to_async(check_password_rules)
+aadd_password_history = sync_to_async(add_password_history)
+akeyset_paginate = sync_to_async(keyset_paginate)
+asearch_clients = sync_to_async(search_clients)
+
+
+# LOGIN
+
+async def login_view(request):
+    GENERIC_LOGIN_ERROR = "Username or password is incorrect"
+
+    if request.method == "POST":
+        username = escape(request.POST.get("username", "").strip())
+        password = escape(request.POST.get("password", ""))
+
+        max_attempts = get_policy().max_failed_logins
+        throttle = get_login_throttle()
+
+        if throttle.ip_blocked(request):
+            messages.error(request, GENERIC_LOGIN_ERROR)
+            return redirect("login")
+
+        user = await User.objects.filter(username=username).afirst()
+
+        if not user:
+            throttle.register_failure(request, None)
+            messages.error(request, GENERIC_LOGIN_ERROR)
+            return redirect("login")
+
+        if user.is_locked:
+            messages.error(request, GENERIC_LOGIN_ERROR)
+            return redirect("login")
+
+        if not await averify_password(password, user.salt, user.password_hash):
+            # Failures are counted in the throttle; the row is only written on lock
+            failures = throttle.register_failure(request, username)
+            if failures >= max_attempts:
+                await User.objects.filter(pk=user.pk).aupdate(
+                    is_locked=True, failed_login_attempts=failures
+                )
+                invalidate_user(user.pk)
+
+            messages.error(request, GENERIC_LOGIN_ERROR)
+            return redirect("login")
+
+        throttle.reset(username)
+
+        # Upgrade the stored hash now, only over the hash just verified (see views.py)
+        if password_needs_rehash(user.password_hash):
+            password_hash, salt = await ahash_password(password)
+            await User.objects.filter(pk=user.pk, password_hash=user.password_hash).aupdate(
+                password_hash=password_hash, salt=salt
+            )
+            invalidate_user(user.pk)
+
+        # Failures are counted in the throttle; see views.py
+        if user.failed_login_attempts:
+            await User.objects.filter(pk=user.pk).aupdate(failed_login_attempts=0)
+
+        await alogin_session(request, user.pk, username)
+        return redirect("dashboard")
+
+    return render(request, "login.html")
+
+
+# REGISTER
+
+async def register_view(request):
+    if request.method == "POST":
+        username = escape(request.POST.get("username"))
+        email = escape(request.POST.get("email"))
+        password = escape(request.POST.get("password"))
+        confirm = request.POST.get("confirm")
+
+        if password != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("register")
+
+        valid, msg = await acheck_password_rules(password)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("register")
+
+        if not is_valid_email(email):
+            messages.error(request, "Email is not valid")
+            return redirect("register")
+
+        if await User.objects.filter(Q(username=username) | Q(email=email)).aexists():
+            messages.error(request, "Username or email already used")
+            return redirect("register")
+
+        hashed, salt = await ahash_password(password)
+
+        user = await User.objects.acreate(
+            username=username,
+            email=email,
+            password_hash=hashed,
+            salt=salt
+        )
+
+        # Save password to history
+        await aadd_password_history(user, hashed, salt)
+
+        messages.success(request, "Registration successful")
+        return redirect("login")
+
+    return render(request, "register.html")
+
+
+# DASHBOARD
+
+async def dashboard_view(request):
+    user = await aget_session_user(request)
+    if user is None:
+        return redirect("login")
+
+    if request.method == "POST":
+        client_name = escape(request.POST.get("client_name", "").strip())
+        client_email = escape(request.POST.get("client_email", "").strip())
+        client_phone = escape(request.POST.get("client_phone", "").strip())
+
+        if not client_name:
+            messages.error(request, "Client name is required")
+            return redirect("dashboard")
+
+        if not is_valid_email(client_email):
+            messages.error(request, "Email is not valid")
+            return redirect("dashboard")
+
+        await Client.objects.acreate(
+            name=client_name,
+            email=client_email,
+            phone=client_phone,
+        )
+
+        messages.success(request, "Client added successfully")
+        return redirect("dashboard")
+
+    # A browser that already shows the current page gets a 304, before any query
+    version = await aget_clients_version()
+    etag = dashboard_etag(request, user, version)
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    query = request.GET.get("q", "").strip()
+    page_number = request.GET.get("page", "1")
+    page_number = int(page_number) if page_number.isdigit() else 1
+    cursor = request.GET.get("cursor")
+
+    async def render_page():
+        if query:
+            page = await asearch_clients(query, page_number=page_number, page_size=settings.DASHBOARD_PAGE_SIZE)
+        else:
+            page = await akeyset_paginate(Client.objects.all(), cursor=cursor, page_size=settings.DASHBOARD_PAGE_SIZE)
+        return render_to_string("client_list.html", {
+            "clients": page.object_list,
+            "page": page,
+            "q": query,
+        })
+
+    page_key = ("search", query, page_number) if query else ("list", cursor)
+    response = render(request, "dashboard.html", {
+        "username": user.username,
+        "client_list": await aclient_list_fragment(version, page_key, render_page),
+        "q": query,
+    })
+    if etag:
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+# LOGOUT
+
+async def logout_view(request):
+    await request.session.aflush()
+    return redirect("login")
+
+
+# FORGOT PASSWORD — SEND CODE
+
+async def forgot_password_view(request):
+    if request.method == "POST":
+        username = request.POST.get("username", "").strip()
+
+        user = await User.objects.filter(username=username).afirst()
+        if not user:
+            messages.error(request, "User not found")
+            return redirect("forgot_password")
+
+        code = generate_sha1_code()
+        code_hash = sha1_hex(code)
+
+        await astore_reset_code(username, code_hash)
+
+        # Send the plain code, store only the hash
+        await asend_mail(
+            subject="Password reset code",
+            message=f"Your verification code is: {code}",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[user.email],
+            fail_silently=False,
+        )
+
+        await request.session.aset("reset_username", username)
+        messages.success(request, "Code generated")
+        return redirect("verify")
+
+    return render(request, "forgot_password.html")
+
+
+# VERIFY CODE
+
+async def verify_code_view(request):
+    if request.method == "POST":
+        code_input = escape(request.POST.get("code", "").strip().upper())
+
+        username = await request.session.aget("reset_username")
+        if not username:
+            messages.error(request, "Please request a new code")
+            return redirect("forgot_password")
+
+        result = await acheck_reset_code(username, sha1_hex(code_input))
+        if result == resetcodes.MISSING:
+            messages.error(request, "Invalid request")
+            return redirect("forgot_password")
+
+        if result == resetcodes.EXPIRED:
+            messages.error(request, "The code has expired, please request a new one")
+            return redirect("forgot_password")
+
+        if result == resetcodes.TOO_MANY_ATTEMPTS:
+            messages.error(request, "Too many attempts, please request a new code")
+            return redirect("forgot_password")
+
+        if result == resetcodes.INCORRECT:
+            messages.error(request, "Incorrect code")
+            return redirect("verify")
+
+        await request.session.aset("reset_verified", True)
+        return redirect("reset_password")
+
+    return render(request, "verify.html")
+
+
+# RESET PASSWORD (AFTER FORGOT)
+
+async def reset_password_view(request):
+
+    if not await request.session.ahas_key("reset_username"):
+        if not await request.session.aget("reset_verified"):
+            messages.error(request, "Please verify the code first")
+            return redirect("verify")
+
+        return redirect("forgot_password")
+
+    username = await request.session.aget("reset_username")
+
+    if request.method == "POST":
+        password = escape(request.POST.get("password"))
+        confirm = escape(request.POST.get("confirm"))
+
+        if password != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("reset_password")
+
+        user = await User.objects.aget(username=username)
+
+        valid, msg = await acheck_password_rules(password, user=user)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("reset_password")
+
+        hashed, salt = await ahash_password(password)
+
+        await aadd_password_history(user, user.password_hash, user.salt)
+
+        user.password_hash = hashed
+        user.salt = salt
+        await user.asave(update_fields=["password_hash", "salt"])
+
+        await request.session.apop("reset_username", None)
+        await request.session.apop("reset_verified", None)
+        messages.success(request, "Password reset successfully")
+        return redirect("login")
+
+    return render(request, "reset_password.html")
+
+
+# CHANGE PASSWORD (LOGGED IN)
+
+async def change_password_view(request):
+    user = await aget_session_user(request)
+    if user is None:
+        return redirect("login")
+
+    if request.method == "POST":
+        old = escape(request.POST.get("old_password"))
+        new = escape(request.POST.get("new_password"))
+        confirm = escape(request.POST.get("confirm"))
+
+        if not await averify_password(old, user.salt, user.password_hash):
+            messages.error(request, "Incorrect, old password")
+            return redirect("change_password")
+
+        valid, msg = await acheck_password_rules(new, user=user)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("change_password")
+
+        if new != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("change_password")
+
+        hashed, salt = await ahash_password(new)
+        await aadd_password_history(user, user.password_hash, user.salt)
+
+        user.password_hash = hashed
+        user.salt = salt
+        await user.asave(update_fields=["password_hash", "salt"])
+
+        messages.success(request, "Password changed successfully")
+        return redirect("dashboard")
+
+    return render(request, "change_password.html")
@@ -0,0 +1,139 @@
+"""
+Cached client list for the dashboard.
+
+The rendered client list (one page of it, with its pagination links) is
+kept in the Django cache under a key that includes the current client list
+version. The version is the time of the change plus a random token.
+clients_changed() replaces it after
+the transaction that created clients commits:
+
+- ORM saves and deletes of a Client, through the post_save/post_delete
+  receiver connected in apps.py;
+- paths that bypass the signals (bulk_create in bulk.py, raw SQL INSERTs),
+  which call clients_changed() themselves.
+
+Fragments cached under an older version are simply never read again and
+expire after CLIENT_LIST_CACHE["TIMEOUT"] seconds. The version also goes
+into the dashboard's ETag, so a browser that already has the current page
+gets a 304 without the template being rendered or the database queried.
+With a read replica (replica.py), a page is only rendered from a copy taken
+after that time, so a lagging copy never ends up cached under the new
+version.
+
+With several worker processes, CLIENT_LIST_CACHE["CACHE"] must name a cache
+they share (see config/settings_production.py); with the default per-process
+LocMemCache, other workers would keep serving their cached list until it
+expires.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from . import replica
+
+DEFAULTS = {
+    "CACHE": "default",
+    "TIMEOUT": 300,  # seconds a rendered page of the list is kept
+}
+
+VERSION_KEY = "Communication_LTD:clients:version"
+FRAGMENT_KEY = "Communication_LTD:clients:{version}:{page}"
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "CLIENT_LIST_CACHE", {})}
+
+
+def new_version():
+    return f"{time.time():.6f}-{uuid.uuid4().hex}"
+
+
+def version_changed_at(version):
+    """When the client list changed to this version (epoch seconds), or None if unknown"""
+    try:
+        return float(version.split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+def _cache():
+    return caches[get_options()["CACHE"]]
+
+
+def get_clients_version():
+    """The current client list version token"""
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First request, or the key was evicted: any new token is safe
+        cache.add(VERSION_KEY, new_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_clients_version():
+    cache = _cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, new_version(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def clients_changed(using=None):
+    """Invalidate every cached page of the client list once the current transaction commits"""
+    transaction.on_commit(lambda: _cache().set(VERSION_KEY, new_version(), None), using=using)
+
+
+def clients_changed_on_save(sender, instance, using=None, **kwargs):
+    """post_save/post_delete receiver for Client (connected in apps.py)"""
+    clients_changed(using)
+
+
+def _fragment_key(version, page_key):
+    digest = hashlib.sha1(repr(page_key).encode()).hexdigest()
+    return FRAGMENT_KEY.format(version=version, page=digest)
+
+
+def client_list_fragment(version, page_key, render_page):
+    """The cached HTML for one page of the client list, rendered by render_page() on a miss"""
+    cache = _cache()
+    key = _fragment_key(version, page_key)
+    html = cache.get(key)
+    if html is None:
+        with replica.read_after(version_changed_at(version)):
+            html = str(render_page())
+        cache.set(key, html, get_options()["TIMEOUT"])
+    return mark_safe(html)
+
+
+async def aclient_list_fragment(version, page_key, arender_page):
+    """client_list_fragment() for async views; arender_page is awaited on a miss"""
+    cache = _cache()
+    key = _fragment_key(version, page_key)
+    html = await cache.aget(key)
+    if html is None:
+        with replica.read_after(version_changed_at(version)):
+            html = str(await arender_page())
+        await cache.aset(key, html, get_options()["TIMEOUT"])
+    return mark_safe(html)
+
+
+def dashboard_etag(request, user, version):
+    """ETag of the dashboard page as this user would see it, or None if it must be rendered"""
+    from django.contrib.messages import get_messages
+
+    # Pending flash messages are shown (and consumed) by the next render
+    if len(get_messages(request)):
+        return None
+    # The page embeds a CSRF token derived from the cookie
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+    if not csrf_cookie:
+        return None
+    parts = [version, str(user.pk), user.username, request.get_full_path(), csrf_cookie]
+    return '"%s"' % hashlib.sha1("\0".join(parts).encode()).hexdigest()
@@ -0,0 +1,148 @@
+"""
+Password hashers.
+
+Hashes are stored in User.password_hash as "<algorithm>$<params>$<hex digest>",
+for example "pbkdf2_sha256$iterations=600000$9f2c...". The per-user salt stays
+in User.salt. A bare 64-character hex digest (the original format) is read as
+the legacy single-pass HMAC-SHA256.
+
+The algorithm used for new hashes is settings.PASSWORD_HASHER and its cost
+parameters come from settings.PASSWORD_HASHER_PARAMS. Existing hashes keep
+verifying with the parameters recorded in them, and password_needs_rehash()
+tells the login view when to upgrade one.
+"""
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class BaseHasher:
+    algorithm = None
+    defaults = {}
+    # True when the digest is computed in C with the GIL released, so threads scale across cores
+    releases_gil = False
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown {self.algorithm} parameters: {', '.join(sorted(unknown))}")
+        self.params = {**self.defaults, **params}
+
+    def digest(self, password, salt):
+        raise NotImplementedError
+
+    def encode(self, password, salt):
+        params = ",".join(f"{key}={value}" for key, value in sorted(self.params.items()))
+        return f"{self.algorithm}${params}${self.digest(password, salt)}"
+
+    def verify(self, password, salt, encoded):
+        return hmac.compare_digest(self.encode(password, salt), encoded)
+
+    @classmethod
+    def from_encoded(cls, encoded):
+        """Build a hasher with the parameters recorded in an encoded hash"""
+        _, params, _ = encoded.split("$", 2)
+        values = dict(item.split("=", 1) for item in params.split(",") if item)
+        return cls(**{key: int(value) for key, value in values.items()})
+
+    @classmethod
+    def calibrate(cls, target_seconds):
+        """Return parameters that take about target_seconds per hash on this machine"""
+        return dict(cls.defaults)
+
+    def time_once(self, password="benchmark-Passw0rd!", salt="00" * 16):
+        started = time.perf_counter()
+        self.digest(password, salt)
+        return time.perf_counter() - started
+
+
+class HMACSHA256Hasher(BaseHasher):
+    """The original single HMAC-SHA256 pass, kept so existing hashes still verify"""
+
+    algorithm = "hmac_sha256"
+
+    def digest(self, password, salt):
+        return hmac.new(salt.encode(), password.encode(), hashlib.sha256).hexdigest()
+
+    def encode(self, password, salt):
+        # Stored without a prefix, exactly like hashes created before hashers existed
+        return self.digest(password, salt)
+
+    @classmethod
+    def from_encoded(cls, encoded):
+        return cls()
+
+
+class PBKDF2SHA256Hasher(BaseHasher):
+    algorithm = "pbkdf2_sha256"
+    defaults = {"iterations": 600000}
+    releases_gil = True
+
+    def digest(self, password, salt):
+        return hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt.encode(), self.params["iterations"]
+        ).hex()
+
+    @classmethod
+    def calibrate(cls, target_seconds):
+        iterations = 10000
+        # Cost is linear in iterations: measure, scale, then re-measure once to settle
+        for _ in range(2):
+            elapsed = min(cls(iterations=iterations).time_once() for _ in range(3))
+            iterations = max(1000, int(iterations * target_seconds / elapsed) // 1000 * 1000)
+        return {"iterations": iterations}
+
+
+class ScryptHasher(BaseHasher):
+    algorithm = "scrypt"
+    defaults = {"n": 2 ** 14, "r": 8, "p": 1}
+    releases_gil = True
+
+    def digest(self, password, salt):
+        n, r, p = self.params["n"], self.params["r"], self.params["p"]
+        return hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=128 * r * (n + p + 2) + 2 ** 20, dklen=32,
+        ).hex()
+
+    @classmethod
+    def calibrate(cls, target_seconds):
+        # n must be a power of two; take the largest one that stays within the target
+        n = 2 ** 10
+        while n < 2 ** 22:
+            elapsed = min(cls(n=n * 2).time_once() for _ in range(2))
+            if elapsed > target_seconds:
+                break
+            n *= 2
+        return {"n": n, "r": 8, "p": 1}
+
+
+HASHERS = {
+    hasher.algorithm: hasher
+    for hasher in (HMACSHA256Hasher, PBKDF2SHA256Hasher, ScryptHasher)
+}
+
+
+def get_hasher(algorithm=None):
+    """The configured hasher (or the named one) with parameters from settings"""
+    algorithm = algorithm or getattr(settings, "PASSWORD_HASHER", "hmac_sha256")
+    try:
+        hasher_class = HASHERS[algorithm]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown password hasher '{algorithm}'")
+    params = getattr(settings, "PASSWORD_HASHER_PARAMS", {}).get(algorithm, {})
+    return hasher_class(**params)
+
+
+def identify_hasher(encoded):
+    """The hasher that produced an encoded hash, with the parameters stored in it"""
+    if "$" not in encoded:
+        return HMACSHA256Hasher()
+    algorithm = encoded.split("$", 1)[0]
+    try:
+        return HASHERS[algorithm].from_encoded(encoded)
+    except (KeyError, ValueError, TypeError, ImproperlyConfigured):
+        raise ValueError(f"Unrecognized password hash format '{algorithm}'")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Communication_LTD.mailqueue import dispatch_due, get_options, mail_queue_stats, purge_finished_mail
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbound email (use with MAIL_QUEUE['DISPATCHER'] = 'command')"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="deliver what is due and exit")
+        parser.add_argument("--batch-size", type=int, help="override MAIL_QUEUE['BATCH_SIZE']")
+        parser.add_argument("--interval", type=float, help="seconds between polls (default POLL_INTERVAL)")
+
+    def handle(self, *args, **options):
+        queue_options = get_options()
+        if options["batch_size"]:
+            queue_options["BATCH_SIZE"] = options["batch_size"]
+        interval = options["interval"] or queue_options["POLL_INTERVAL"]
+
+        while True:
+            handled = dispatch_due(queue_options)
+            purge_finished_mail(max_batches=1, options=queue_options)
+            if handled or options["once"]:
+                stats = mail_queue_stats()
+                self.stdout.write(
+                    f"Handled {handled} email(s); {stats['pending']} pending, "
+                    f"{stats['failed']} failed permanently"
+                )
+            if options["once"]:
+                return
+            close_old_connections()
+            time.sleep(interval)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from Communication_LTD.mailqueue import purge_finished_mail
+
+
+class Command(BaseCommand):
+    help = "Delete sent and failed outbound email older than MAIL_QUEUE['KEEP_FINISHED'] in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="rows per statement (default MAIL_QUEUE['PURGE_BATCH_SIZE'])")
+        parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        deleted = purge_finished_mail(options["batch_size"], options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} finished email(s)"))
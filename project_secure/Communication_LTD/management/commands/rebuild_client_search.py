@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from Communication_LTD.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the FTS5 client search index and refill it from the client table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if not install_search_index(options["database"], rebuild=True):
+            raise CommandError("FTS5 search is only available on SQLite builds with FTS5; "
+                               "the dashboard uses LIKE search instead")
+        self.stdout.write(self.style.SUCCESS("Client search index rebuilt"))
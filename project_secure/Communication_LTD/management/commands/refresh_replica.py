@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Communication_LTD.replica import get_options, is_configured, is_copy, refresh_replica
+
+
+class Command(BaseCommand):
+    help = "Copy the database into the read replica (use with READ_REPLICA['REFRESHER'] = 'command')"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="refresh once and exit")
+        parser.add_argument("--interval", type=float, help="seconds between refreshes (default REFRESH_INTERVAL)")
+
+    def handle(self, *args, **options):
+        replica_options = get_options()
+        if not is_configured(replica_options):
+            raise CommandError(f"There is no {replica_options['ALIAS']!r} database in DATABASES")
+        if not is_copy(replica_options):
+            self.stdout.write("The replica reads the primary's own file; nothing to refresh")
+            return
+        interval = options["interval"] or replica_options["REFRESH_INTERVAL"]
+
+        while True:
+            try:
+                seconds = refresh_replica(replica_options)
+            except (sqlite3.Error, OSError) as exc:
+                if options["once"]:
+                    raise CommandError(f"Replica refresh failed: {exc}")
+                self.stderr.write(f"Replica refresh failed: {exc}")
+            else:
+                if options["once"]:
+                    self.stdout.write(f"Replica refreshed in {seconds * 1000:.1f} ms")
+                    return
+            time.sleep(interval)
@@ -0,0 +1,148 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter under -X importtime: boots the WSGI application
+# exactly like config/wsgi.py and serves two requests to it.
+CHILD = """
+import io, json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+booted = time.perf_counter()
+
+def request(path):
+    status = []
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+        "REMOTE_ADDR": "127.0.0.1", "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    began = time.perf_counter()
+    response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    for _ in response:
+        pass
+    if hasattr(response, "close"):
+        response.close()
+    return time.perf_counter() - began, status[0]
+
+first, status = request(sys.argv[1])
+second, _ = request(sys.argv[1])
+from Communication_LTD import warmup
+print(json.dumps({
+    "boot": booted - started, "first_request": first, "second_request": second,
+    "status": status, "warm_up": warmup.timings,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self seconds, cumulative seconds) for every line of -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Measure worker start-up: per-module import time and time to the first request"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/", help="URL requested after boot (default /)")
+        parser.add_argument("--runs", type=int, default=3, help="fresh processes to start (default 3)")
+        parser.add_argument("--top", type=int, default=20, help="slowest modules and packages to list")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be positive")
+
+        settings_module = os.environ.get("DJANGO_SETTINGS_MODULE")
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings_module}
+        cwd = str(settings.BASE_DIR)
+
+        runs = []
+        imports = defaultdict(list)
+        for _ in range(options["runs"]):
+            completed = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", CHILD, options["path"]],
+                capture_output=True, text=True, env=env, cwd=cwd,
+            )
+            if completed.returncode:
+                raise CommandError(f"Start-up run failed:\n{completed.stderr[-2000:]}")
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            for name, self_seconds, cumulative in parse_importtime(completed.stderr):
+                imports[name].append((self_seconds, cumulative))
+
+        # Median over the runs, per module
+        modules = {
+            name: (statistics.median(s for s, _ in samples), statistics.median(c for _, c in samples))
+            for name, samples in imports.items()
+        }
+        packages = defaultdict(float)
+        for name, (self_seconds, _) in modules.items():
+            packages[name.split(".")[0]] += self_seconds
+
+        report = {
+            "settings": settings_module,
+            "path": options["path"],
+            "status": runs[-1]["status"],
+            "runs": len(runs),
+            "modules_imported": len(modules),
+            "import_seconds": sum(self_seconds for self_seconds, _ in modules.values()),
+            "boot_seconds": statistics.median(run["boot"] for run in runs),
+            "first_request_seconds": statistics.median(run["first_request"] for run in runs),
+            "second_request_seconds": statistics.median(run["second_request"] for run in runs),
+            "warm_up": {
+                step: statistics.median(run["warm_up"].get(step, 0.0) for run in runs)
+                for step in runs[-1]["warm_up"]
+            },
+            "slowest_modules": [
+                {"module": name, "self": self_seconds, "cumulative": cumulative}
+                for name, (self_seconds, cumulative)
+                in sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:options["top"]]
+            ],
+            "slowest_packages": [
+                {"package": name, "self": total}
+                for name, total in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options["top"]]
+            ],
+        }
+        report["time_to_first_request_seconds"] = report["boot_seconds"] + report["first_request_seconds"]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self._print(report)
+
+    def _print(self, report):
+        ms = 1000
+        self.stdout.write(f"Settings {report['settings']}, GET {report['path']} -> {report['status']} "
+                          f"(median of {report['runs']} runs)\n")
+        self.stdout.write(f"  boot (imports + django.setup)  {report['boot_seconds'] * ms:9.1f} ms")
+        self.stdout.write(f"  first request                  {report['first_request_seconds'] * ms:9.1f} ms")
+        self.stdout.write(f"  time to first request          {report['time_to_first_request_seconds'] * ms:9.1f} ms")
+        self.stdout.write(f"  second request                 {report['second_request_seconds'] * ms:9.1f} ms")
+        self.stdout.write(f"  {report['modules_imported']} modules imported in {report['import_seconds'] * ms:.1f} ms")
+        for step, seconds in report["warm_up"].items():
+            self.stdout.write(f"  warm-up {step:<22} {seconds * ms:9.1f} ms")
+
+        self.stdout.write(f"\n{'package':<40}{'self ms':>10}")
+        for entry in report["slowest_packages"]:
+            self.stdout.write(f"{entry['package']:<40}{entry['self'] * ms:>10.1f}")
+
+        self.stdout.write(f"\n{'module':<56}{'self ms':>10}{'cumul ms':>10}")
+        for entry in report["slowest_modules"]:
+            self.stdout.write(f"{entry['module'][:55]:<56}{entry['self'] * ms:>10.1f}{entry['cumulative'] * ms:>10.1f}")
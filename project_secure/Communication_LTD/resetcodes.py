@@ -0,0 +1,121 @@
+"""
+Password reset codes with an expiry time and an attempt limit.
+
+A code is valid for RESET_CODES["TTL"] seconds after it was issued and
+allows RESET_CODES["MAX_ATTEMPTS"] wrong guesses. A correct guess consumes
+it. Requesting a new code replaces the old one and starts both counters
+again.
+
+Expired rows are removed by `manage.py purge_reset_codes`, which deletes
+them in small batches (one DELETE each) so it never holds SQLite's write
+lock for long; run it periodically, e.g. from cron.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from .models import ResetCode
+
+DEFAULTS = {
+    "TTL": 900,
+    "MAX_ATTEMPTS": 5,
+    "PURGE_BATCH_SIZE": 500,
+}
+
+VALID = "valid"
+INCORRECT = "incorrect"
+EXPIRED = "expired"
+TOO_MANY_ATTEMPTS = "too_many_attempts"
+MISSING = "missing"
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "RESET_CODES", {})}
+
+
+def expiry_cutoff(options=None):
+    """Codes created before this moment have expired"""
+    options = options or get_options()
+    return timezone.now() - timedelta(seconds=options["TTL"])
+
+
+def store_reset_code(username, code_hash):
+    """Issue a new code for username, replacing any previous one"""
+    ResetCode.objects.update_or_create(
+        username=username,
+        defaults={"code_hash": code_hash, "created_at": timezone.now(), "attempts": 0},
+    )
+
+
+def check_reset_code(username, code_hash):
+    """Check a guess and return VALID, INCORRECT, EXPIRED, TOO_MANY_ATTEMPTS or MISSING"""
+    options = get_options()
+    reset_code = ResetCode.objects.filter(username=username).first()
+    if reset_code is None:
+        return MISSING
+    if reset_code.created_at < expiry_cutoff(options):
+        reset_code.delete()
+        return EXPIRED
+    if reset_code.attempts >= options["MAX_ATTEMPTS"]:
+        return TOO_MANY_ATTEMPTS
+
+    if code_hash != reset_code.code_hash:
+        # Conditional update, so concurrent guesses cannot exceed the limit
+        counted = ResetCode.objects.filter(
+            pk=reset_code.pk, attempts__lt=options["MAX_ATTEMPTS"]
+        ).update(attempts=F("attempts") + 1)
+        return INCORRECT if counted else TOO_MANY_ATTEMPTS
+
+    # Single use: a correct code is consumed; only one concurrent request wins
+    deleted, _ = ResetCode.objects.filter(pk=reset_code.pk, code_hash=code_hash).delete()
+    return VALID if deleted else MISSING
+
+
+async def astore_reset_code(username, code_hash):
+    await ResetCode.objects.aupdate_or_create(
+        username=username,
+        defaults={"code_hash": code_hash, "created_at": timezone.now(), "attempts": 0},
+    )
+
+
+async def acheck_reset_code(username, code_hash):
+    options = get_options()
+    reset_code = await ResetCode.objects.filter(username=username).afirst()
+    if reset_code is None:
+        return MISSING
+    if reset_code.created_at < expiry_cutoff(options):
+        await reset_code.adelete()
+        return EXPIRED
+    if reset_code.attempts >= options["MAX_ATTEMPTS"]:
+        return TOO_MANY_ATTEMPTS
+
+    if code_hash != reset_code.code_hash:
+        counted = await ResetCode.objects.filter(
+            pk=reset_code.pk, attempts__lt=options["MAX_ATTEMPTS"]
+        ).aupdate(attempts=F("attempts") + 1)
+        return INCORRECT if counted else TOO_MANY_ATTEMPTS
+
+    deleted, _ = await ResetCode.objects.filter(pk=reset_code.pk, code_hash=code_hash).adelete()
+    return VALID if deleted else MISSING
+
+
+def purge_expired_reset_codes(batch_size=None, pause=0.0):
+    """Delete expired codes batch by batch; return how many were deleted"""
+    options = get_options()
+    batch_size = batch_size or options["PURGE_BATCH_SIZE"]
+    expired = ResetCode.objects.filter(created_at__lt=expiry_cutoff(options)).order_by("created_at")
+    deleted = 0
+    while True:
+        # One statement per batch: a SELECT then a DELETE in one transaction
+        # would have to upgrade SQLite's read lock, which fails at once when
+        # another connection is writing
+        count, _ = ResetCode.objects.filter(id__in=Subquery(expired.values("id")[:batch_size])).delete()
+        deleted += count
+        if count < batch_size:
+            return deleted
+        if pause:
+            # Let waiting writers in between batches
+            time.sleep(pause)
@@ -0,0 +1,147 @@
+"""
+Client search for the dashboard.
+
+On SQLite, an FTS5 virtual table (Communication_LTD_client_fts) mirrors the
+name, email and phone columns of Communication_LTD_client as an external
+content index. Triggers on the client table keep it in sync, including rows
+inserted with raw SQL. Queries are prefix matches on every word, ranked by
+bm25 and paginated with LIMIT/OFFSET over the (small) result set.
+
+The table and triggers are created after `migrate` (see apps.py), because
+migrations are not kept in the repository. `manage.py rebuild_client_search`
+recreates and refills them.
+
+Other database backends, or an SQLite build without FTS5, fall back to a
+case-insensitive substring match through the ORM.
+"""
+import logging
+import re
+
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+
+from .models import Client
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "Communication_LTD_client_fts"
+CLIENT_TABLE = Client._meta.db_table
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, email, phone,
+        content='{CLIENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {CLIENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, email, phone)
+        VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {CLIENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, phone)
+        VALUES ('delete', old.id, old.name, old.email, old.phone);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {CLIENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, phone)
+        VALUES ('delete', old.id, old.name, old.email, old.phone);
+        INSERT INTO {FTS_TABLE}(rowid, name, email, phone)
+        VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+_fts_available = {}
+
+
+def fts_enabled(using="default"):
+    """True if the client search index exists on this database"""
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    if using not in _fts_available:
+        _fts_available[using] = FTS_TABLE in conn.introspection.table_names()
+    return _fts_available[using]
+
+
+def install_search_index(using="default", rebuild=False):
+    """Create the FTS5 table and triggers; with rebuild, drop and refill them"""
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    try:
+        with conn.cursor() as cursor:
+            if rebuild:
+                for statement in DROP_STATEMENTS:
+                    cursor.execute(statement)
+            for statement in CREATE_STATEMENTS:
+                cursor.execute(statement)
+            if rebuild:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except DatabaseError:
+        logger.exception("Could not create the FTS5 client search index; using LIKE search")
+        _fts_available[using] = False
+        return False
+    _fts_available[using] = True
+    return True
+
+
+def install_search_index_after_migrate(sender, using="default", **kwargs):
+    """post_migrate receiver (connected in apps.py)"""
+    if CLIENT_TABLE in connections[using].introspection.table_names():
+        install_search_index(using)
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchResults:
+    def __init__(self, object_list, page_number, has_next):
+        self.object_list = object_list
+        self.number = page_number
+        self.has_next = has_next
+        self.has_previous = page_number > 1
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def search_clients(text, page_number=1, page_size=50):
+    """Ranked, paginated client search"""
+    page_number = max(1, page_number)
+    offset = (page_number - 1) * page_size
+
+    if fts_enabled():
+        match = build_match_query(text)
+        if not match:
+            return SearchResults([], page_number, False)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY rank LIMIT %s OFFSET %s",
+                [match, page_size + 1, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        by_id = Client.objects.in_bulk(ids[:page_size])
+        rows = [by_id[pk] for pk in ids[:page_size] if pk in by_id]
+        return SearchResults(rows, page_number, len(ids) > page_size)
+
+    text = text.strip()
+    if not text:
+        return SearchResults([], page_number, False)
+    queryset = Client.objects.filter(
+        Q(name__icontains=text) | Q(email__icontains=text) | Q(phone__icontains=text)
+    ).order_by("id")
+    rows = list(queryset[offset:offset + page_size + 1])
+    return SearchResults(rows[:page_size], page_number, len(rows) > page_size)
@@ -0,0 +1,11 @@
+from django import template
+
+from Communication_LTD import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def inline_css(name):
+    """{% inline_css 'allforms.css' %}: the stylesheet in a <style> element (see Communication_LTD/assets.py)"""
+    return assets.inline_css(name)
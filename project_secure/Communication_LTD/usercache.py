@@ -0,0 +1,222 @@
+"""
+The logged-in user, without a database query on every request.
+
+At login the views store the user's id in the session next to the username.
+get_session_user() resolves that id through a small per-process LRU cache.
+Entries expire after USER_CACHE["TTL"] seconds and are dropped right away
+when this process changes the row: a password change or reset (post_save,
+connected in apps.py) or locking the account (the views call
+invalidate_user(), because they lock with a queryset update()).
+
+Other worker processes notice such a change only after TTL seconds, so keep
+it short. Combined with a session engine that does not touch the database
+either (see config/settings_production.py), authenticated page views need
+no query to find out who the user is.
+
+With a read replica (replica.py) the row is read from it; an id it does not
+know yet (a user created moments ago) is looked up again on the primary.
+A copy taken before the row was invalidated would bring the old row back
+(an account locked by another client would keep working), so after an
+invalidation the row is only read from a copy refreshed since, otherwise
+from the primary, until no copy that old can be used any more (MAX_LAG).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from . import replica
+from .models import User
+
+DEFAULTS = {
+    "TTL": 30,  # seconds
+    "MAX_ENTRIES": 10000,
+}
+
+
+class UserCache:
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # user id -> (expires, User)
+        self._invalidated = OrderedDict()  # user id -> time.time() of the last invalidation
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """A private copy of the User with this id, or None if there is no such user"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return copy.copy(entry[1])
+            self.misses += 1
+            invalidated = self._invalidated.get(user_id)
+
+        started = time.time()
+        with self._reading(invalidated):
+            user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            # A user created moments ago may not be in the read replica yet
+            user = User.objects.using(replica.primary_alias()).filter(pk=user_id).first()
+        if user is not None:
+            self._put_read(user, started)
+        return user
+
+    async def aget(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return copy.copy(entry[1])
+            self.misses += 1
+            invalidated = self._invalidated.get(user_id)
+
+        started = time.time()
+        with self._reading(invalidated):
+            user = await User.objects.filter(pk=user_id).afirst()
+        if user is None:
+            user = await User.objects.using(replica.primary_alias()).filter(pk=user_id).afirst()
+        if user is not None:
+            self._put_read(user, started)
+        return user
+
+    def _reading(self, invalidated):
+        """Routing for a cache miss: only a replica copy refreshed after the last invalidation will do"""
+        if invalidated is None:
+            return replica.use_primary(pin=False)
+        return replica.read_after(invalidated)
+
+    def _put_read(self, user, started):
+        """Cache a row read since started, unless it was invalidated while the read ran"""
+        with self._lock:
+            invalidated = self._invalidated.get(user.pk)
+        if invalidated is None or invalidated < started:
+            self.put(user)
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.pk] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        now = time.time()
+        options = replica.get_options()
+        # Remember it only while a replica copy taken before now may still be read
+        remember = replica.is_configured(options) and replica.is_copy(options)
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+            if remember:
+                self._invalidated.pop(user_id, None)
+                self._invalidated[user_id] = now
+            # The oldest first: drop the ones no usable copy predates
+            horizon = now - options["MAX_LAG"]
+            while self._invalidated and next(iter(self._invalidated.values())) < horizon:
+                self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = {**DEFAULTS, **getattr(settings, "USER_CACHE", {})}
+                _cache = UserCache(options["TTL"], options["MAX_ENTRIES"])
+    return _cache
+
+
+def login_session(request, user_id, username):
+    """Remember the logged-in user in the session"""
+    request.session["user_id"] = user_id
+    request.session["username"] = username
+
+
+async def alogin_session(request, user_id, username):
+    await request.session.aset("user_id", user_id)
+    await request.session.aset("username", username)
+
+
+def get_session_user(request):
+    """The logged-in User, or None if there is none or the account is locked"""
+    user_id = request.session.get("user_id")
+    if user_id is None:
+        # Sessions created before user_id was stored only carry the username
+        username = request.session.get("username")
+        if username is None:
+            return None
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            return None
+        request.session["user_id"] = user.pk
+        _get_cache().put(user)
+    else:
+        user = _get_cache().get(user_id)
+    if user is None or user.is_locked:
+        return None
+    return user
+
+
+async def aget_session_user(request):
+    user_id = await request.session.aget("user_id")
+    if user_id is None:
+        username = await request.session.aget("username")
+        if username is None:
+            return None
+        user = await User.objects.filter(username=username).afirst()
+        if user is None:
+            return None
+        await request.session.aset("user_id", user.pk)
+        _get_cache().put(user)
+    else:
+        user = await _get_cache().aget(user_id)
+    if user is None or user.is_locked:
+        return None
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget the cached row after it was changed"""
+    cache = _get_cache()
+    cache.invalidate(user_id)
+    if transaction.get_connection(replica.primary_alias()).in_atomic_block:
+        # A read before the commit still saw the old row: forget it again then
+        transaction.on_commit(lambda: cache.invalidate(user_id), using=replica.primary_alias())
+
+
+def invalidate_user_on_change(sender, instance, **kwargs):
+    """post_save/post_delete receiver for User (connected in apps.py)"""
+    invalidate_user(instance.pk)
+
+
+def user_cache_stats():
+    """Hit/miss/invalidation counters of the process-wide user cache"""
+    return _get_cache().stats()
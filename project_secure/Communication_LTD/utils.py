@@ -1,18 +1,29 @@
 import hashlib
-import hmac
 import os
-import json
+import re
 from django.conf import settings
+from . import audit
+from .dictionary import is_common_password
+from .hashers import get_hasher, identify_hasher
+from .metrics import timed_hash
+from .policy import get_policy
+
+EMAIL_RE = re.compile(r'[a-zA-Z0-9]+@[a-zA-Z0-9]+.[a-zA-Z]{2,}$')
+
+
+def is_valid_email(email):
+    """Email rule used by the register and dashboard forms"""
+    return bool(EMAIL_RE.match(email or ""))
+
 
 def load_password_rules():
-    config_path = settings.BASE_DIR / "passwordConfig.json"
-    with open(config_path, "r") as f:
-        return json.load(f)
+    """Current password rules as a plain dict (see policy.get_policy())"""
+    return get_policy().as_dict()
 
 
 def load_common_passwords():
     """Load common passwords dictionary from file"""
-    dict_path = settings.BASE_DIR / "common_passwords.txt"
+    dict_path = settings.COMMON_PASSWORDS_FILE
     try:
         with open(dict_path, "r") as f:
             return [line.strip().lower() for line in f if line.strip()]
@@ -20,67 +31,117 @@ def load_common_passwords():
         return []
 
 
+def password_rule_message(failures, policy=None):
+    """The error shown for the first rule in an audit failure bitmask, or None if there is none"""
+    policy = policy or get_policy()
+
+    if failures & audit.TOO_SHORT:
+        return f"Password must be at least {policy.min_length} characters"
+
+    if failures & audit.NO_UPPERCASE:
+        return "Password must include uppercase letter"
+
+    if failures & audit.NO_LOWERCASE:
+        return "Password must include lowercase letter"
+
+    if failures & audit.NO_DIGIT:
+        return "Password must include a digit"
+
+    if failures & audit.NO_SPECIAL:
+        return "Password must include special character"
+
+    if failures & audit.COMMON:
+        return "Password is too common. Please choose a stronger password"
+
+    return None
+
+
 def check_password_rules(password, user=None):
     """
     Validate password against rules in passwordConfig.json
     Also checks password history and common passwords dictionary
     """
-    rules = load_password_rules()
+    policy = get_policy()
     
 
-    # Check length
-    if len(password) < rules["min_length"]:
-        return False, f"Password must be at least {rules['min_length']} characters"
-
-    # Check complexity
-    if rules["complexity"]["uppercase"] and not any(c.isupper() for c in password):
-        return False, "Password must include uppercase letter"
-
-    if rules["complexity"]["lowercase"] and not any(c.islower() for c in password):
-        return False, "Password must include lowercase letter"
-
-    if rules["complexity"]["digits"] and not any(c.isdigit() for c in password):
-        return False, "Password must include a digit"
-
-    special_chars = "!@#$%^&*()-_=+{}[]"
-    if rules["complexity"]["special"] and not any(c in special_chars for c in password):
-        return False, "Password must include special character"
+    # Length and complexity, with the same tables as the bulk audit (audit.py)
+    failures = audit.rule_failures(password, policy)
 
     # Check against common passwords dictionary
-    common_passwords = load_common_passwords()
-    if password.lower() in common_passwords:
-        return False, "Password is too common. Please choose a stronger password"
+    if not failures and is_common_password(password):
+        failures = audit.COMMON
+
+    message = password_rule_message(failures, policy)
+    if message:
+        return False, message
 
     # Check password history (prevent reuse of last N passwords)
-    if user and rules.get("prevent_reuse", False):
+    if user and policy.prevent_reuse:
+        from .executor import offload_verify_any
         from .models import PasswordHistory
-        history_count = rules.get("history_count", 3)
+        history_count = policy.history_count
 
-        # Get last N password hashes
+        # One indexed query for the last N (salt, hash) pairs
         previous_passwords = PasswordHistory.objects.filter(
             user=user
-        ).order_by('-created_at')[:history_count]
+        ).order_by('-created_at', '-id').values_list('salt', 'password_hash')[:history_count]
 
-        # Check if new password matches any previous passwords
-        for prev in previous_passwords:
-            prev_hash, _ = hash_password(password, prev.salt)
-            if prev_hash == prev.password_hash:
-                return False, f"Password was used recently. Cannot reuse last {history_count} passwords"
+        # Hashed in parallel in the hashing pool
+        if offload_verify_any(password, previous_passwords):
+            return False, f"Password was used recently. Cannot reuse last {history_count} passwords"
 
     return True, "OK"
 
 
-def hash_password(password, salt=None):
+def hash_password(password, salt=None, encoded=None):
+    """
+    Hash a password with the configured hasher (settings.PASSWORD_HASHER).
+    A random salt is generated unless one is given. Passing an existing
+    encoded hash reuses its algorithm and parameters instead, so the result
+    can be compared with it directly.
+    """
     if salt is None:
         salt = os.urandom(16).hex()
 
-    hashed = hmac.new(
-        salt.encode(),
-        password.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    hasher = identify_hasher(encoded) if encoded else get_hasher()
+    with timed_hash():
+        return hasher.encode(password, salt), salt
+
+
+def verify_password(password, salt, encoded):
+    """Check a password against a stored hash in any supported format"""
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    with timed_hash():
+        return hasher.verify(password, salt, encoded)
+
 
-    return hashed, salt
+def password_needs_rehash(encoded):
+    """True if the stored hash was not made with the current hasher and parameters"""
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True
+    current = get_hasher()
+    return hasher.algorithm != current.algorithm or hasher.params != current.params
+
+
+def add_password_history(user, password_hash, salt):
+    """Record a password in the user's history and drop entries beyond history_count"""
+    from django.db import transaction
+    from .models import PasswordHistory
+
+    keep = get_policy().history_count
+    with transaction.atomic():
+        PasswordHistory.objects.create(user=user, password_hash=password_hash, salt=salt)
+        newest = list(
+            PasswordHistory.objects.filter(user=user)
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)[:keep]
+        )
+        PasswordHistory.objects.filter(user=user).exclude(id__in=newest).delete()
 
 
 def hash_code(code):
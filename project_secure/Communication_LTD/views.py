@@ -1,9 +1,23 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from django.db.models import Q
-from .models import User, Client, ResetCode, PasswordHistory
-from .utils import check_password_rules, hash_password, hash_code, load_password_rules
+from .bulk import detect_format, import_clients, iter_csv_export, iter_ndjson_export, iter_rows
+from . import resetcodes
+from .clientcache import client_list_fragment, dashboard_etag, get_clients_version
+from .models import User, Client
+from .pagination import keyset_paginate
+from .provisioning import provision_users, token_matches
+from .search import search_clients
+from .policy import get_policy
+from .resetcodes import check_reset_code, store_reset_code
+from .throttle import get_login_throttle
+from .executor import offload_hash_password, offload_verify_password
+from .usercache import get_session_user, invalidate_user, login_session
+from .utils import add_password_history, check_password_rules, hash_code, is_valid_email, password_needs_rehash
 import os
 import re
 import random
@@ -31,12 +45,17 @@ def login_view(request):
         username = escape(request.POST.get("username", "").strip())
         password = escape(request.POST.get("password", ""))
 
-        rules = load_password_rules()
-        max_attempts = rules.get("max_failed_logins", 3)
+        max_attempts = get_policy().max_failed_logins
+        throttle = get_login_throttle()
+
+        if throttle.ip_blocked(request):
+            messages.error(request, GENERIC_LOGIN_ERROR)
+            return redirect("login")
 
         user = User.objects.filter(username=username).first()
 
         if not user:
+            throttle.register_failure(request, None)
             messages.error(request, GENERIC_LOGIN_ERROR)
             return redirect("login")
 
@@ -44,21 +63,36 @@ def login_view(request):
             messages.error(request, GENERIC_LOGIN_ERROR)
             return redirect("login")
 
-        hashed, _ = hash_password(password, user.salt)
-
-        if hashed != user.password_hash:
-            user.failed_login_attempts += 1
-            if user.failed_login_attempts >= max_attempts:
-                user.is_locked = True
-            user.save()
+        if not offload_verify_password(password, user.salt, user.password_hash):
+            # Failures are counted in the throttle; the row is only written on lock
+            failures = throttle.register_failure(request, username)
+            if failures >= max_attempts:
+                User.objects.filter(pk=user.pk).update(
+                    is_locked=True, failed_login_attempts=failures
+                )
+                invalidate_user(user.pk)
 
             messages.error(request, GENERIC_LOGIN_ERROR)
             return redirect("login")
 
-        user.failed_login_attempts = 0
-        user.save()
+        throttle.reset(username)
+
+        # Upgrade the stored hash to the current hasher while we have the password.
+        # Written now, and only over the hash just verified, so it can never
+        # put an old password back over a change made in the meantime.
+        if password_needs_rehash(user.password_hash):
+            password_hash, salt = offload_hash_password(password)
+            User.objects.filter(pk=user.pk, password_hash=user.password_hash).update(
+                password_hash=password_hash, salt=salt
+            )
+            invalidate_user(user.pk)
 
-        request.session["username"] = username
+        # Failures are counted in the throttle; the column only needs clearing
+        # after a lock was lifted, so most logins write nothing here
+        if user.failed_login_attempts:
+            User.objects.filter(pk=user.pk).update(failed_login_attempts=0)
+
+        login_session(request, user.pk, username)
         return redirect("dashboard")
 
     return render(request, "login.html")
@@ -87,7 +121,7 @@ def register_view(request):
             messages.error(request, msg)
             return redirect("register")
         
-        if not((re.match(r'[a-zA-Z0-9]+@[a-zA-Z0-9]+.[a-zA-Z]{2,}$', email))):
+        if not is_valid_email(email):
             messages.error(request, "Email is not valid")
             return redirect("register")
 
@@ -95,7 +129,7 @@ def register_view(request):
             messages.error(request, "Username or email already used")
             return redirect("register")
 
-        hashed, salt = hash_password(password)
+        hashed, salt = offload_hash_password(password)
 
         user = User.objects.create(
             username=username,
@@ -105,11 +139,7 @@ def register_view(request):
         )
 
         # Save password to history
-        PasswordHistory.objects.create(
-            user=user,
-            password_hash=hashed,
-            salt=salt
-        )
+        add_password_history(user, hashed, salt)
 
         messages.success(request, "Registration successful")
         return redirect("login")
@@ -121,12 +151,10 @@ def register_view(request):
 # DASHBOARD
 
 def dashboard_view(request):
-    if "username" not in request.session:
+    user = get_session_user(request)
+    if user is None:
         return redirect("login")
 
-    username = request.session["username"]
-    user = User.objects.get(username=username)
-
     if request.method == "POST":
         client_name = request.POST.get("client_name", "").strip()
         client_name = escape(client_name)
@@ -139,7 +167,7 @@ def dashboard_view(request):
             messages.error(request, "Client name is required")
             return redirect("dashboard")
         
-        if not((re.match(r'[a-zA-Z0-9]+@[a-zA-Z0-9]+.[a-zA-Z]{2,}$', client_email))):
+        if not is_valid_email(client_email):
             messages.error(request, "Email is not valid")
             return redirect("dashboard")
 
@@ -153,12 +181,100 @@ def dashboard_view(request):
         messages.success(request, "Client added successfully")
         return redirect("dashboard")
 
-    clients = Client.objects.all() 
-
-    return render(request, "dashboard.html", {
+    # A browser that already shows the current page gets a 304, before any query
+    version = get_clients_version()
+    etag = dashboard_etag(request, user, version)
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    query = request.GET.get("q", "").strip()
+    page_number = request.GET.get("page", "1")
+    page_number = int(page_number) if page_number.isdigit() else 1
+    cursor = request.GET.get("cursor")
+
+    def render_page():
+        if query:
+            page = search_clients(query, page_number=page_number, page_size=settings.DASHBOARD_PAGE_SIZE)
+        else:
+            page = keyset_paginate(Client.objects.all(), cursor=cursor, page_size=settings.DASHBOARD_PAGE_SIZE)
+        return render_to_string("client_list.html", {
+            "clients": page.object_list,
+            "page": page,
+            "q": query,
+        })
+
+    page_key = ("search", query, page_number) if query else ("list", cursor)
+    response = render(request, "dashboard.html", {
         "username": user.username,
-        "clients": clients,
+        "client_list": client_list_fragment(version, page_key, render_page),
+        "q": query,
     })
+    if etag:
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+# BULK CLIENT IMPORT / EXPORT
+
+def clients_import_view(request):
+    if get_session_user(request) is None:
+        return redirect("login")
+
+    if request.method != "POST" or "file" not in request.FILES:
+        messages.error(request, "Choose a CSV or NDJSON file to import")
+        return redirect("dashboard")
+
+    upload = request.FILES["file"]
+    result = import_clients(
+        iter_rows(upload.file, detect_format(upload.name, request.POST.get("format"))),
+        batch_size=settings.CLIENT_IMPORT_BATCH_SIZE,
+        sanitize=escape,
+    )
+
+    if request.headers.get("Accept") == "application/json":
+        return JsonResponse(result.as_dict())
+
+    messages.success(request, f"Imported {result.created} clients ({result.rows_per_second:.0f} rows/s)")
+    if result.rejected:
+        first = result.errors[0]
+        messages.error(request, f"{result.rejected} rows rejected (line {first['line']}: {first['error']})")
+    return redirect("dashboard")
+
+
+def clients_export_view(request):
+    if get_session_user(request) is None:
+        return redirect("login")
+
+    chunk_size = settings.CLIENT_EXPORT_CHUNK_SIZE
+    if request.GET.get("format") == "ndjson":
+        response = StreamingHttpResponse(iter_ndjson_export(chunk_size), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="clients.ndjson"'
+    else:
+        response = StreamingHttpResponse(iter_csv_export(chunk_size), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="clients.csv"'
+    return response
+
+
+# BULK USER PROVISIONING (API, bearer token instead of a session)
+
+@csrf_exempt
+def users_provision_view(request):
+    if not token_matches(request):
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    if request.method != "POST" or "file" not in request.FILES:
+        return JsonResponse({"error": "POST a CSV or NDJSON user file as 'file'"}, status=400)
+
+    upload = request.FILES["file"]
+    result = provision_users(
+        iter_rows(upload.file, detect_format(upload.name, request.POST.get("format"))),
+        sanitize=escape,
+    )
+    return JsonResponse(result.as_dict())
 
 # LOGOUT
 
@@ -182,10 +298,7 @@ def forgot_password_view(request):
         code = generate_sha1_code()
         code_hash = sha1_hex(code)
 
-        ResetCode.objects.update_or_create(
-            username=username,
-            defaults={"code_hash": code_hash}
-        )
+        store_reset_code(username, code_hash)
 
         # Send the plain code, store only the hash
         send_mail(
@@ -219,12 +332,20 @@ def verify_code_view(request):
             messages.error(request, "Please request a new code")
             return redirect("forgot_password")
 
-        reset_obj = ResetCode.objects.filter(username=username).first()
-        if not reset_obj:
+        result = check_reset_code(username, sha1_hex(code_input))
+        if result == resetcodes.MISSING:
             messages.error(request, "Invalid request")
             return redirect("forgot_password")
 
-        if sha1_hex(code_input) != reset_obj.code_hash:
+        if result == resetcodes.EXPIRED:
+            messages.error(request, "The code has expired, please request a new one")
+            return redirect("forgot_password")
+
+        if result == resetcodes.TOO_MANY_ATTEMPTS:
+            messages.error(request, "Too many attempts, please request a new code")
+            return redirect("forgot_password")
+
+        if result == resetcodes.INCORRECT:
             messages.error(request, "Incorrect code")
             return redirect("verify")
 
@@ -269,17 +390,13 @@ def reset_password_view(request):
             messages.error(request, msg)
             return redirect("reset_password")
 
-        hashed, salt = hash_password(password)
+        hashed, salt = offload_hash_password(password)
 
-        PasswordHistory.objects.create(
-            user=user,
-            password_hash=user.password_hash,
-            salt=user.salt
-        )
+        add_password_history(user, user.password_hash, user.salt)
 
         user.password_hash = hashed
         user.salt = salt
-        user.save()
+        user.save(update_fields=["password_hash", "salt"])
 
         request.session.pop("reset_username", None)
         request.session.pop("reset_verified", None)
@@ -293,13 +410,10 @@ def reset_password_view(request):
 # CHANGE PASSWORD (LOGGED IN)
 
 def change_password_view(request):
-    if "username" not in request.session:
+    user = get_session_user(request)
+    if user is None:
         return redirect("login")
 
-    username = request.session["username"]
-    username = escape(username)
-    user = User.objects.get(username=username)
-
     if request.method == "POST":
         old = request.POST.get("old_password")
         old = escape(old)
@@ -308,12 +422,7 @@ def change_password_view(request):
         confirm = request.POST.get("confirm")
         confirm= escape(confirm)
 
-        # DEBUG 1
-        print("DEBUG USER:", username, "id:", user.id)
-        print("DEBUG BEFORE:", user.password_hash[:12], "salt:", str(user.salt)[:12])
-
-        hashed_old, _ = hash_password(old, user.salt)
-        if hashed_old != user.password_hash:
+        if not offload_verify_password(old, user.salt, user.password_hash):
             messages.error(request, "Incorrect, old password")
             return redirect("change_password")
 
@@ -326,20 +435,12 @@ def change_password_view(request):
             messages.error(request, "Passwords do not match")
             return redirect("change_password")
 
-        hashed, salt = hash_password(new)
-        PasswordHistory.objects.create(
-            user=user,
-            password_hash=user.password_hash,
-            salt=user.salt
-        )
+        hashed, salt = offload_hash_password(new)
+        add_password_history(user, user.password_hash, user.salt)
 
         user.password_hash = hashed
         user.salt = salt
-        user.save()
-
-        # DEBUG 2
-        user.refresh_from_db()
-        print("DEBUG AFTER:", user.password_hash[:12], "salt:", str(user.salt)[:12])
+        user.save(update_fields=["password_hash", "salt"])
 
         messages.success(request, "Password changed successfully")
         return redirect("dashboard")
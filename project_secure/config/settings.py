@@ -7,12 +7,150 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 
 # for the emails after forgot password
-EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# send_mail() only queues the message (Communication_LTD/mailqueue.py); the
+# dispatcher delivers it through MAIL_QUEUE["BACKEND"]
+EMAIL_BACKEND = "Communication_LTD.mailqueue.QueuedEmailBackend"
 EMAIL_FILE_PATH = BASE_DIR / "sent_emails"
 
+MAIL_QUEUE = {
+    "BACKEND": "django.core.mail.backends.filebased.EmailBackend",
+    "DISPATCHER": "thread",  # or "command": run `manage.py dispatch_mail` instead
+    "BATCH_SIZE": 100,
+    "MAX_ATTEMPTS": 6,
+    "RETRY_BACKOFF": 30,  # seconds before the first retry, doubled for each one after
+    "RETRY_BACKOFF_MAX": 3600,
+    "POLL_INTERVAL": 5,  # seconds; the dispatcher also wakes up on every new mail
+    # Sent and failed rows (their bodies are blanked at once) are deleted this
+    # many seconds later, PURGE_BATCH_SIZE per poll or by `manage.py purge_mail`
+    "KEEP_FINISHED": 7 * 24 * 60 * 60,
+    "PURGE_BATCH_SIZE": 500,
+}
+
+# Password reset codes (Communication_LTD/resetcodes.py): lifetime in seconds
+# and wrong guesses allowed per code. `manage.py purge_reset_codes` deletes
+# expired ones PURGE_BATCH_SIZE rows per DELETE.
+RESET_CODES = {
+    "TTL": 900,
+    "MAX_ATTEMPTS": 5,
+    "PURGE_BATCH_SIZE": 500,
+}
+
 DEFAULT_FROM_EMAIL = "no-reply@localhost"
 
 
+# Password policy, cached in memory and reloaded when the file changes
+# (see Communication_LTD/policy.py)
+PASSWORD_POLICY_FILE = BASE_DIR / "passwordConfig.json"
+PASSWORD_POLICY_CHECK_INTERVAL = 1.0  # seconds between mtime checks
+
+# Common-passwords dictionary; rebuild the index with `manage.py build_password_index`
+COMMON_PASSWORDS_FILE = BASE_DIR / "common_passwords.txt"
+COMMON_PASSWORDS_INDEX = BASE_DIR / "common_passwords.idx"
+
+# Password hashing (see Communication_LTD/hashers.py). Stored hashes made with
+# other algorithms or parameters are upgraded on the user's next login.
+# `manage.py benchmark_hashers` suggests parameters for this machine.
+PASSWORD_HASHER = "pbkdf2_sha256"  # or "scrypt", "hmac_sha256" (legacy)
+PASSWORD_HASHER_PARAMS = {
+    "pbkdf2_sha256": {"iterations": 600000},
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+}
+
+# Clients shown per dashboard page (keyset pagination, see Communication_LTD/pagination.py)
+DASHBOARD_PAGE_SIZE = 50
+
+# Bulk client import/export (see Communication_LTD/bulk.py)
+CLIENT_IMPORT_BATCH_SIZE = 1000  # rows per bulk_create and per transaction
+CLIENT_EXPORT_CHUNK_SIZE = 2000  # rows fetched per database round trip
+
+# Pool that runs password hashing off the request thread / event loop
+# (see Communication_LTD/executor.py). KIND: "auto", "thread", "process" or
+# "inline". When WORKERS + MAX_QUEUE hashes are pending, requests get a 503.
+PASSWORD_HASHING_EXECUTOR = {
+    "KIND": "auto",
+    "WORKERS": None,  # defaults to the number of CPU cores
+    "MAX_QUEUE": 64,
+    "RETRY_AFTER": 1,  # seconds, sent in the Retry-After header
+}
+
+# Failed-login counters (see Communication_LTD/throttle.py). BACKEND: "locmem"
+# (one process), "shared" (mmap file shared by all workers on the host) or
+# "cache" (the Django cache). The User row is only written when it gets locked.
+LOGIN_THROTTLE = {
+    "BACKEND": "locmem",
+    "USER_WINDOW": 86400,  # failures within this many seconds count towards a lock
+    "IP_LIMIT": 20,  # failed attempts from one IP ...
+    "IP_WINDOW": 300,  # ... within this many seconds block that IP
+}
+
+# Per-process cache of the logged-in User (see Communication_LTD/usercache.py).
+# Other workers see a password change or lock after at most TTL seconds.
+USER_CACHE = {
+    "TTL": 30,
+    "MAX_ENTRIES": 10000,
+}
+
+# Rendered pages of the dashboard client list (see Communication_LTD/clientcache.py).
+# Use a cache shared by all worker processes when running more than one.
+CLIENT_LIST_CACHE = {
+    "CACHE": "default",
+    "TIMEOUT": 300,
+}
+
+# Bulk user provisioning (see Communication_LTD/provisioning.py). POOL: "process",
+# "thread" or "inline". POST /users/provision/ answers 401 until TOKEN is set.
+USER_PROVISIONING = {
+    "BATCH_SIZE": 500,  # users per bulk_create and per transaction
+    "POOL": "process",
+    "WORKERS": None,  # defaults to the number of CPU cores
+    "TOKEN": None,  # sent as "Authorization: Bearer <token>"
+}
+
+# Work done in AppConfig.ready() instead of on the first requests (see
+# Communication_LTD/warmup.py); config/settings_production.py turns it on.
+STARTUP_WARMUP = {
+    "ENABLED": False,
+    "TEMPLATES": None,  # template names to compile; None: all of the app's templates
+}
+
+# Collected static files (see Communication_LTD/assets.py); config/settings_production.py
+# fingerprints and gzips them at collectstatic time and turns SERVE on.
+STATIC_ASSETS = {
+    "SERVE": False,  # serve STATIC_ROOT from the application itself
+    "MAX_AGE": 365 * 24 * 60 * 60,  # seconds, for fingerprinted names (immutable)
+    "UNHASHED_MAX_AGE": 60,  # seconds, for everything else
+    "GZIP_EXTENSIONS": [".css", ".js", ".svg", ".txt", ".json", ".map", ".html"],
+    "GZIP_MIN_SIZE": 256,  # bytes
+}
+
+# Client and User reads from a read-only copy of the database (see
+# Communication_LTD/replica.py); config/settings_production.py adds the
+# "replica" database and the router. REFRESHER: "thread" or "command" (run
+# `manage.py refresh_replica` instead).
+READ_REPLICA = {
+    "ALIAS": "replica",
+    "PRIMARY": "default",
+    "MODELS": ["Communication_LTD.Client", "Communication_LTD.User"],
+    "MAX_LAG": 10,  # seconds; an older copy is not read
+    "REFRESHER": "thread",
+    "REFRESH_INTERVAL": 2,  # seconds between copies
+    "PIN_SECONDS": 10,  # a client that wrote reads from the primary this long
+    "PIN_COOKIE": "replica_pin",
+}
+
+# Sessions in the database through Communication_LTD/sessions.py: unchanged
+# sessions are not rewritten and expired ones are purged PURGE_BATCH_SIZE rows
+# at a time, by `manage.py clearsessions` and every PURGE_EVERY new sessions.
+# Flash messages live in a cookie. config/settings_production.py keeps the
+# whole session in a signed cookie instead.
+SESSION_ENGINE = "Communication_LTD.sessions"
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+SESSION_STORE = {
+    "PURGE_BATCH_SIZE": 200,
+    "PURGE_EVERY": 1000,
+}
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -39,6 +177,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timing covers the whole middleware stack
+    'Communication_LTD.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,8 +186,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Communication_LTD.executor.HashingBackpressureMiddleware',
 ]
 
+# /metrics (Communication_LTD/metrics.py) answers these addresses only;
+# an empty list allows everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# With a token /metrics also requires "Authorization: Bearer <token>";
+# None checks the address only
+METRICS_TOKEN = None
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -115,6 +263,7 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'Communication_LTD' / 'static',]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 
 # Default primary key field type
@@ -0,0 +1,50 @@
+"""
+Lean production profile, for workers that must start fast (autoscaling):
+
+    DJANGO_SETTINGS_MODULE=config.settings_lean gunicorn config.wsgi
+
+The production profile (settings_production.py) minus what this application
+never uses. Accounts are Communication_LTD.User and passwords are checked by
+utils.check_password_rules(), so django.contrib.auth, contenttypes and the
+admin (with their middleware, context processor and password validators)
+are only import and start-up cost. Translations are off, as there are none.
+
+Sessions, messages and staticfiles stay: the views use the first two.
+STARTUP_WARMUP (on in the production profile) compiles the templates and
+loads the views, password policy and dictionary while the worker boots
+(Communication_LTD/warmup.py).
+
+There is no /admin/ in this profile; run admin tasks with the regular
+settings. `manage.py startup_profile` compares the profiles.
+"""
+from .settings_production import *  # noqa: F401,F403
+
+UNUSED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+}
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in UNUSED_APPS]  # noqa: F405
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE  # noqa: F405
+    if middleware != 'django.contrib.auth.middleware.AuthenticationMiddleware'
+]
+
+TEMPLATES = [
+    {
+        **engine,
+        'OPTIONS': {
+            **engine['OPTIONS'],
+            'context_processors': [
+                processor for processor in engine['OPTIONS'].get('context_processors', [])
+                if processor != 'django.contrib.auth.context_processors.auth'
+            ],
+        },
+    }
+    for engine in TEMPLATES  # noqa: F405
+]
+
+AUTH_PASSWORD_VALIDATORS = []
+
+USE_I18N = False
@@ -0,0 +1,19 @@
+"""
+Production profile (settings_production.py) for the ASGI entry point:
+
+    gunicorn -c config/gunicorn_asgi.py
+
+Routes the account and dashboard views to their async variants, like
+settings_asgi.py does for the development settings.
+"""
+from .settings_production import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'config.asgi_urls'
+
+# Persistent connections are not reused across async requests (each request
+# gets its own connection in the sync_to_async thread), so they would only
+# pile up; close them at the end of every request instead.
+DATABASES = {
+    alias: {**database, 'CONN_MAX_AGE': 0}
+    for alias, database in DATABASES.items()  # noqa: F405
+}
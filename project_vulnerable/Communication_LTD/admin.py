@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Client
+from .models import Client, OutboundEmail
 
 # Register your models here.
 
@@ -8,3 +8,11 @@ class ClientAdmin(admin.ModelAdmin):
 
     list_display = ('name', 'email', 'phone')
     search_fields = ('name', 'email')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
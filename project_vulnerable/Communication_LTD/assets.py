@@ -0,0 +1,193 @@
+"""
+Fingerprinted, precompressed static files.
+
+The production profile stores static files with
+CompressedManifestStaticFilesStorage. `manage.py collectstatic` then writes
+every file to STATIC_ROOT twice, as collected and under a name that
+contains a hash of its content (allforms.css -> allforms.<hash>.css), with
+url() references inside CSS rewritten to the hashed names. Text files
+(STATIC_ASSETS["GZIP_EXTENSIONS"]) also get a gzipped copy next to them,
+compressed once at deploy time instead of on every request. {% static %}
+returns the hashed names.
+
+A hashed name changes whenever the content does, so serve_static() sends
+it with `Cache-Control: public, max-age=<a year>, immutable`: browsers
+never ask for it again. Other files get a short max-age and Last-Modified.
+Clients that accept gzip get the precompressed copy. With
+STATIC_ASSETS["SERVE"], config/urls.py routes STATIC_URL to serve_static(),
+so the application needs no separate static file server (runserver keeps
+serving the source files while DEBUG is on).
+
+inline_css() (the {% inline_css %} tag in templatetags/assets.py) puts a
+stylesheet into the page itself, so login.html and dashboard.html render
+without waiting for a stylesheet request.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.views.static import was_modified_since
+
+DEFAULTS = {
+    "SERVE": False,
+    "MAX_AGE": 365 * 24 * 60 * 60,  # seconds, for hashed names
+    "UNHASHED_MAX_AGE": 60,  # seconds, for everything else
+    "GZIP_EXTENSIONS": [".css", ".js", ".svg", ".txt", ".json", ".map", ".html"],
+    "GZIP_MIN_SIZE": 256,  # bytes; smaller files are not worth it
+}
+
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_SPACE_RE = re.compile(r"\s*([{};,])\s*")
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+_inline_cache = {}
+_hashed_names = None
+_hashed_names_lock = threading.Lock()
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "STATIC_ASSETS", {})}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes a .gz next to every compressible file"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception) and hashed_name:
+                names.extend((name, hashed_name))
+        if dry_run:
+            return
+        settings_options = get_options()
+        for name in dict.fromkeys(names):
+            compressed = self._compress(name, settings_options)
+            if compressed:
+                yield name, compressed, True
+
+    def _compress(self, name, options):
+        if os.path.splitext(name)[1].lower() not in options["GZIP_EXTENSIONS"]:
+            return None
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < options["GZIP_MIN_SIZE"]:
+            return None
+        # mtime=0: the same input always gives the same .gz
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return None
+        gz_name = name + ".gz"
+        if self.exists(gz_name):
+            self.delete(gz_name)
+        self._save(gz_name, ContentFile(compressed))
+        return gz_name
+
+
+def _is_hashed(path):
+    """True if path is a fingerprinted name from the staticfiles manifest"""
+    global _hashed_names
+    hashed_files = getattr(staticfiles_storage, "hashed_files", None)
+    if not hashed_files:
+        return False
+    if _hashed_names is None or _hashed_names[0] is not hashed_files:
+        with _hashed_names_lock:
+            _hashed_names = (hashed_files, frozenset(hashed_files.values()))
+    return path in _hashed_names[1]
+
+
+def serve_static(request, path):
+    """A file from STATIC_ROOT, precompressed if the client takes gzip, with far-future caching for hashed names"""
+    options = get_options()
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+    if path.endswith(".gz") or not os.path.isfile(full_path):
+        raise Http404(f"{path} not found")
+
+    immutable = _is_hashed(posixpath.normpath(path))
+    stat = os.stat(full_path)
+    if not immutable and not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    send_path, encoding = full_path, None
+    gz_path = full_path + ".gz"
+    compressible = os.path.isfile(gz_path)
+    if compressible and "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+        send_path, encoding = gz_path, "gzip"
+
+    response = FileResponse(open(send_path, "rb"), content_type=content_type or "application/octet-stream")
+    del response["Content-Disposition"]
+    if encoding:
+        response["Content-Encoding"] = encoding
+    if compressible:
+        response["Vary"] = "Accept-Encoding"
+    if immutable:
+        response["Cache-Control"] = f"public, max-age={options['MAX_AGE']}, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={options['UNHASHED_MAX_AGE']}"
+        response["Last-Modified"] = http_date(stat.st_mtime)
+    return response
+
+
+def static_urlpatterns():
+    """The URL pattern for serve_static(), if STATIC_ASSETS["SERVE"] is on"""
+    if not get_options()["SERVE"]:
+        return []
+    prefix = settings.STATIC_URL.lstrip("/")
+    return [re_path(rf"^{re.escape(prefix)}(?P<path>.+)$", serve_static, name="static")]
+
+
+def _read_stylesheet(name):
+    if not settings.DEBUG:
+        # The collected file, whose url()s point at hashed names
+        try:
+            stored = staticfiles_storage.stored_name(name) if hasattr(staticfiles_storage, "stored_name") else name
+            with staticfiles_storage.open(stored) as stylesheet:
+                return stylesheet.read().decode("utf-8"), staticfiles_storage.url(name)
+        except (ValueError, FileNotFoundError):
+            # Not collected (no manifest storage, or collectstatic never ran)
+            pass
+    # The source file, so edits show up without collectstatic
+    path = finders.find(name)
+    if path is None:
+        raise ValueError(f"Static file {name!r} not found")
+    with open(path, encoding="utf-8") as stylesheet:
+        return stylesheet.read(), settings.STATIC_URL + name
+
+
+def minify_css(css, base_url):
+    """Drop comments and whitespace; url()s relative to the stylesheet are made absolute"""
+    css = CSS_COMMENT_RE.sub("", css)
+    css = CSS_SPACE_RE.sub(r"\1", " ".join(css.split()))
+    css = CSS_URL_RE.sub(
+        lambda match: f"url({match.group(1)}{urljoin(base_url, match.group(2))}{match.group(1)})", css
+    )
+    return css.replace(";}", "}").replace("</", "<\\/")
+
+
+def inline_css(name):
+    """A <style> element with the minified stylesheet; cached per process unless DEBUG"""
+    html = _inline_cache.get(name)
+    if html is None:
+        css, base_url = _read_stylesheet(name)
+        html = mark_safe(f"<style>{minify_css(css, base_url)}</style>")
+        if not settings.DEBUG:
+            _inline_cache[name] = html
+    return html
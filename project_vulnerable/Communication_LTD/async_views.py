@@ -0,0 +1,400 @@
+"""
+Async variants of the account and dashboard views, served by the ASGI entry
+point (config/asgi.py -> config/asgi_urls.py).
+
+VULNERABLE VERSION: the raw SQL is the same as in views.py (repository.py,
+with the same SQL injection and stored XSS demos) and runs through
+sync_to_async. The rest uses
+the async ORM, session and cache APIs, mail is queued with asend_mail() and
+hashing is awaited in the hashing pool, so the event loop is never blocked.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+
+from . import resetcodes
+from .clientcache import (
+    aclient_list_fragment,
+    aget_clients_version,
+    clients_changed,
+    dashboard_etag,
+)
+from .executor import ahash_password, averify_password
+from .mailqueue import asend_mail
+from .models import Client, User
+from .pagination import keyset_paginate
+from .policy import get_policy
+from .repository import add_client, create_user, find_login, lock_user, user_exists
+from .resetcodes import acheck_reset_code, astore_reset_code
+from .search import search_clients
+from .throttle import get_login_throttle
+from .usercache import aget_session_user, alogin_session, invalidate_user
+from .utils import add_password_history, check_password_rules, password_needs_rehash
+from .views import generate_sha1_code, sha1_hex
+
+acheck_password_rules = sync_to_async(check_password_rules)
+aadd_password_history = sync_to_async(add_password_history)
+aclients_changed = sync_to_async(clients_changed)
+akeyset_paginate = sync_to_async(keyset_paginate)
+asearch_clients = sync_to_async(search_clients)
+afind_login = sync_to_async(find_login)
+alock_user = sync_to_async(lock_user)
+auser_exists = sync_to_async(user_exists)
+acreate_user = sync_to_async(create_user)
+aadd_client = sync_to_async(add_client)
+
+
+# LOGIN - VULNERABLE TO SQL INJECTION
+
+
+async def login_view(request):
+    if request.method == "POST":
+        username = request.POST.get("username")
+        password = request.POST.get("password")
+
+        throttle = get_login_throttle()
+        if throttle.ip_blocked(request):
+            messages.error(request, "Invalid username or password")
+            return redirect("login")
+
+        # One query: the user row and whether the password matches; the
+        # password is verified in the hashing pool from a sync_to_async thread
+        # VULNERABLE: SQL Injection - username and password check in one query
+        # This allows bypass with: admin' --
+        row = await afind_login(username, password)
+
+        if not row:
+            throttle.register_failure(request, None)
+            messages.error(request, "Invalid username or password")
+            return redirect("login")
+
+        max_attempts = get_policy().max_failed_logins
+
+        if not row.password_ok:
+            # Wrong password - count the failure for this user
+            # Failures are counted in the throttle; the row is only written on lock
+            failed_attempts = throttle.register_failure(request, username)
+            new_is_locked = failed_attempts >= max_attempts
+
+            if new_is_locked:
+                await alock_user(row.id, failed_attempts)
+                invalidate_user(row.id)
+
+            if new_is_locked:
+                messages.error(request, f"Account locked due to {max_attempts} failed login attempts. Contact administrator.")
+            else:
+                remaining = max_attempts - failed_attempts
+                messages.error(request, f"Invalid username or password. {remaining} attempts remaining.")
+
+            return redirect("login")
+
+        user_id, db_username, failed_attempts, is_locked, stored_hash = row[:5]
+
+        # Check if user is locked
+        if is_locked:
+            messages.error(
+                request,
+                f"Account locked due to {max_attempts} failed login attempts. Contact administrator.",
+            )
+            return redirect("login")
+
+        # Successful login - reset failed attempts
+        throttle.reset(db_username)
+        # Upgrade the stored hash now, only over the hash just verified and only
+        # after checking the password again, as the injection skips it (see views.py)
+        if password_needs_rehash(stored_hash) and await averify_password(password, row.salt, stored_hash):
+            password_hash, salt = await ahash_password(password)
+            await User.objects.filter(pk=user_id, password_hash=stored_hash).aupdate(
+                password_hash=password_hash, salt=salt
+            )
+            invalidate_user(user_id)
+
+        # Failures are counted in the throttle; see views.py
+        if failed_attempts:
+            await User.objects.filter(pk=user_id).aupdate(failed_login_attempts=0)
+
+        await alogin_session(request, user_id, db_username)
+        return redirect("dashboard")
+
+    return render(request, "login.html")
+
+
+# REGISTER - VULNERABLE TO SQL INJECTION
+
+
+async def register_view(request):
+    if request.method == "POST":
+        username = request.POST.get("username")
+        email = request.POST.get("email")
+        password = request.POST.get("password")
+        confirm = request.POST.get("confirm")
+
+        if password != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("register")
+
+        valid, msg = await acheck_password_rules(password)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("register")
+
+        # VULNERABLE: SQL Injection - checking if user exists
+        if await auser_exists(username, email):
+            messages.error(request, "Username or email already used")
+            return redirect("register")
+
+        hashed, salt = await ahash_password(password)
+
+        # VULNERABLE: SQL Injection - inserting user (and its password history)
+        await acreate_user(username, email, hashed, salt)
+
+        messages.success(request, "Registration successful")
+        return redirect("login")
+
+    return render(request, "register.html")
+
+
+# DASHBOARD - VULNERABLE TO STORED XSS AND SQL INJECTION
+
+
+async def dashboard_view(request):
+    user = await aget_session_user(request)
+    if user is None:
+        return redirect("login")
+
+    if request.method == "POST":
+        client_name = request.POST.get("client_name", "").strip()
+        # VULNERABLE: No XSS sanitization - user can inject HTML/JavaScript
+        client_email = request.POST.get("client_email", "").strip()
+        client_phone = request.POST.get("client_phone", "").strip()
+
+        if not client_name:
+            messages.error(request, "Client name is required")
+            return redirect("dashboard")
+
+        # VULNERABLE: SQL Injection - using raw SQL
+        await aadd_client(client_name, client_email, client_phone)
+        # Raw SQL sends no post_save signal
+        await aclients_changed()
+
+        messages.success(request, "Client added successfully")
+        return redirect("dashboard")
+
+    # A browser that already shows the current page gets a 304, before any query
+    version = await aget_clients_version()
+    etag = dashboard_etag(request, user, version)
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    query = request.GET.get("q", "").strip()
+    page_number = request.GET.get("page", "1")
+    page_number = int(page_number) if page_number.isdigit() else 1
+    cursor = request.GET.get("cursor")
+
+    async def render_page():
+        if query:
+            page = await asearch_clients(
+                query,
+                page_number=page_number,
+                page_size=settings.DASHBOARD_PAGE_SIZE,
+            )
+        else:
+            page = await akeyset_paginate(
+                Client.objects.all(),
+                cursor=cursor,
+                page_size=settings.DASHBOARD_PAGE_SIZE,
+            )
+        return render_to_string(
+            "client_list.html",
+            {"clients": page.object_list, "page": page, "q": query},
+        )
+
+    page_key = ("search", query, page_number) if query else ("list", cursor)
+    response = render(
+        request,
+        "dashboard.html",
+        {
+            "username": user.username,
+            "client_list": await aclient_list_fragment(version, page_key, render_page),
+            "q": query,
+        },
+    )
+    if etag:
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+# LOGOUT
+
+
+async def logout_view(request):
+    await request.session.aflush()
+    return redirect("login")
+
+
+# FORGOT PASSWORD — SEND CODE
+
+
+async def forgot_password_view(request):
+    if request.method == "POST":
+        username = request.POST.get("username", "").strip()
+
+        user = await User.objects.filter(username=username).afirst()
+        if not user:
+            messages.error(request, "User not found")
+            return redirect("forgot_password")
+
+        code = generate_sha1_code()
+        code_hash = sha1_hex(code)
+
+        await astore_reset_code(username, code_hash)
+
+        # Send the plain code, store only the hash
+        await asend_mail(
+            subject="Password reset code",
+            message=f"Your verification code is: {code}",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[user.email],
+            fail_silently=False,
+        )
+
+        await request.session.aset("reset_username", username)
+        messages.success(request, "Code generated")
+        return redirect("verify")
+
+    return render(request, "forgot_password.html")
+
+
+# VERIFY CODE
+
+
+async def verify_code_view(request):
+    if request.method == "POST":
+        code_input = request.POST.get("code", "").strip().upper()
+
+        username = await request.session.aget("reset_username")
+        if not username:
+            messages.error(request, "Please request a new code")
+            return redirect("forgot_password")
+
+        result = await acheck_reset_code(username, sha1_hex(code_input))
+        if result == resetcodes.MISSING:
+            messages.error(request, "Invalid request")
+            return redirect("forgot_password")
+
+        if result == resetcodes.EXPIRED:
+            messages.error(request, "The code has expired, please request a new one")
+            return redirect("forgot_password")
+
+        if result == resetcodes.TOO_MANY_ATTEMPTS:
+            messages.error(request, "Too many attempts, please request a new code")
+            return redirect("forgot_password")
+
+        if result == resetcodes.INCORRECT:
+            messages.error(request, "Incorrect code")
+            return redirect("verify")
+
+        await request.session.aset("reset_verified", True)
+        return redirect("reset_password")
+
+    return render(request, "verify.html")
+
+
+# RESET PASSWORD (AFTER FORGOT)
+
+
+async def reset_password_view(request):
+    if not await request.session.ahas_key("reset_username"):
+        if not await request.session.aget("reset_verified"):
+            messages.error(request, "Please verify the code first")
+            return redirect("verify")
+
+        return redirect("forgot_password")
+
+    username = await request.session.aget("reset_username")
+
+    if request.method == "POST":
+        password = request.POST.get("password")
+        confirm = request.POST.get("confirm")
+
+        if password != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("reset_password")
+
+        user = await User.objects.aget(username=username)
+
+        # Check password rules including history
+        valid, msg = await acheck_password_rules(password, user=user)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("reset_password")
+
+        hashed, salt = await ahash_password(password)
+
+        # Save old password to history before updating
+        await aadd_password_history(user, user.password_hash, user.salt)
+
+        user.password_hash = hashed
+        user.salt = salt
+        await user.asave(update_fields=["password_hash", "salt"])
+
+        await request.session.apop("reset_username", None)
+        await request.session.apop("reset_verified", None)
+        messages.success(request, "Password reset successfully")
+        return redirect("login")
+
+    return render(request, "reset_password.html")
+
+
+# CHANGE PASSWORD (LOGGED IN)
+
+
+async def change_password_view(request):
+    user = await aget_session_user(request)
+    if user is None:
+        return redirect("login")
+
+    if request.method == "POST":
+        old = request.POST.get("old_password")
+        new = request.POST.get("new_password")
+        confirm = request.POST.get("confirm")
+
+        if not await averify_password(old, user.salt, user.password_hash):
+            messages.error(request, "Incorrect, old password")
+            return redirect("change_password")
+
+        # Check password rules including history
+        valid, msg = await acheck_password_rules(new, user=user)
+        if not valid:
+            messages.error(request, msg)
+            return redirect("change_password")
+
+        if new != confirm:
+            messages.error(request, "Passwords do not match")
+            return redirect("change_password")
+
+        hashed, salt = await ahash_password(new)
+
+        # Save old password to history before updating
+        await aadd_password_history(user, user.password_hash, user.salt)
+
+        user.password_hash = hashed
+        user.salt = salt
+        await user.asave(update_fields=["password_hash", "salt"])
+
+        messages.success(request, "Password changed successfully")
+        return redirect("dashboard")
+
+    return render(request, "change_password.html")
@@ -0,0 +1,238 @@
+"""
+Bulk password policy audit.
+
+Checks large lists of candidate passwords (a breach corpus against a proposed
+policy, or the initial passwords of bulk-provisioned accounts) against the
+same rules as check_password_rules(), without the per-character Python loops:
+
+- ASCII passwords are classified with precompiled bytes.translate() tables
+  that delete every byte outside one character class; what is left tells
+  whether the class occurs. With NumPy installed (optional), a whole batch is
+  concatenated into one buffer, mapped through a 256-entry class table and
+  OR-reduced per password in a handful of vectorized operations.
+- Passwords with non-ASCII characters take the exact per-character path, so
+  Unicode upper/lowercase letters and digits count just as they do at
+  registration.
+- Dictionary hits are looked up for the whole batch at once (see
+  dictionary.IndexedDictionary.contains_many()).
+
+Every failed rule is counted, not only the first one, so a report shows how
+many passwords each rule rejects on its own. Run it with
+`manage.py audit_passwords`.
+"""
+import time
+from dataclasses import dataclass, field
+
+from .dictionary import get_dictionary, optional_numpy
+from .policy import get_policy
+
+SPECIAL_CHARS = "!@#$%^&*()-_=+{}[]"
+
+TOO_SHORT = 1
+NO_UPPERCASE = 2
+NO_LOWERCASE = 4
+NO_DIGIT = 8
+NO_SPECIAL = 16
+COMMON = 32
+
+RULES = {
+    "too_short": TOO_SHORT,
+    "no_uppercase": NO_UPPERCASE,
+    "no_lowercase": NO_LOWERCASE,
+    "no_digit": NO_DIGIT,
+    "no_special": NO_SPECIAL,
+    "common": COMMON,
+}
+
+# Character classes of the ASCII range, as failure bits they clear
+_CLASSES = (
+    (NO_UPPERCASE, bytes(range(ord("A"), ord("Z") + 1))),
+    (NO_LOWERCASE, bytes(range(ord("a"), ord("z") + 1))),
+    (NO_DIGIT, bytes(range(ord("0"), ord("9") + 1))),
+    (NO_SPECIAL, SPECIAL_CHARS.encode("ascii")),
+)
+
+# bytes.translate(None, delete) tables: everything except the class is deleted
+_DELETE_ALL_BUT = {
+    bit: bytes(b for b in range(256) if b not in members) for bit, members in _CLASSES
+}
+
+# One byte -> bitmask of the failures its presence rules out
+_BYTE_CLASS = bytearray(256)
+for _bit, _members in _CLASSES:
+    for _byte in _members:
+        _BYTE_CLASS[_byte] |= _bit
+
+
+def required_failures(policy):
+    """The complexity failure bits the policy enforces"""
+    complexity = policy.complexity
+    return (
+        (NO_UPPERCASE if complexity.uppercase else 0)
+        | (NO_LOWERCASE if complexity.lowercase else 0)
+        | (NO_DIGIT if complexity.digits else 0)
+        | (NO_SPECIAL if complexity.special else 0)
+    )
+
+
+def _unicode_failures(password):
+    # Exact equivalent of the checks in check_password_rules()
+    failures = 0
+    if not any(c.isupper() for c in password):
+        failures |= NO_UPPERCASE
+    if not any(c.islower() for c in password):
+        failures |= NO_LOWERCASE
+    if not any(c.isdigit() for c in password):
+        failures |= NO_DIGIT
+    if not any(c in SPECIAL_CHARS for c in password):
+        failures |= NO_SPECIAL
+    return failures
+
+
+def rule_failures(password, policy=None):
+    """Bitmask of the length and complexity rules the password breaks (no dictionary lookup)"""
+    policy = policy or get_policy()
+    failures = TOO_SHORT if len(password) < policy.min_length else 0
+    if password.isascii():
+        data = password.encode("ascii")
+        for bit, delete in _DELETE_ALL_BUT.items():
+            if not data.translate(None, delete):
+                failures |= bit
+    else:
+        failures |= _unicode_failures(password)
+    return failures & (TOO_SHORT | required_failures(policy))
+
+
+def _batch_failures_numpy(passwords, policy):
+    numpy = optional_numpy()
+    failures = [0] * len(passwords)
+    ascii_positions = []
+    encoded = []
+    for i, password in enumerate(passwords):
+        if password.isascii():
+            ascii_positions.append(i)
+            encoded.append(password.encode("ascii"))
+        else:
+            failures[i] = rule_failures(password, policy)
+    if not encoded:
+        return failures
+
+    lengths = numpy.fromiter((len(data) for data in encoded), dtype=numpy.int64, count=len(encoded))
+    starts = numpy.zeros(len(encoded), dtype=numpy.int64)
+    numpy.cumsum(lengths[:-1], out=starts[1:])
+    buffer = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+    table = numpy.frombuffer(bytes(_BYTE_CLASS), dtype=numpy.uint8)
+
+    present = numpy.zeros(len(encoded), dtype=numpy.uint8)
+    nonempty = lengths > 0
+    if buffer.size:
+        classes = table[buffer]
+        # reduceat needs valid start offsets; empty passwords keep 0 (nothing present)
+        present[nonempty] = numpy.bitwise_or.reduceat(classes, starts[nonempty])
+
+    required = required_failures(policy)
+    result = (~present & required) | numpy.where(lengths < policy.min_length, TOO_SHORT, 0)
+    for position, value in zip(ascii_positions, result.tolist()):
+        failures[position] = value
+    return failures
+
+
+def batch_failures(passwords, policy=None, engine="auto"):
+    """rule_failures() of each password in a list; engine is auto, numpy or python"""
+    policy = policy or get_policy()
+    if engine == "auto":
+        engine = "numpy" if optional_numpy() is not None else "python"
+    if engine == "numpy" and optional_numpy() is None:
+        raise ImportError("NumPy is not installed")
+    if engine == "numpy":
+        return _batch_failures_numpy(passwords, policy)
+    return [rule_failures(password, policy) for password in passwords]
+
+
+@dataclass
+class AuditReport:
+    checked: int = 0
+    accepted: int = 0
+    failures: dict = field(default_factory=lambda: dict.fromkeys(RULES, 0))
+    engine: str = ""
+    seconds: float = 0.0
+
+    @property
+    def rejected(self):
+        return self.checked - self.accepted
+
+    @property
+    def passwords_per_second(self):
+        return self.checked / self.seconds if self.seconds else 0.0
+
+    def add(self, failure_masks):
+        for mask in failure_masks:
+            self.checked += 1
+            if not mask:
+                self.accepted += 1
+                continue
+            for name, bit in RULES.items():
+                if mask & bit:
+                    self.failures[name] += 1
+
+    def as_dict(self):
+        return {
+            "checked": self.checked,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "failures": dict(self.failures),
+            "engine": self.engine,
+            "seconds": round(self.seconds, 3),
+            "passwords_per_second": round(self.passwords_per_second, 1),
+        }
+
+
+def iter_batches(passwords, batch_size):
+    batch = []
+    for password in passwords:
+        batch.append(password)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_password_file(f):
+    """Passwords from a binary file, one per line; undecodable bytes are kept as surrogates"""
+    for raw in f:
+        password = raw.decode("utf-8", "surrogateescape").rstrip("\r\n")
+        if password:
+            yield password
+
+
+def audit_passwords(passwords, policy=None, batch_size=10000, engine="auto", check_dictionary=True,
+                    on_batch=None):
+    """
+    Check an iterable of passwords batch by batch and return an AuditReport.
+    on_batch(passwords, failure_masks) is called for every batch, e.g. to write
+    out the rejected ones.
+    """
+    policy = policy or get_policy()
+    if engine == "auto":
+        engine = "numpy" if optional_numpy() is not None else "python"
+    dictionary = get_dictionary() if check_dictionary else None
+    report = AuditReport(engine=engine)
+    started = time.perf_counter()
+
+    for batch in iter_batches(passwords, batch_size):
+        masks = batch_failures(batch, policy, engine)
+        if dictionary is not None:
+            for i, common in enumerate(dictionary.contains_many(batch)):
+                if common:
+                    masks[i] |= COMMON
+        report.add(masks)
+        if on_batch is not None:
+            on_batch(batch, masks)
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def describe_failures(mask):
+    return [name for name, bit in RULES.items() if mask & bit]
@@ -0,0 +1,183 @@
+"""
+Bulk client import and export.
+
+Imports read the uploaded file as a stream (CSV with a header row, or one JSON
+object per line), validate each row with the same rules as the dashboard form
+and insert the valid ones with bulk_create, one transaction per batch. A bad
+row is reported and skipped; it never aborts the rest of the file. That
+includes a line with bytes that are not UTF-8, a NUL, or CSV the csv module
+cannot parse: it is reported as a malformed row at its own line number.
+
+Exports stream rows straight from a server-side iterator into the response,
+so neither direction ever holds the whole table in memory.
+"""
+import csv
+import io
+import json
+import time
+
+from django.db import transaction
+
+from .clientcache import clients_changed
+from .models import Client
+from .utils import is_valid_email
+
+FIELDS = ("name", "email", "phone")
+MAX_REPORTED_ERRORS = 100
+
+# Cells starting with these are evaluated as formulas by spreadsheet programs
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.rejected = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return (self.created + self.rejected) / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def detect_format(filename, requested=None):
+    if requested in ("csv", "ndjson"):
+        return requested
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def _is_clean(text):
+    """False if text holds a NUL or bytes that were not valid UTF-8 (surrogate escapes)"""
+    if "\x00" in text:
+        return False
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def iter_rows(binary_file, fmt):
+    """Yield (line number, row dict) from an uploaded file without reading it all"""
+    # Undecodable bytes become surrogate escapes, so they fail their own row
+    # instead of raising from the middle of a chunk
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="", errors="surrogateescape")
+    if fmt == "ndjson":
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if not _is_clean(line):
+                yield line_number, None
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        reader = csv.DictReader(text)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                # The reader starts over on the next line
+                yield reader.line_num, None
+                continue
+            if not all(_is_clean(value) for value in row.values() if isinstance(value, str)):
+                row = None
+            yield reader.line_num, row
+
+
+def validate_row(row, sanitize=None):
+    """Return (cleaned fields, None) or (None, error message)"""
+    if row is None:
+        return None, "Malformed row"
+
+    values = {field: str(row.get(field) or "").strip() for field in FIELDS}
+    if sanitize:
+        values = {field: sanitize(value) for field, value in values.items()}
+
+    if not values["name"]:
+        return None, "Client name is required"
+    if len(values["name"]) > Client._meta.get_field("name").max_length:
+        return None, "Client name is too long"
+    if not is_valid_email(values["email"]):
+        return None, "Email is not valid"
+    if len(values["phone"]) > Client._meta.get_field("phone").max_length:
+        return None, "Phone number is too long"
+    return values, None
+
+
+def import_clients(rows, batch_size=1000, sanitize=None):
+    """Validate and insert (line number, row) pairs in batches; returns an ImportResult"""
+    result = ImportResult()
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        with transaction.atomic():
+            Client.objects.bulk_create(batch)
+            clients_changed()
+        result.created += len(batch)
+        batch.clear()
+
+    for line_number, row in rows:
+        values, error = validate_row(row, sanitize)
+        if error:
+            result.add_error(line_number, error)
+            continue
+        batch.append(Client(**values))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _client_rows(chunk_size):
+    return Client.objects.order_by("id").values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _neutralize(value):
+    value = value or ""
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+class _Echo:
+    """File-like object whose write() hands back the line csv.writer produced"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_export(chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in _client_rows(chunk_size):
+        yield writer.writerow([_neutralize(value) for value in row])
+
+
+def iter_ndjson_export(chunk_size=2000):
+    for row in _client_rows(chunk_size):
+        yield json.dumps(dict(zip(FIELDS, row))) + "\n"
@@ -0,0 +1,355 @@
+"""
+Common-password dictionary compiled into a memory-mapped binary index.
+
+`manage.py build_password_index` turns common_passwords.txt (one password per
+line, any size) into common_passwords.idx:
+
+    header | Bloom filter bits | bucket directory | sorted 64-bit fingerprints
+
+A lookup hashes the lowercased password once, rejects most misses in the
+Bloom filter and confirms hits with a binary search inside one bucket of the
+sorted fingerprint table. The file is mmap'ed read-only, so the OS page cache
+holds it and the process itself keeps almost nothing resident.
+
+When the index is missing or older than the text file, lookups fall back to
+an in-memory set built from the text file (fine for small dictionaries).
+"""
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_numpy = False  # not imported yet, see optional_numpy()
+
+
+def optional_numpy():
+    """
+    The numpy module, or None if it is not installed. Only bulk operations
+    (build_index(), contains_many(), audit.py) use it, and importing it takes
+    longer than importing the whole app, so it is imported on first use, not
+    at start-up.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+MAGIC = b"CLPWIDX1"
+HEADER = struct.Struct("<8sIQQIIqQ")  # magic, version, entries, bloom bits, hashes, bucket bits, source mtime, source size
+VERSION = 1
+PARTITIONS = 256
+
+
+def fingerprint(password):
+    """64-bit fingerprint of a password, case-insensitive like the text dictionary"""
+    data = password.lower().encode("utf-8", "surrogateescape")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _bloom_positions(fp, bits, hashes):
+    # Double hashing: k positions derived from the two halves of the fingerprint
+    h1 = fp >> 32
+    h2 = (fp & 0xFFFFFFFF) | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _fill_numpy(numpy, chunks, bloom, offsets, bits, hashes, shift):
+    """Pass 3 of build_index() a chunk at a time: Bloom filter bits and bucket counts"""
+    # Writable views of the bytearray and the array, filled in place
+    bloom_bytes = numpy.frombuffer(bloom, dtype=numpy.uint8)
+    counts = numpy.frombuffer(offsets, dtype=numpy.uint64)[1:]
+    for chunk in chunks:
+        fps = numpy.frombuffer(chunk, dtype="<u8").astype(numpy.uint64)
+        # The same double hashing as _bloom_positions(); h1 + i * h2 stays below 2**64
+        h1 = fps >> numpy.uint64(32)
+        h2 = (fps & numpy.uint64(0xFFFFFFFF)) | numpy.uint64(1)
+        for i in range(hashes):
+            positions = (h1 + numpy.uint64(i) * h2) % numpy.uint64(bits)
+            masks = numpy.left_shift(1, positions & numpy.uint64(7)).astype(numpy.uint8)
+            numpy.bitwise_or.at(bloom_bytes, positions >> numpy.uint64(3), masks)
+        buckets = (fps >> numpy.uint64(shift)).astype(numpy.intp)
+        counts += numpy.bincount(buckets, minlength=len(counts)).astype(numpy.uint64)
+
+
+def _to_little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def build_index(source, output, false_positive_rate=0.01):
+    """
+    Compile a text dictionary into a binary index and atomically replace output.
+    Returns the number of distinct passwords written.
+
+    Fingerprints are spilled into PARTITIONS temporary files by their top byte,
+    so only 1/PARTITIONS of the corpus is held in memory while sorting. With
+    numpy the partitions are sorted and the Bloom filter is filled with array
+    operations instead of one interpreted step per fingerprint and hash.
+    """
+    source = Path(source)
+    output = Path(output)
+    mtime_ns, size = _source_signature(source)
+    numpy = optional_numpy()
+
+    with tempfile.TemporaryDirectory(dir=output.parent) as tmp:
+        tmp = Path(tmp)
+
+        # Pass 1: fingerprint every line and spill it to its partition
+        spills = [open(tmp / f"part{i:03d}", "wb") for i in range(PARTITIONS)]
+        buffers = [array("Q") for _ in range(PARTITIONS)]
+        try:
+            with open(source, "rb") as f:
+                for raw in f:
+                    line = raw.decode("utf-8", "surrogateescape").strip()
+                    if not line:
+                        continue
+                    fp = fingerprint(line)
+                    part = fp >> 56
+                    buffers[part].append(fp)
+                    if len(buffers[part]) >= 65536:
+                        _to_little_endian(buffers[part]).tofile(spills[part])
+                        buffers[part] = array("Q")
+            for part, buf in enumerate(buffers):
+                _to_little_endian(buf).tofile(spills[part])
+        finally:
+            for spill in spills:
+                spill.close()
+
+        # Pass 2: sort and de-duplicate each partition into one sorted run
+        entries_path = tmp / "entries"
+        count = 0
+        with open(entries_path, "wb") as out:
+            for part in range(PARTITIONS):
+                part_path = tmp / f"part{part:03d}"
+                if numpy is not None:
+                    unique = numpy.unique(numpy.fromfile(part_path, dtype="<u8"))
+                    part_path.unlink()
+                    count += len(unique)
+                    unique.astype("<u8").tofile(out)
+                    continue
+                values = array("Q")
+                with open(part_path, "rb") as f:
+                    values.frombytes(f.read())
+                _to_little_endian(values)
+                part_path.unlink()
+                unique = array("Q", sorted(set(values)))
+                count += len(unique)
+                _to_little_endian(unique).tofile(out)
+
+        # Size the Bloom filter for the requested false-positive rate
+        n = max(count, 1)
+        bits = max(64, math.ceil(-n * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        bits = (bits + 63) // 64 * 64
+        hashes = max(1, round(bits / n * math.log(2)))
+        bucket_bits = min(24, max(8, math.ceil(math.log2(n)) - 4))
+
+        # Pass 3: fill the Bloom filter and the bucket histogram
+        bloom = bytearray(bits // 8)
+        offsets = array("Q", bytes(8 * ((1 << bucket_bits) + 1)))
+        shift = 64 - bucket_bits
+        with open(entries_path, "rb") as f:
+            chunks = iter(lambda: f.read(8 * 65536), b"")
+            if numpy is not None:
+                _fill_numpy(numpy, chunks, bloom, offsets, bits, hashes, shift)
+            else:
+                for chunk in chunks:
+                    values = _to_little_endian(array("Q", chunk))
+                    for fp in values:
+                        for pos in _bloom_positions(fp, bits, hashes):
+                            bloom[pos >> 3] |= 1 << (pos & 7)
+                        offsets[(fp >> shift) + 1] += 1
+        for i in range(1, len(offsets)):
+            offsets[i] += offsets[i - 1]
+
+        # Assemble the index next to the destination, then swap it in
+        partial = output.with_name(output.name + ".partial")
+        with open(partial, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, count, bits, hashes, bucket_bits, mtime_ns, size))
+            out.write(bloom)
+            _to_little_endian(offsets).tofile(out)
+            with open(entries_path, "rb") as f:
+                while True:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+        os.replace(partial, output)
+
+    return count
+
+
+class IndexedDictionary:
+    """Read-only view of a compiled index file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.entries, self.bloom_bits, self.bloom_hashes,
+         self.bucket_bits, self.source_mtime_ns, self.source_size) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{self.path} is not a password index (or has an unsupported version)")
+        self._bloom_offset = HEADER.size
+        self._directory_offset = self._bloom_offset + self.bloom_bits // 8
+        self._entries_offset = self._directory_offset + 8 * ((1 << self.bucket_bits) + 1)
+
+    def __len__(self):
+        return self.entries
+
+    def __contains__(self, password):
+        return self.contains_fingerprint(fingerprint(password))
+
+    def contains_fingerprint(self, fp):
+        mm = self._mm
+        bloom = self._bloom_offset
+        for pos in _bloom_positions(fp, self.bloom_bits, self.bloom_hashes):
+            if not mm[bloom + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+
+        bucket = fp >> (64 - self.bucket_bits)
+        lo, hi = struct.unpack_from("<QQ", mm, self._directory_offset + 8 * bucket)
+        base = self._entries_offset
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = struct.unpack_from("<Q", mm, base + 8 * mid)[0]
+            if value < fp:
+                lo = mid + 1
+            elif value > fp:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def contains_many(self, passwords):
+        """Membership of a whole batch: one sorted pass instead of independent lookups"""
+        fps = [fingerprint(password) for password in passwords]
+        if fps and optional_numpy() is not None:
+            return self._contains_many_numpy(fps)
+        # Sorted order walks the Bloom filter and the buckets front to back
+        hits = {}
+        for fp in sorted(set(fps)):
+            hits[fp] = self.contains_fingerprint(fp)
+        return [hits[fp] for fp in fps]
+
+    def _contains_many_numpy(self, fps):
+        numpy = optional_numpy()
+        wanted = numpy.array(fps, dtype=numpy.uint64)
+        # Views into the mmap; dropped before returning so close() keeps working
+        entries = numpy.frombuffer(self._mm, dtype="<u8", count=self.entries, offset=self._entries_offset)
+        if not len(entries):
+            return [False] * len(fps)
+        positions = numpy.searchsorted(entries, wanted)
+        found = entries[numpy.minimum(positions, len(entries) - 1)] == wanted
+        del entries
+        return found.tolist()
+
+    def is_stale(self, source):
+        try:
+            return _source_signature(source) != (self.source_mtime_ns, self.source_size)
+        except OSError:
+            return False
+
+    def close(self):
+        self._mm.close()
+
+
+class InMemoryDictionary:
+    """Fallback used while no up-to-date index exists"""
+
+    def __init__(self, passwords):
+        self._passwords = frozenset(passwords)
+
+    def __len__(self):
+        return len(self._passwords)
+
+    def __contains__(self, password):
+        return password.lower() in self._passwords
+
+    def contains_many(self, passwords):
+        members = self._passwords
+        return [password.lower() in members for password in passwords]
+
+    def close(self):
+        pass
+
+
+_dictionary = None
+_dictionary_signature = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _index_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _open_dictionary(index_path, source_path):
+    if index_path.exists():
+        try:
+            index = IndexedDictionary(index_path)
+        except (OSError, ValueError):
+            logger.exception("Could not open password index %s", index_path)
+        else:
+            if not index.is_stale(source_path):
+                return index
+            index.close()
+            logger.warning("%s is older than %s; run 'manage.py build_password_index'",
+                           index_path, source_path)
+
+    from .utils import load_common_passwords
+    return InMemoryDictionary(load_common_passwords())
+
+
+def get_dictionary():
+    """Return the process-wide dictionary, reopening it when the index file is rebuilt"""
+    global _dictionary, _dictionary_signature, _checked_at
+
+    index_path = Path(getattr(settings, "COMMON_PASSWORDS_INDEX", settings.BASE_DIR / "common_passwords.idx"))
+    source_path = Path(getattr(settings, "COMMON_PASSWORDS_FILE", settings.BASE_DIR / "common_passwords.txt"))
+    interval = getattr(settings, "PASSWORD_POLICY_CHECK_INTERVAL", 1.0)
+
+    dictionary = _dictionary
+    if dictionary is not None and time.monotonic() - _checked_at < interval:
+        return dictionary
+
+    with _lock:
+        signature = (_index_signature(index_path), _index_signature(source_path))
+        if _dictionary is None or signature != _dictionary_signature:
+            # Old mmaps are left to the garbage collector; a request may still be reading one
+            _dictionary = _open_dictionary(index_path, source_path)
+            _dictionary_signature = signature
+        _checked_at = time.monotonic()
+        return _dictionary
+
+
+def is_common_password(password):
+    """True if the password appears in the common-passwords dictionary"""
+    return password in get_dictionary()
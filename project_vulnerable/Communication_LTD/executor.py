@@ -0,0 +1,223 @@
+"""
+Bounded worker pool for password hashing.
+
+Hashing with a real KDF takes tens to hundreds of milliseconds of CPU. The
+views hand that work to a shared pool instead of running it on the request
+thread (or the event loop, for the async views):
+
+- a thread pool when the configured hasher releases the GIL (pbkdf2, scrypt),
+- a process pool otherwise,
+- or inline, on the calling thread, when KIND is "inline".
+
+At most WORKERS hashes run at once and at most MAX_QUEUE more may wait. Past
+that, submit() raises HashingQueueFull straight away and
+HashingBackpressureMiddleware turns it into a 503 with a Retry-After header,
+so a login spike is shed quickly instead of piling up behind the pool.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .hashers import HASHERS, get_hasher, identify_hasher
+from .metrics import timed_hash
+
+DEFAULTS = {
+    "KIND": "auto",
+    "WORKERS": None,
+    "MAX_QUEUE": 64,
+    "RETRY_AFTER": 1,
+}
+
+
+class HashingQueueFull(Exception):
+    """Raised instead of queueing when every worker and queue slot is taken"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# Module-level so they can be pickled into a process pool. They only use the
+# hasher classes, never Django settings, so they also work in spawned workers.
+
+def _encode(algorithm, params, password, salt):
+    return HASHERS[algorithm](**params).encode(password, salt)
+
+
+def _verify(password, salt, encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.verify(password, salt, encoded)
+
+
+class HashingExecutor:
+    def __init__(self, kind="auto", workers=None, max_queue=64, retry_after=1):
+        if kind == "auto":
+            kind = "thread" if get_hasher().releases_gil else "process"
+        if kind not in ("thread", "process", "inline"):
+            raise ImproperlyConfigured(f"Unknown hashing executor kind '{kind}'")
+
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + max_queue
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        if kind == "thread":
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="hashing")
+        elif kind == "process":
+            self._pool = ProcessPoolExecutor(self.workers)
+        else:
+            self._pool = None
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return a Future, or raise HashingQueueFull"""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingQueueFull(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+
+        try:
+            if self._pool is None:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as exc:
+                    future.set_exception(exc)
+            else:
+                future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        """Run fn(*args) in the pool and wait for the result"""
+        with timed_hash():
+            return self.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        """Run fn(*args) in the pool without blocking the event loop"""
+        with timed_hash():
+            return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide hashing executor, created on first use from settings"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                options = {**DEFAULTS, **getattr(settings, "PASSWORD_HASHING_EXECUTOR", {})}
+                _executor = HashingExecutor(
+                    kind=options["KIND"],
+                    workers=options["WORKERS"],
+                    max_queue=options["MAX_QUEUE"],
+                    retry_after=options["RETRY_AFTER"],
+                )
+    return _executor
+
+
+def _encode_args(password, salt, encoded):
+    if salt is None:
+        salt = os.urandom(16).hex()
+    hasher = identify_hasher(encoded) if encoded else get_hasher()
+    return (hasher.algorithm, hasher.params, password, salt), salt
+
+
+def offload_hash_password(password, salt=None, encoded=None):
+    """utils.hash_password() computed in the hashing pool"""
+    args, salt = _encode_args(password, salt, encoded)
+    return get_executor().run(_encode, *args), salt
+
+
+def offload_verify_password(password, salt, encoded):
+    """utils.verify_password() computed in the hashing pool"""
+    return get_executor().run(_verify, password, salt, encoded)
+
+
+def offload_verify_any(password, entries):
+    """
+    True if password matches any of the (salt, encoded) entries. The entries
+    are verified in parallel in the hashing pool, and the rest are cancelled
+    as soon as one matches, so the latency stays close to a single hash.
+    """
+    entries = list(entries)
+    if not entries:
+        return False
+    executor = get_executor()
+    with timed_hash(count=len(entries)):
+        pending = set()
+        try:
+            for salt, encoded in entries:
+                pending.add(executor.submit(_verify, password, salt, encoded))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if any(future.result() for future in done):
+                    return True
+            return False
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+async def ahash_password(password, salt=None, encoded=None):
+    """Async utils.hash_password(); the event loop keeps running while it hashes"""
+    args, salt = _encode_args(password, salt, encoded)
+    return await get_executor().arun(_encode, *args), salt
+
+
+async def averify_password(password, salt, encoded):
+    """Async utils.verify_password()"""
+    return await get_executor().arun(_verify, password, salt, encoded)
+
+
+class HashingBackpressureMiddleware(MiddlewareMixin):
+    """Answer 503 + Retry-After when a view could not get a hashing slot"""
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingQueueFull):
+            response = HttpResponse(
+                "The server is busy, please try again shortly.",
+                status=503,
+                content_type="text/plain",
+            )
+            response["Retry-After"] = str(exception.retry_after)
+            return response
+        return None
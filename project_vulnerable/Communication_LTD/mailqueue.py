@@ -0,0 +1,389 @@
+"""
+Durable, batched outbound mail.
+
+EMAIL_BACKEND is QueuedEmailBackend, so send_mail() in the views (or
+asend_mail() in the async views) only inserts an OutboundEmail row and
+returns; no request waits on SMTP. A
+dispatcher then delivers due rows in batches of MAIL_QUEUE["BATCH_SIZE"]
+through MAIL_QUEUE["BACKEND"] (the real backend), over one connection per
+batch:
+
+- DISPATCHER "thread": a daemon thread in the web process, started on the
+  first enqueue and woken up by every later one;
+- DISPATCHER "command": nothing runs in the web process;
+  `manage.py dispatch_mail` delivers the queue instead.
+
+Rows are claimed with a lease before sending, so several dispatchers never
+send the same mail, and a dispatcher that dies mid-batch only delays its
+rows until the lease runs out. A failed send is retried with exponential
+backoff (RETRY_BACKOFF * 2**attempt, capped at RETRY_BACKOFF_MAX) and given
+up after MAX_ATTEMPTS.
+
+A row's body (which holds the plaintext reset code) is blanked as soon as
+it is sent or given up on, and finished rows are deleted KEEP_FINISHED
+seconds later, PURGE_BATCH_SIZE per statement: one batch on every
+dispatcher poll, or all of them with `manage.py purge_mail`.
+
+StandInBackend is a local relay for tests and benchmarks: it keeps mail in
+django.core.mail.outbox and can simulate latency and failures.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F, Min, Subquery
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+    "DISPATCHER": "thread",
+    "BATCH_SIZE": 100,
+    "MAX_ATTEMPTS": 6,
+    "RETRY_BACKOFF": 30,
+    "RETRY_BACKOFF_MAX": 3600,
+    "POLL_INTERVAL": 5,
+    "LEASE": 300,
+    "KEEP_FINISHED": 7 * 24 * 60 * 60,
+    "PURGE_BATCH_SIZE": 500,
+    "STANDIN_LATENCY": 0.0,
+    "STANDIN_FAILURE_RATE": 0.0,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "MAIL_QUEUE", {})}
+
+
+class MailQueueCounters:
+    """Process-wide delivery counters for /metrics"""
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.delivery_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, sent=0, retried=0, failed=0, delivery_seconds=0.0):
+        with self._lock:
+            self.sent += sent
+            self.retried += retried
+            self.failed += failed
+            self.batches += 1
+            self.delivery_seconds += delivery_seconds
+
+
+counters = MailQueueCounters()
+
+
+# ENQUEUE
+
+def _to_row(message):
+    html_body = ""
+    for content, mimetype in getattr(message, "alternatives", []):
+        if mimetype == "text/html":
+            html_body = content
+    return OutboundEmail(
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        headers={**message.extra_headers, **({"Reply-To": ", ".join(message.reply_to)} if message.reply_to else {})},
+    )
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Email backend that stores messages in the outbox instead of sending them"""
+
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            if message.attachments:
+                # Attachments are not stored in the outbox; send those directly
+                get_connection(get_options()["BACKEND"], fail_silently=self.fail_silently).send_messages([message])
+                continue
+            if message.recipients():
+                rows.append(_to_row(message))
+        if not rows:
+            return 0
+        try:
+            OutboundEmail.objects.bulk_create(rows)
+        except DatabaseError:
+            if not self.fail_silently:
+                raise
+            logger.exception("Could not queue %d email(s)", len(rows))
+            return 0
+        transaction.on_commit(notify_dispatcher)
+        return len(rows)
+
+
+async def asend_mail(subject, message, from_email, recipient_list, fail_silently=False):
+    """send_mail() for async views: queues the message with the async ORM"""
+    if settings.EMAIL_BACKEND != f"{__name__}.QueuedEmailBackend":
+        return await sync_to_async(send_mail)(
+            subject, message, from_email, recipient_list, fail_silently=fail_silently
+        )
+    email = EmailMultiAlternatives(subject, message, from_email, recipient_list)
+    try:
+        await OutboundEmail.objects.abulk_create([_to_row(email)])
+    except DatabaseError:
+        if not fail_silently:
+            raise
+        logger.exception("Could not queue an email")
+        return 0
+    # Async views run in autocommit mode, so the row is already committed
+    notify_dispatcher()
+    return 1
+
+
+# DISPATCH
+
+def _to_message(row, connection):
+    message = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email,
+        to=row.to,
+        cc=row.cc,
+        bcc=row.bcc,
+        headers=row.headers,
+        connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, "text/html")
+    return message
+
+
+def retry_delay(attempts, options):
+    """Seconds to wait before attempt number attempts + 1, with +-10% jitter"""
+    delay = min(options["RETRY_BACKOFF"] * 2 ** max(attempts - 1, 0), options["RETRY_BACKOFF_MAX"])
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim_batch(batch_size, lease_seconds):
+    """Lease up to batch_size due rows to this caller and return them"""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING],
+        next_attempt_at__lte=now,
+    )
+    ids = list(due.order_by("next_attempt_at").values_list("id", flat=True)[:batch_size])
+    if not ids:
+        return []
+    # No transaction around the SELECT: a read lock upgraded to a write lock fails
+    # at once with "database is locked" under SQLite. The UPDATE repeats the due
+    # filter, so rows another dispatcher claimed in between are skipped.
+    due.filter(id__in=ids).update(
+        status=OutboundEmail.SENDING,
+        next_attempt_at=now + timedelta(seconds=lease_seconds),
+        claimed_by=token,
+    )
+    return list(OutboundEmail.objects.filter(id__in=ids, status=OutboundEmail.SENDING, claimed_by=token))
+
+
+def _reschedule(failures, options):
+    """Back off (row, error) pairs, or give up on rows that used all their attempts"""
+    retried = failed = 0
+    now = timezone.now()
+    for row, error in failures:
+        row.attempts += 1
+        row.last_error = error[:2000]
+        if row.attempts >= options["MAX_ATTEMPTS"]:
+            row.status = OutboundEmail.FAILED
+            row.body = row.html_body = ""
+            failed += 1
+            logger.error("Giving up on email %s after %d attempts: %s", row.pk, row.attempts, error)
+        else:
+            row.status = OutboundEmail.PENDING
+            row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts, options))
+            retried += 1
+    OutboundEmail.objects.bulk_update(
+        [row for row, _ in failures], ["attempts", "last_error", "status", "next_attempt_at", "body", "html_body"]
+    )
+    return retried, failed
+
+
+def dispatch_batch(options=None):
+    """Deliver one batch of due mail; return the number of rows handled"""
+    options = options or get_options()
+    rows = claim_batch(options["BATCH_SIZE"], options["LEASE"])
+    if not rows:
+        return 0
+
+    connection = get_connection(options["BACKEND"], fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning("Mail backend unavailable, rescheduling %d email(s): %s", len(rows), exc)
+        retried, failed = _reschedule([(row, f"connect: {exc}") for row in rows], options)
+        counters.add(retried=retried, failed=failed)
+        return len(rows)
+
+    sent, failures = [], []
+    try:
+        for row in rows:
+            try:
+                connection.send_messages([_to_message(row, connection)])
+            except Exception as exc:
+                failures.append((row, f"{type(exc).__name__}: {exc}"))
+            else:
+                sent.append(row)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            logger.exception("Error closing the mail connection")
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(id__in=[row.id for row in sent]).update(
+            status=OutboundEmail.SENT, sent_at=now, attempts=F("attempts") + 1, last_error="",
+            body="", html_body="",
+        )
+    retried, failed = _reschedule(failures, options) if failures else (0, 0)
+
+    counters.add(
+        sent=len(sent),
+        retried=retried,
+        failed=failed,
+        delivery_seconds=sum((now - row.created_at).total_seconds() for row in sent),
+    )
+    return len(rows)
+
+
+def dispatch_due(options=None):
+    """Deliver batches until nothing is due; return the number of rows handled"""
+    options = options or get_options()
+    handled = 0
+    while True:
+        count = dispatch_batch(options)
+        handled += count
+        if count < options["BATCH_SIZE"]:
+            return handled
+
+
+def purge_finished_mail(batch_size=None, pause=0.0, max_batches=None, options=None):
+    """Delete sent and failed rows older than KEEP_FINISHED batch by batch; return how many were deleted"""
+    options = options or get_options()
+    batch_size = batch_size or options["PURGE_BATCH_SIZE"]
+    # A finished row's next_attempt_at is its last attempt (the lease it was sent under)
+    finished = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.SENT, OutboundEmail.FAILED],
+        next_attempt_at__lt=timezone.now() - timedelta(seconds=options["KEEP_FINISHED"]),
+    )
+    deleted = 0
+    batches = 0
+    while True:
+        # One statement per batch: no read lock to upgrade (see claim_batch)
+        count, _ = OutboundEmail.objects.filter(
+            id__in=Subquery(finished.order_by("next_attempt_at").values("id")[:batch_size])
+        ).delete()
+        deleted += count
+        batches += 1
+        if count < batch_size or (max_batches and batches >= max_batches):
+            return deleted
+        if pause:
+            # Let waiting writers in between batches
+            time.sleep(pause)
+
+
+class MailDispatcher:
+    """Background thread that delivers the outbox whenever it is woken up or polled"""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                dispatch_due()
+                purge_finished_mail(max_batches=1)
+            except Exception:
+                logger.exception("Mail dispatch failed")
+            finally:
+                close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def notify_dispatcher():
+    """Wake the in-process dispatcher (starting it if needed), if one is configured"""
+    global _dispatcher
+    options = get_options()
+    if options["DISPATCHER"] != "thread":
+        return
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                dispatcher = MailDispatcher(options["POLL_INTERVAL"])
+                dispatcher.start()
+                _dispatcher = dispatcher
+    _dispatcher.wake()
+
+
+def mail_queue_stats():
+    """Queue depth and age plus this process's delivery counters"""
+    pending = OutboundEmail.objects.filter(status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING])
+    oldest = pending.aggregate(oldest=Min("created_at"))["oldest"]
+    return {
+        "pending": pending.count(),
+        "failed": OutboundEmail.objects.filter(status=OutboundEmail.FAILED).count(),
+        "oldest_pending_seconds": (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+        "sent_total": counters.sent,
+        "retried_total": counters.retried,
+        "failed_total": counters.failed,
+        "delivery_seconds_total": counters.delivery_seconds,
+    }
+
+
+class StandInBackend(LocMemEmailBackend):
+    """
+    Local relay for tests and benchmarks. Messages land in
+    django.core.mail.outbox; MAIL_QUEUE["STANDIN_LATENCY"] adds a delay per
+    message and MAIL_QUEUE["STANDIN_FAILURE_RATE"] makes that share of sends
+    fail, to exercise batching and retries without an SMTP server.
+    """
+
+    opened = 0
+
+    def open(self):
+        StandInBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        options = get_options()
+        if options["STANDIN_LATENCY"]:
+            time.sleep(options["STANDIN_LATENCY"] * len(messages))
+        if options["STANDIN_FAILURE_RATE"] and random.random() < options["STANDIN_FAILURE_RATE"]:
+            raise ConnectionError("Stand-in relay refused the message")
+        return super().send_messages(messages)
@@ -0,0 +1,82 @@
+import json
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from Communication_LTD import audit
+from Communication_LTD.dictionary import optional_numpy
+from Communication_LTD.policy import PasswordPolicy, get_policy
+
+
+class Command(BaseCommand):
+    help = "Check a file of passwords (one per line) against the password policy and report per-rule failures"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="password list, or - for stdin")
+        parser.add_argument("--policy", help="audit against this policy JSON instead of the current one")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--engine", choices=["auto", "numpy", "python"], default="auto",
+                            help="how the complexity rules are evaluated (numpy needs NumPy installed)")
+        parser.add_argument("--no-dictionary", action="store_true", help="skip the common-passwords lookup")
+        parser.add_argument("--rejected", help="write every rejected password and its failed rules to this file")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    def handle(self, *args, **options):
+        policy = self._load_policy(options["policy"])
+        if options["engine"] == "numpy" and optional_numpy() is None:
+            raise CommandError("--engine numpy needs NumPy: pip install numpy")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        rejected_file = open(options["rejected"], "w", encoding="utf-8", errors="surrogateescape") \
+            if options["rejected"] else None
+
+        def write_rejected(batch, masks):
+            for password, mask in zip(batch, masks):
+                if mask:
+                    rejected_file.write(f"{password}\t{','.join(audit.describe_failures(mask))}\n")
+
+        source = sys.stdin.buffer if options["file"] == "-" else self._open(options["file"])
+        try:
+            report = audit.audit_passwords(
+                audit.iter_password_file(source),
+                policy=policy,
+                batch_size=options["batch_size"],
+                engine=options["engine"],
+                check_dictionary=not options["no_dictionary"],
+                on_batch=write_rejected if rejected_file else None,
+            )
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+            if rejected_file:
+                rejected_file.close()
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"policy": policy.as_dict(), **report.as_dict()}, indent=2))
+            return
+
+        self.stdout.write(
+            f"Checked {report.checked} passwords in {report.seconds:.2f} s "
+            f"({report.passwords_per_second:,.0f}/s, {report.engine} engine)"
+        )
+        self.stdout.write(f"Accepted {report.accepted}, rejected {report.rejected}")
+        for rule, count in report.failures.items():
+            share = count / report.checked * 100 if report.checked else 0.0
+            self.stdout.write(f"  {rule:<14}{count:>12}  {share:6.2f}%")
+
+    def _load_policy(self, path):
+        if not path:
+            return get_policy()
+        try:
+            with open(path) as f:
+                return PasswordPolicy.from_dict(json.load(f))
+        except (OSError, ValueError, ImproperlyConfigured) as exc:
+            raise CommandError(f"Cannot load policy {path}: {exc}")
+
+    def _open(self, path):
+        try:
+            return open(path, "rb")
+        except OSError as exc:
+            raise CommandError(str(exc))
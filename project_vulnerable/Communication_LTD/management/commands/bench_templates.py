@@ -0,0 +1,111 @@
+import json
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import TemplateDoesNotExist, engines
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+from Communication_LTD import warmup
+from Communication_LTD.models import Client
+
+
+def client_rows(count):
+    """Unsaved Client objects, so only the template is measured"""
+    return [
+        Client(pk=i, name=f"Client {i}", email=f"client{i}@example.com", phone=f"+972-50-{i:07d}")
+        for i in range(1, count + 1)
+    ]
+
+
+def render_context(clients):
+    # Everything the app's templates read; each template uses its own part
+    page = SimpleNamespace(
+        object_list=clients, number=1, has_previous=False, has_next=True,
+        previous_cursor=None, next_cursor="bench",
+    )
+    return {"clients": clients, "page": page, "q": "", "username": "bench", "client_list": ""}
+
+
+def timed(function, min_seconds, rounds):
+    """Median seconds of function(), over at least `rounds` calls and min_seconds"""
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < rounds or time.perf_counter() - started < min_seconds:
+        began = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - began)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "Measure compile and render time of each template at several client list sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000],
+                            help="client rows to render (default 10 1000 100000)")
+        parser.add_argument("--template", action="append",
+                            help="only this template (repeatable; default every template of the app)")
+        parser.add_argument("--rounds", type=int, default=5, help="minimum renders per size (default 5)")
+        parser.add_argument("--min-time", type=float, default=0.2,
+                            help="minimum seconds spent per template and size (default 0.2)")
+        parser.add_argument("--json", action="store_true", help="print the results as JSON")
+
+    def handle(self, *args, **options):
+        if min(options["rows"]) < 0 or options["rounds"] < 1:
+            raise CommandError("--rows must not be negative and --rounds must be positive")
+        names = options["template"] or warmup.app_templates()
+        engine = engines["django"].engine
+        request = RequestFactory().get("/dashboard/")
+        contexts = {rows: render_context(client_rows(rows)) for rows in options["rows"]}
+
+        results = []
+        for name in names:
+            try:
+                source = get_template(name).template.source
+            except TemplateDoesNotExist:
+                raise CommandError(f"No template {name!r}")
+            result = {
+                "template": name,
+                # Parsing from source, what every render would cost without the cached loader
+                "compile_ms": timed(lambda: engine.from_string(source), options["min_time"], options["rounds"]) * 1000,
+                "lookup_ms": timed(lambda: get_template(name), options["min_time"], options["rounds"]) * 1000,
+                "render_ms": {},
+            }
+            template = get_template(name)
+            for rows, context in contexts.items():
+                try:
+                    seconds = timed(lambda: template.render(context, request), options["min_time"], options["rounds"])
+                except Exception as exc:
+                    result["error"] = f"{type(exc).__name__}: {exc}"
+                    break
+                result["render_ms"][str(rows)] = seconds * 1000
+            results.append(result)
+
+        report = {
+            "loaders": [str(loader) for loader in engine.loaders],
+            "debug": engine.debug,
+            "rows": options["rows"],
+            "templates": results,
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self._print(report)
+
+    def _print(self, report):
+        self.stdout.write(f"Loaders {report['loaders']}, template debug {report['debug']}\n")
+        header = f"{'template':<26}{'compile ms':>11}{'lookup ms':>11}"
+        header += "".join(f"{f'{rows} rows ms':>15}" for rows in report["rows"])
+        self.stdout.write(header)
+        for result in report["templates"]:
+            line = f"{result['template']:<26}{result['compile_ms']:>11.3f}{result['lookup_ms']:>11.4f}"
+            line += "".join(
+                f"{result['render_ms'][str(rows)]:>15.3f}" if str(rows) in result["render_ms"] else f"{'-':>15}"
+                for rows in report["rows"]
+            )
+            self.stdout.write(line)
+            if "error" in result:
+                self.stdout.write(f"  {result['error']}")
@@ -0,0 +1,49 @@
+import os
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Communication_LTD.hashers import HASHERS
+
+
+class Command(BaseCommand):
+    help = "Tune each password hasher to a target latency per hash on this machine"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-ms", type=float, default=250.0,
+                            help="Wanted time per hash in milliseconds (default 250)")
+        parser.add_argument("--algorithm", action="append", choices=sorted(HASHERS),
+                            help="Only benchmark this hasher (repeatable)")
+        parser.add_argument("--rounds", type=int, default=5,
+                            help="Timed hashes per algorithm after tuning (default 5)")
+
+    def handle(self, *args, **options):
+        target = options["target_ms"] / 1000
+        if target <= 0:
+            raise CommandError("--target-ms must be positive")
+        rounds = max(1, options["rounds"])
+        cores = os.cpu_count() or 1
+
+        self.stdout.write(f"Target {options['target_ms']:.0f} ms per hash, {cores} CPU cores\n")
+        suggested = {}
+
+        for algorithm in options["algorithm"] or sorted(HASHERS):
+            hasher_class = HASHERS[algorithm]
+            params = hasher_class.calibrate(target)
+            hasher = hasher_class(**params)
+            median = statistics.median(hasher.time_once() for _ in range(rounds))
+            per_core = 1 / median if median else float("inf")
+
+            self.stdout.write(
+                f"{algorithm:<14} {self._format_params(params):<26} "
+                f"{median * 1000:8.2f} ms/hash  {per_core:10.1f} logins/s/core  "
+                f"{per_core * cores:10.1f} logins/s total"
+            )
+            if params:
+                suggested[algorithm] = params
+
+        self.stdout.write("\nSuggested settings:")
+        self.stdout.write(f"PASSWORD_HASHER_PARAMS = {suggested!r}")
+
+    def _format_params(self, params):
+        return ",".join(f"{key}={value}" for key, value in sorted(params.items())) or "-"
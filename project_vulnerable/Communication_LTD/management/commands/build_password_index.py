@@ -0,0 +1,41 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Communication_LTD.dictionary import IndexedDictionary, build_index
+
+
+class Command(BaseCommand):
+    help = "Compile the common-passwords text file into the binary lookup index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=settings.COMMON_PASSWORDS_FILE,
+                            help="Text file with one password per line")
+        parser.add_argument("--output", default=settings.COMMON_PASSWORDS_INDEX,
+                            help="Where to write the index")
+        parser.add_argument("--false-positive-rate", type=float, default=0.01,
+                            help="Target Bloom filter false-positive rate (default 0.01)")
+
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        output = Path(options["output"])
+        rate = options["false_positive_rate"]
+
+        if not source.exists():
+            raise CommandError(f"{source} does not exist")
+        if not 0 < rate < 1:
+            raise CommandError("--false-positive-rate must be between 0 and 1")
+
+        started = time.perf_counter()
+        count = build_index(source, output, false_positive_rate=rate)
+        elapsed = time.perf_counter() - started
+
+        index = IndexedDictionary(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} distinct passwords into {output} "
+            f"({output.stat().st_size / 1024:.1f} KiB, {index.bloom_hashes} Bloom hashes) "
+            f"in {elapsed:.2f}s"
+        ))
+        index.close()
@@ -0,0 +1,56 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Communication_LTD.bulk import detect_format, iter_rows
+from Communication_LTD.provisioning import get_options, provision_users
+
+
+class Command(BaseCommand):
+    help = "Create user accounts from a CSV or NDJSON file (username, email, password) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="user file, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension, else csv")
+        parser.add_argument("--batch-size", type=int, help="users per transaction (default: USER_PROVISIONING)")
+        parser.add_argument("--pool", choices=["process", "thread", "inline"], help="where passwords are hashed")
+        parser.add_argument("--workers", type=int, help="hashing workers (default: number of CPU cores)")
+        parser.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be positive")
+
+        source = sys.stdin.buffer if options["file"] == "-" else self._open(options["file"])
+        try:
+            result = provision_users(
+                iter_rows(source, detect_format(options["file"], options["format"])),
+                batch_size=options["batch_size"],
+                pool=options["pool"],
+                workers=options["workers"],
+            )
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result.as_dict(), indent=2))
+            return
+
+        self.stdout.write(
+            f"Created {result.created} users, rejected {result.rejected} in {result.elapsed:.2f} s "
+            f"({result.rows_per_second:,.1f} rows/s, {options['pool'] or get_options()['POOL']} pool)"
+        )
+        for error in result.errors:
+            self.stdout.write(f"  line {error['line']}: {error['error']}")
+        if result.rejected > len(result.errors):
+            self.stdout.write(f"  ... and {result.rejected - len(result.errors)} more")
+
+    def _open(self, path):
+        try:
+            return open(path, "rb")
+        except OSError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from Communication_LTD.resetcodes import purge_expired_reset_codes
+
+
+class Command(BaseCommand):
+    help = "Delete expired password reset codes in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="rows per DELETE (default RESET_CODES['PURGE_BATCH_SIZE'])")
+        parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_reset_codes(options["batch_size"], options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired reset code(s)"))
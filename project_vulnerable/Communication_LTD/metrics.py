@@ -0,0 +1,314 @@
+"""
+Per-request instrumentation and a Prometheus text endpoint.
+
+RequestMetricsMiddleware times every request and labels it with the URL name
+of the view that handled it. While the request runs, a context variable
+collects:
+
+- the number of SQL queries and the time spent in them, through a database
+  execute wrapper installed on every new connection (see apps.py),
+- the time spent hashing or verifying passwords, whether inline or waiting
+  on the hashing pool (see executor.py and utils.py).
+
+Everything is aggregated in process memory: a few dict lookups and one lock
+per request, so it can stay enabled in production. GET /metrics renders the
+counters in the Prometheus text format, together with the password policy
+and user caches, hashing pool and mail queue statistics. Each
+worker process reports its own numbers; Prometheus sums them per instance.
+
+/metrics answers METRICS_ALLOWED_IPS only. Behind a reverse proxy on the
+same host every client arrives from 127.0.0.1, so the address proves
+nothing: with METRICS_TOKEN set (config/settings_production.py always
+sets it) the request must also carry "Authorization: Bearer <token>".
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar("Communication_LTD_request_metrics", default=None)
+
+
+class RequestStats:
+    """What one request spent its time on"""
+
+    __slots__ = ("queries", "query_seconds", "hashes", "hash_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.hashes = 0
+        self.hash_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class ViewMetrics:
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.hashes = 0
+        self.hash_seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, status, seconds, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics(self.buckets)
+            metrics.latency.observe(seconds)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.queries += stats.queries
+            metrics.query_seconds += stats.query_seconds
+            metrics.hashes += stats.hashes
+            metrics.hash_seconds += stats.hash_seconds
+
+    def snapshot(self):
+        """A consistent copy of the per-view metrics"""
+        with self._lock:
+            copy = {}
+            for view, metrics in self._views.items():
+                clone = ViewMetrics(self.buckets)
+                clone.latency.counts = list(metrics.latency.counts)
+                clone.latency.sum = metrics.latency.sum
+                clone.statuses = dict(metrics.statuses)
+                clone.queries = metrics.queries
+                clone.query_seconds = metrics.query_seconds
+                clone.hashes = metrics.hashes
+                clone.hash_seconds = metrics.hash_seconds
+                copy[view] = clone
+            return copy
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry(getattr(settings, "METRICS_BUCKETS", DEFAULT_BUCKETS))
+
+
+# COLLECTION
+
+def query_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper that adds each query to the current request"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created receiver (connected in apps.py)"""
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def record_hash(seconds, count=1):
+    stats = _current.get()
+    if stats is not None:
+        stats.hashes += count
+        stats.hash_seconds += seconds
+
+
+@contextmanager
+def timed_hash(count=1):
+    """Count the enclosed block as password hashing time of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_hash(time.perf_counter() - started, count)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def _record(self, request, response, seconds, stats):
+        match = request.resolver_match
+        # Label by URL name, never by raw path, so the number of series stays bounded
+        view = (match.url_name or match.view_name) if match else "unresolved"
+        registry.record(view, response.status_code, seconds, stats)
+
+
+# EXPOSITION
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_float(value):
+    return repr(float(value))
+
+
+def render_metrics():
+    """The current metrics in the Prometheus text exposition format"""
+    from .executor import get_executor
+    from .mailqueue import mail_queue_stats
+    from .policy import policy_cache_stats
+    from .replica import is_configured, replica_stats
+    from .usercache import user_cache_stats
+
+    views = registry.snapshot()
+    lines = []
+
+    def header(name, kind, text):
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    header("http_request_duration_seconds", "histogram", "Request latency by view.")
+    for view, metrics in sorted(views.items()):
+        label = f'view="{_escape_label(view)}"'
+        cumulative = 0
+        for bound, count in zip(registry.buckets + (None,), metrics.latency.counts):
+            cumulative += count
+            le = "+Inf" if bound is None else _format_float(bound)
+            lines.append(f'http_request_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+        lines.append(f"http_request_duration_seconds_sum{{{label}}} {_format_float(metrics.latency.sum)}")
+        lines.append(f"http_request_duration_seconds_count{{{label}}} {cumulative}")
+
+    header("http_responses_total", "counter", "Responses by view and status code.")
+    for view, metrics in sorted(views.items()):
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append(f'http_responses_total{{view="{_escape_label(view)}",status="{status}"}} {count}')
+
+    per_view = [
+        ("db_queries_total", "SQL queries executed, by view.", "queries"),
+        ("db_query_seconds_total", "Time spent in SQL queries, by view.", "query_seconds"),
+        ("password_hashes_total", "Password hash and verify operations, by view.", "hashes"),
+        ("password_hash_seconds_total", "Time spent hashing passwords (including pool queueing), by view.", "hash_seconds"),
+    ]
+    for name, text, attribute in per_view:
+        header(name, "counter", text)
+        for view, metrics in sorted(views.items()):
+            value = getattr(metrics, attribute)
+            if isinstance(value, float):
+                value = _format_float(value)
+            lines.append(f'{name}{{view="{_escape_label(view)}"}} {value}')
+
+    header("password_policy_cache_events_total", "counter", "Password policy cache lookups and reloads.")
+    for event, count in sorted(policy_cache_stats().items()):
+        lines.append(f'password_policy_cache_events_total{{event="{event}"}} {count}')
+
+    users = user_cache_stats()
+    header("user_cache_events_total", "counter", "Session user cache lookups and invalidations.")
+    for event in ("hits", "misses", "invalidations"):
+        lines.append(f'user_cache_events_total{{event="{event}"}} {users[event]}')
+    header("user_cache_size", "gauge", "Users held in the session user cache.")
+    lines.append(f"user_cache_size {users['size']}")
+
+    executor = get_executor().stats()
+    header("password_hashing_pool_in_flight", "gauge", "Hashes running or queued in the hashing pool.")
+    lines.append(f"password_hashing_pool_in_flight {executor['in_flight']}")
+    header("password_hashing_pool_capacity", "gauge", "Workers plus queue slots of the hashing pool.")
+    lines.append(f"password_hashing_pool_capacity {executor['capacity']}")
+    header("password_hashing_pool_rejected_total", "counter", "Hashes rejected because the pool was full.")
+    lines.append(f"password_hashing_pool_rejected_total {executor['rejected']}")
+
+    queue = mail_queue_stats()
+    header("mail_queue_pending", "gauge", "Queued emails not delivered yet.")
+    lines.append(f"mail_queue_pending {queue['pending']}")
+    header("mail_queue_failed", "gauge", "Queued emails given up on after MAX_ATTEMPTS.")
+    lines.append(f"mail_queue_failed {queue['failed']}")
+    header("mail_queue_oldest_pending_seconds", "gauge", "Age of the oldest undelivered email.")
+    lines.append(f"mail_queue_oldest_pending_seconds {_format_float(queue['oldest_pending_seconds'])}")
+    header("mail_queue_deliveries_total", "counter", "Delivery attempts by this process, by outcome.")
+    for outcome in ("sent", "retried", "failed"):
+        lines.append(f'mail_queue_deliveries_total{{outcome="{outcome}"}} {queue[outcome + "_total"]}')
+    header("mail_queue_delivery_seconds_total", "counter", "Sum of enqueue-to-delivery times of sent emails.")
+    lines.append(f"mail_queue_delivery_seconds_total {_format_float(queue['delivery_seconds_total'])}")
+
+    if is_configured():
+        replica = replica_stats()
+        header("db_replica_reads_total", "counter", "Routed reads, by the database that served them and why.")
+        lines.append(f'db_replica_reads_total{{database="replica",reason="fresh"}} {replica["reads"]}')
+        for reason in ("pinned", "transaction", "lag"):
+            lines.append(f'db_replica_reads_total{{database="primary",reason="{reason}"}} {replica["fallback_" + reason]}')
+        header("db_replica_lag_seconds", "gauge", "Age of the read replica copy (-1 if there is none).")
+        lag = replica["lag_seconds"]
+        lines.append(f"db_replica_lag_seconds {_format_float(-1 if lag is None else lag)}")
+        header("db_replica_refreshes_total", "counter", "Replica refreshes by this process, by outcome.")
+        lines.append(f'db_replica_refreshes_total{{outcome="ok"}} {replica["refreshes"]}')
+        lines.append(f'db_replica_refreshes_total{{outcome="error"}} {replica["refresh_errors"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def token_matches(request):
+    """True if METRICS_TOKEN is None or the request carries "Authorization: Bearer <METRICS_TOKEN>" """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token is None:
+        return True
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    # An empty token (required but not configured) matches nothing
+    return bool(token) and scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def metrics_view(request):
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+    if allowed and request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponseForbidden()
+    if not token_matches(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
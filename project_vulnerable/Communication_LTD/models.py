@@ -21,6 +21,10 @@ class PasswordHistory(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The reuse check and pruning read a user's newest entries
+            models.Index(fields=['user', '-created_at'], name='password_history_user_idx'),
+        ]
 
 
 
@@ -30,6 +34,12 @@ class Client(models.Model):
     email = models.EmailField(null=True, blank=True)
     phone = models.CharField(max_length=15)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='client_name_idx'),
+            models.Index(fields=['email'], name='client_email_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -38,4 +48,51 @@ class Client(models.Model):
 class ResetCode(models.Model):
     username = models.CharField(max_length=100, unique=True)
     code_hash = models.CharField(max_length=40) # SHA-1 hex is 40 chars
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # purge_reset_codes deletes by age
+            models.Index(fields=['created_at'], name='reset_code_created_idx'),
+        ]
+
+
+class OutboundEmail(models.Model):
+    """A mail waiting in (or delivered from) the outbox, see mailqueue.py"""
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.TextField()
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The dispatcher's "what is due" query
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
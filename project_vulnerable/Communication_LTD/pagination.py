@@ -0,0 +1,86 @@
+"""
+Keyset (seek) pagination for the dashboard client list.
+
+Instead of OFFSET, each page is fetched with "WHERE id > last_seen_id ORDER BY
+id LIMIT n" (or the reverse for the previous page), which the primary key
+index answers directly. The cost of a page is the same whether it is the
+first or the ten-thousandth.
+
+The position is carried in the URL as a signed, opaque cursor token, so
+clients cannot craft arbitrary values.
+"""
+from django.core import signing
+
+CURSOR_SALT = "Communication_LTD.pagination.cursor"
+NEXT = "n"
+PREVIOUS = "p"
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(pk, direction):
+    return signing.dumps([pk, direction], salt=CURSOR_SALT)
+
+
+def decode_cursor(token):
+    """Return (pk, direction) for a valid token, None for a missing or tampered one"""
+    if not token:
+        return None
+    try:
+        pk, direction = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if not isinstance(pk, int) or direction not in (NEXT, PREVIOUS):
+        return None
+    return pk, direction
+
+
+def keyset_paginate(queryset, cursor=None, page_size=50):
+    """Return the KeysetPage of queryset (ordered by id) that the cursor points at"""
+    position = decode_cursor(cursor)
+
+    if position is None:
+        rows = list(queryset.order_by("id")[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        has_next, has_previous = more, False
+    else:
+        pk, direction = position
+        if direction == NEXT:
+            rows = list(queryset.filter(id__gt=pk).order_by("id")[:page_size + 1])
+            more = len(rows) > page_size
+            rows = rows[:page_size]
+            has_next, has_previous = more, True
+        else:
+            rows = list(queryset.filter(id__lt=pk).order_by("-id")[:page_size + 1])
+            more = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next, has_previous = True, more
+
+    if not rows:
+        return KeysetPage([])
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1].id, NEXT) if has_next else None,
+        previous_cursor=encode_cursor(rows[0].id, PREVIOUS) if has_previous else None,
+    )
@@ -0,0 +1,192 @@
+"""
+Password policy loaded from passwordConfig.json.
+
+The file is parsed once per process and kept in memory as a frozen
+PasswordPolicy. Every call to get_policy() checks the file's inode, mtime
+and size (at most once per PASSWORD_POLICY_CHECK_INTERVAL seconds) and
+swaps in a freshly validated policy when the file has changed.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Complexity:
+    uppercase: bool = True
+    lowercase: bool = True
+    digits: bool = True
+    special: bool = True
+
+
+@dataclass(frozen=True)
+class PasswordPolicy:
+    min_length: int
+    complexity: Complexity
+    history_count: int = 3
+    max_failed_logins: int = 3
+    prevent_reuse: bool = True
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a policy from the parsed JSON, raising ImproperlyConfigured if invalid"""
+        if not isinstance(data, dict):
+            raise ImproperlyConfigured("Password policy must be a JSON object")
+
+        complexity = data.get("complexity", {})
+        if not isinstance(complexity, dict):
+            raise ImproperlyConfigured("'complexity' must be a JSON object")
+        for key, value in complexity.items():
+            if key not in Complexity.__dataclass_fields__:
+                raise ImproperlyConfigured(f"Unknown complexity rule '{key}'")
+            _require(isinstance(value, bool), f"complexity.{key} must be true or false")
+
+        if "min_length" not in data:
+            raise ImproperlyConfigured("Password policy is missing 'min_length'")
+
+        policy = cls(
+            min_length=data["min_length"],
+            complexity=Complexity(**complexity),
+            history_count=data.get("history_count", 3),
+            max_failed_logins=data.get("max_failed_logins", 3),
+            prevent_reuse=data.get("prevent_reuse", True),
+        )
+
+        _require(_is_int(policy.min_length) and policy.min_length > 0,
+                 "min_length must be a positive integer")
+        _require(_is_int(policy.history_count) and policy.history_count >= 0,
+                 "history_count must be a non-negative integer")
+        _require(_is_int(policy.max_failed_logins) and policy.max_failed_logins > 0,
+                 "max_failed_logins must be a positive integer")
+        _require(isinstance(policy.prevent_reuse, bool), "prevent_reuse must be true or false")
+        return policy
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _require(condition, message):
+    if not condition:
+        raise ImproperlyConfigured(f"Invalid password policy: {message}")
+
+
+class PolicyCache:
+    """Holds the current policy for one file and reloads it when the file changes"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._policy = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    def get(self):
+        policy = self._policy
+        if policy is not None and time.monotonic() - self._checked_at < self.check_interval:
+            self.hits += 1
+            return policy
+
+        with self._lock:
+            now = time.monotonic()
+            try:
+                signature = self._stat()
+            except OSError:
+                if self._policy is None:
+                    raise
+                return self._keep_current(now, "Password policy file is unreadable")
+
+            if self._policy is not None and signature == self._signature:
+                self._checked_at = now
+                self.hits += 1
+                return self._policy
+
+            self.misses += 1
+            try:
+                policy = self._load()
+            except (OSError, ValueError, ImproperlyConfigured):
+                if self._policy is None:
+                    raise
+                return self._keep_current(now, "Password policy reload failed")
+
+            if self._policy is not None:
+                self.reloads += 1
+                logger.info("Reloaded password policy from %s", self.path)
+
+            # A single reference swap, so readers see either the old or the new policy
+            self._policy = policy
+            self._signature = signature
+            self._checked_at = now
+            return policy
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+    def _keep_current(self, now, message):
+        # Keep serving the last good policy rather than failing every login
+        self.errors += 1
+        self._checked_at = now
+        logger.exception("%s; keeping the previous policy (%s)", message, self.path)
+        return self._policy
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            return PasswordPolicy.from_dict(json.load(f))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PolicyCache(
+                    getattr(settings, "PASSWORD_POLICY_FILE", settings.BASE_DIR / "passwordConfig.json"),
+                    getattr(settings, "PASSWORD_POLICY_CHECK_INTERVAL", 1.0),
+                )
+    return _cache
+
+
+def get_policy():
+    """Return the current PasswordPolicy, reloading passwordConfig.json if it changed"""
+    return _get_cache().get()
+
+
+def policy_cache_stats():
+    """Hit/miss/reload counters of the process-wide policy cache"""
+    return _get_cache().stats()
+
+
+def reset_policy_cache():
+    """Drop the cached policy so the next get_policy() reads the file again"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,250 @@
+"""
+Bulk user provisioning.
+
+Creates accounts from a user file (CSV with a header row, or one JSON object
+per line, with username, email and password columns) with the same rules as
+the register form, for tens of thousands of rows at a time:
+
+- the file is read as a stream (bulk.iter_rows()) and validated one batch at
+  a time: the password policy with audit.batch_failures() and one dictionary
+  lookup per batch, duplicates within the file, and usernames or emails that
+  are already taken with one query per batch;
+- the passwords of a batch are hashed in a pool of its own (a process pool by
+  default), not in the request hashing pool, so provisioning never takes
+  hashing slots away from logins. The previous batch is inserted while the
+  next one is being hashed. The pool is started once per process and kept;
+  its worker processes are spawned, not forked, since the web process
+  already runs the mail dispatcher and replica refresher threads;
+- User and PasswordHistory rows are written with bulk_create, one transaction
+  per batch. If the batch hits a unique constraint (someone registered the
+  same name in the meantime), it is retried row by row so that only the
+  conflicting rows are rejected.
+
+A bad row is reported with its line number and skipped; it never aborts the
+rest of the file. Run it with `manage.py provision_users`, or POST the file
+to /users/provision/ with the token from USER_PROVISIONING["TOKEN"].
+"""
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from . import audit
+from .bulk import ImportResult
+from .dictionary import get_dictionary
+from .executor import _encode
+from .hashers import get_hasher
+from .models import PasswordHistory, User
+from .policy import get_policy
+from .utils import is_valid_email, password_rule_message
+
+FIELDS = ("username", "email", "password")
+
+DEFAULTS = {
+    "BATCH_SIZE": 500,
+    "POOL": "process",
+    "WORKERS": None,
+    "TOKEN": None,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "USER_PROVISIONING", {})}
+
+
+def token_matches(request):
+    """True if the request carries "Authorization: Bearer <USER_PROVISIONING["TOKEN"]>" """
+    token = get_options()["TOKEN"]
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+_pools = {}  # (kind, workers) -> executor
+_pools_lock = threading.Lock()
+
+
+def hashing_pool(kind, workers):
+    """The process-wide pool of this kind and size; None for "inline" (hash on the calling thread)"""
+    if kind == "inline":
+        return None
+    if kind not in ("process", "thread"):
+        raise ImproperlyConfigured(f"Unknown provisioning pool '{kind}'")
+    with _pools_lock:
+        pool = _pools.get((kind, workers))
+        if pool is None:
+            if kind == "process":
+                # A forked child would inherit the parent's threads' locks in whatever state they were in
+                pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                pool = ThreadPoolExecutor(workers, thread_name_prefix="provisioning")
+            _pools[(kind, workers)] = pool
+    return pool
+
+
+def _discard_pool(kind, workers, pool):
+    with _pools_lock:
+        if _pools.get((kind, workers)) is pool:
+            del _pools[(kind, workers)]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def validate_row(row, sanitize=None):
+    """Return (cleaned fields, None) or (None, error message); the password policy is checked per batch"""
+    if row is None:
+        return None, "Malformed row"
+
+    values = {field: str(row.get(field) or "") for field in FIELDS}
+    values["username"] = values["username"].strip()
+    values["email"] = values["email"].strip()
+    if sanitize:
+        values = {field: sanitize(value) for field, value in values.items()}
+
+    if not values["username"]:
+        return None, "Username is required"
+    if len(values["username"]) > User._meta.get_field("username").max_length:
+        return None, "Username is too long"
+    if not is_valid_email(values["email"]) or len(values["email"]) > User._meta.get_field("email").max_length:
+        return None, "Email is not valid"
+    if not values["password"]:
+        return None, "Password is required"
+    return values, None
+
+
+class _Provisioner:
+    def __init__(self, pool, workers, sanitize, result):
+        self.pool = pool
+        self.workers = workers
+        self.sanitize = sanitize
+        self.result = result
+        self.policy = get_policy()
+        self.dictionary = get_dictionary()
+        self.hasher = get_hasher()
+        self.usernames = set()
+        self.emails = set()
+
+    def validate(self, rows):
+        """The accounts of a batch that may be created, as (line number, fields) pairs"""
+        candidates = []
+        for line_number, row in rows:
+            values, error = validate_row(row, self.sanitize)
+            if error:
+                self.result.add_error(line_number, error)
+            else:
+                candidates.append((line_number, values))
+
+        passwords = [values["password"] for _, values in candidates]
+        masks = audit.batch_failures(passwords, self.policy)
+        for i, common in enumerate(self.dictionary.contains_many(passwords)):
+            if common and not masks[i]:
+                masks[i] = audit.COMMON
+
+        taken = User.objects.filter(
+            Q(username__in=[values["username"] for _, values in candidates])
+            | Q(email__in=[values["email"] for _, values in candidates])
+        ).values_list("username", "email")
+        for username, email in taken:
+            self.usernames.add(username)
+            self.emails.add(email)
+
+        accounts = []
+        for (line_number, values), mask in zip(candidates, masks):
+            message = password_rule_message(mask, self.policy)
+            if message:
+                self.result.add_error(line_number, message)
+                continue
+            if values["username"] in self.usernames or values["email"] in self.emails:
+                self.result.add_error(line_number, "Username or email already used")
+                continue
+            self.usernames.add(values["username"])
+            self.emails.add(values["email"])
+            accounts.append((line_number, values))
+        return accounts
+
+    def hash(self, accounts):
+        """Start hashing the batch; returns an iterator of (encoded hash, salt)"""
+        salts = [os.urandom(16).hex() for _ in accounts]
+        args = (
+            [self.hasher.algorithm] * len(accounts),
+            [self.hasher.params] * len(accounts),
+            [values["password"] for _, values in accounts],
+            salts,
+        )
+        if self.pool is None:
+            hashes = map(_encode, *args)
+        else:
+            chunksize = max(1, len(accounts) // (self.workers * 4))
+            hashes = self.pool.map(_encode, *args, chunksize=chunksize)
+        return zip(hashes, salts)
+
+    def insert(self, accounts, hashes):
+        users = [
+            User(username=values["username"], email=values["email"], password_hash=hashed, salt=salt)
+            for (_, values), (hashed, salt) in zip(accounts, hashes)
+        ]
+        if not users:
+            return
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                PasswordHistory.objects.bulk_create(
+                    PasswordHistory(user=user, password_hash=user.password_hash, salt=user.salt) for user in users
+                )
+        except IntegrityError:
+            # Someone took one of these names since the batch was checked
+            self._insert_one_by_one(accounts, users)
+            return
+        self.result.created += len(users)
+
+    def _insert_one_by_one(self, accounts, users):
+        for (line_number, _), user in zip(accounts, users):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    PasswordHistory.objects.create(user=user, password_hash=user.password_hash, salt=user.salt)
+            except IntegrityError:
+                self.result.add_error(line_number, "Username or email already used")
+            else:
+                self.result.created += 1
+
+
+def provision_users(rows, batch_size=None, pool=None, workers=None, sanitize=None):
+    """Validate, hash and insert (line number, row) pairs in batches; returns a bulk.ImportResult"""
+    options = get_options()
+    batch_size = batch_size or options["BATCH_SIZE"]
+    workers = workers or options["WORKERS"] or os.cpu_count() or 1
+    result = ImportResult()
+    started = time.perf_counter()
+
+    kind = pool or options["POOL"]
+    executor = hashing_pool(kind, workers)
+    provisioner = _Provisioner(executor, workers, sanitize, result)
+    previous = None
+    try:
+        for rows_batch in audit.iter_batches(rows, batch_size):
+            accounts = provisioner.validate(rows_batch)
+            hashes = provisioner.hash(accounts)
+            # Insert the previous batch while this one is being hashed
+            if previous is not None:
+                provisioner.insert(*previous)
+            previous = (accounts, hashes)
+        if previous is not None:
+            provisioner.insert(*previous)
+    except BrokenExecutor:
+        # A worker died; the next run starts a new pool
+        _discard_pool(kind, workers, executor)
+        raise
+
+    # Each batch reports row errors before policy and duplicate errors
+    result.errors.sort(key=lambda error: error["line"])
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,385 @@
+"""
+Read replica for the read-heavy pages.
+
+With DATABASE_ROUTERS = ["Communication_LTD.replica.ReplicaRouter"] (see
+config/settings_production.py), reads of the models in READ_REPLICA["MODELS"]
+(Client and User) go to the READ_REPLICA["ALIAS"] database, a read-only
+SQLite connection ("file:...?mode=ro"), so the dashboard's client listing
+does not take locks on the file that logins write to. Writes always go to
+the primary (READ_REPLICA["PRIMARY"]). The replica is either:
+
+- a copy of the primary in a file of its own, refreshed with the SQLite
+  backup API every REFRESH_INTERVAL seconds, by a daemon thread in the web
+  process (REFRESHER "thread") or by `manage.py refresh_replica` (REFRESHER
+  "command");
+- or the primary's own file opened read-only (a WAL reader), which never
+  lags and needs no refresh.
+
+A copy lags behind the primary, so reads stay on the primary:
+
+- during unsafe requests (POST, ...), which check what they are about to
+  change (logins, password resets, registration);
+- for PIN_SECONDS after a request that wrote to the primary, through a
+  cookie set by ReplicaPinMiddleware, so a client reads its own writes;
+- outside requests (management commands, scripts), in a thread that wrote,
+  until the copy has been refreshed since;
+- inside a transaction on the primary, and inside use_primary();
+- when the copy is missing or more than MAX_LAG seconds old.
+
+A refresh replaces the file, so a connection only sees the copy that was
+current when it was opened: config/settings_production.py closes replica
+connections at the end of every request (CONN_MAX_AGE 0).
+
+read_after() goes one step further for data cached under a change time:
+the client list cache (clientcache.py) only renders from a copy taken after
+the client list last changed, so a stale page is never cached.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import unquote, urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ALIAS": "replica",
+    "PRIMARY": "default",
+    "MODELS": ["Communication_LTD.Client", "Communication_LTD.User"],
+    "MAX_LAG": 10,
+    "REFRESHER": "thread",
+    "REFRESH_INTERVAL": 2,
+    "PIN_SECONDS": 10,
+    "PIN_COOKIE": "replica_pin",
+}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLAC")
+
+_pinned = ContextVar("Communication_LTD_replica_pinned", default=False)
+_request = ContextVar("Communication_LTD_replica_request", default=None)
+# When this thread last wrote to the primary outside a request
+_thread_writes = threading.local()
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "READ_REPLICA", {})}
+
+
+def _database_path(alias):
+    name = str(settings.DATABASES[alias]["NAME"])
+    if name.startswith("file:"):
+        return os.path.abspath(unquote(urlsplit(name).path))
+    return os.path.abspath(name)
+
+
+def primary_alias():
+    return get_options()["PRIMARY"]
+
+
+def is_configured(options=None):
+    options = options or get_options()
+    return options["ALIAS"] in settings.DATABASES
+
+
+def is_copy(options=None):
+    """True if the replica is a file of its own (refreshed), False for a WAL reader"""
+    options = options or get_options()
+    return _database_path(options["ALIAS"]) != _database_path(options["PRIMARY"])
+
+
+def refreshed_at(options=None):
+    """When the data in the replica was read from the primary (epoch seconds), or None if there is no copy"""
+    options = options or get_options()
+    if not is_copy(options):
+        return time.time()
+    try:
+        return os.stat(_database_path(options["ALIAS"])).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def replica_lag(options=None):
+    """Seconds the replica may be behind the primary, or None if there is no copy"""
+    stamp = refreshed_at(options)
+    if stamp is None:
+        return None
+    return max(0.0, time.time() - stamp)
+
+
+# ROUTING
+
+class _RequestState:
+    __slots__ = ("wrote",)
+
+    def __init__(self):
+        self.wrote = False
+
+
+@contextmanager
+def use_primary(pin=True):
+    """Read from the primary inside the block (if pin)"""
+    if not pin:
+        yield
+        return
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def read_after(timestamp):
+    """Read from the replica inside the block only if it was refreshed after timestamp (epoch seconds)"""
+    if timestamp is None:
+        return use_primary()
+    stamp = refreshed_at() if is_configured() else None
+    return use_primary(stamp is None or stamp <= timestamp)
+
+
+class ReplicaStats:
+    def __init__(self):
+        self.reads = 0
+        self.fallbacks = {"pinned": 0, "transaction": 0, "lag": 0}
+        self._lock = threading.Lock()
+
+    def count(self, reason=None):
+        with self._lock:
+            if reason is None:
+                self.reads += 1
+            else:
+                self.fallbacks[reason] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"reads": self.reads, **{f"fallback_{reason}": n for reason, n in self.fallbacks.items()}}
+
+
+stats = ReplicaStats()
+
+
+class ReplicaRouter:
+    """Client and User reads to the replica when it is fresh enough, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        options = get_options()
+        if model._meta.label not in options["MODELS"] or not is_configured(options):
+            return options["PRIMARY"]
+        reason = self._primary_reason(options)
+        stats.count(reason)
+        return options["PRIMARY"] if reason else options["ALIAS"]
+
+    def db_for_write(self, model, **hints):
+        return get_options()["PRIMARY"]
+
+    def allow_relation(self, obj1, obj2, **hints):
+        options = get_options()
+        databases = {options["PRIMARY"], options["ALIAS"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The copy gets the schema with the data; a WAL reader shares it
+        if db == get_options()["ALIAS"]:
+            return False
+        return None
+
+    def _primary_reason(self, options):
+        if _pinned.get():
+            return "pinned"
+        if connections[options["PRIMARY"]].in_atomic_block:
+            return "transaction"
+        if is_copy(options):
+            start_refresher(options)
+            stamp = refreshed_at(options)
+            if stamp is None or time.time() - stamp > options["MAX_LAG"]:
+                return "lag"
+            wrote_at = getattr(_thread_writes, "at", None)
+            if wrote_at is not None and stamp <= wrote_at:
+                return "pinned"
+        return None
+
+
+def _mark_thread_write():
+    _thread_writes.at = time.time()
+
+
+def track_writes(execute, sql, params, many, context):
+    """Execute wrapper on the primary that marks the current request (or thread) as having written"""
+    if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        state = _request.get()
+        if state is not None:
+            state.wrote = True
+        else:
+            _mark_thread_write()
+            connection = context["connection"]
+            if connection.in_atomic_block:
+                # A refresh between this statement and the commit misses the row
+                transaction.on_commit(_mark_thread_write, using=connection.alias)
+    return execute(sql, params, many, context)
+
+
+def install_write_tracker(sender, connection, **kwargs):
+    """connection_created receiver (connected in apps.py)"""
+    options = get_options()
+    if not is_configured(options) or connection.alias != options["PRIMARY"]:
+        return
+    if track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_writes)
+
+
+class ReplicaPinMiddleware:
+    """Keeps unsafe requests, and a client's requests for PIN_SECONDS after it wrote, on the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        options = get_options()
+        state = _RequestState()
+        request_token = _request.set(state)
+        pinned_token = _pinned.set(self._pinned(request, options))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(pinned_token)
+            _request.reset(request_token)
+        return self._pin(response, state, options)
+
+    async def __acall__(self, request):
+        options = get_options()
+        state = _RequestState()
+        request_token = _request.set(state)
+        pinned_token = _pinned.set(self._pinned(request, options))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(pinned_token)
+            _request.reset(request_token)
+        return self._pin(response, state, options)
+
+    def _pinned(self, request, options):
+        return request.method not in SAFE_METHODS or options["PIN_COOKIE"] in request.COOKIES
+
+    def _pin(self, response, state, options):
+        if state.wrote:
+            response.set_cookie(
+                options["PIN_COOKIE"], "1", max_age=options["PIN_SECONDS"],
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite="Lax",
+            )
+        return response
+
+
+# REFRESHING
+
+def refresh_replica(options=None):
+    """Copy the primary into the replica file with the SQLite backup API; returns the seconds it took"""
+    options = options or get_options()
+    if not is_copy(options):
+        return 0.0
+    primary = _database_path(options["PRIMARY"])
+    path = _database_path(options["ALIAS"])
+    timeout = settings.DATABASES[options["PRIMARY"]].get("OPTIONS", {}).get("timeout", 5)
+
+    # Anything committed before this moment is in the copy: the backup's read
+    # transaction starts after it. The file's mtime is set to it afterwards.
+    started = time.time()
+    # The copy is built next to the replica and renamed over it, so readers
+    # never open a half-written file, and it is switched from WAL to a
+    # rollback journal, so read-only connections need no -wal or -shm file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        source = sqlite3.connect(primary, timeout=timeout)
+        try:
+            target = sqlite3.connect(temporary, timeout=timeout)
+            try:
+                source.backup(target)
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+        finally:
+            source.close()
+        os.utime(temporary, (started, started))
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return time.time() - started
+
+
+class ReplicaRefresher:
+    """Daemon thread that refreshes the copy every interval seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.refreshes = 0
+        self.errors = 0
+        self.last_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="replica-refresher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def refresh(self):
+        options = get_options()
+        # Other worker processes refresh the same file; skip if one just did
+        lag = replica_lag(options)
+        if lag is not None and lag < self.interval / 2:
+            return
+        try:
+            self.last_seconds = refresh_replica(options)
+            self.refreshes += 1
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            logger.exception("Replica refresh failed")
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher(options=None):
+    """Start the in-process refresher on first use, if one is configured"""
+    global _refresher
+    if _refresher is not None:
+        return
+    options = options or get_options()
+    if options["REFRESHER"] != "thread" or not options["REFRESH_INTERVAL"] or not is_copy(options):
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            refresher = ReplicaRefresher(options["REFRESH_INTERVAL"])
+            refresher.start()
+            _refresher = refresher
+
+
+def replica_stats():
+    """Routing counters, lag and refresh counters of this process"""
+    options = get_options()
+    snapshot = stats.snapshot()
+    snapshot["lag_seconds"] = replica_lag(options)
+    snapshot["refreshes"] = _refresher.refreshes if _refresher else 0
+    snapshot["refresh_errors"] = _refresher.errors if _refresher else 0
+    snapshot["last_refresh_seconds"] = _refresher.last_seconds if _refresher else 0.0
+    return snapshot
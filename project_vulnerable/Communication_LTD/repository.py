@@ -0,0 +1,130 @@
+"""
+Raw-SQL data access of the vulnerable views (views.py and async_views.py).
+
+VULNERABLE VERSION: statements that take user input still paste it into the
+SQL text, so the SQL injection demos of login, register and the dashboard
+work exactly as before. Everything else is a fixed statement with
+placeholders, kept as a module constant, so sqlite3's per-connection
+statement cache (DATABASES OPTIONS "cached_statements") compiles it once per
+connection instead of on every request.
+
+Login takes one SELECT, plus one UPDATE only when the account gets locked.
+It used to take up to four round trips: the salt, the username + hash match,
+a re-read of the id to count the failure, and the UPDATE. find_login() reads
+the user and checks the password in the same statement:
+
+- the password is bound as a parameter, in a CTE before any user input, so
+  the placeholder is always there to bind;
+- verify_password() is a SQL function registered on every SQLite connection
+  (register_sql_functions(), connected in apps.py). It verifies in the
+  hashing pool, like the views do;
+- the password check sits on the same line as the injected username, so
+  `admin' --` still comments it out and logs in as admin. password_ok is
+  then true without any password having been checked, so the views verify
+  the password again before they upgrade a legacy hash with it.
+"""
+import threading
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .executor import HashingQueueFull, offload_verify_password
+
+LoginRow = namedtuple("LoginRow", "id username failed_login_attempts is_locked password_hash salt password_ok")
+
+# VULNERABLE: username is pasted in twice. Keep the line breaks: `--` only
+# comments out the rest of its own line.
+LOGIN_QUERY = """WITH attempt (password) AS (SELECT %s)
+SELECT u.id, u.username, u.failed_login_attempts, u.is_locked, u.password_hash, u.salt,
+    EXISTS (SELECT 1 FROM attempt WHERE u.username = '{username}' AND verify_password(attempt.password, u.salt, u.password_hash)
+    ) AS password_ok
+FROM Communication_LTD_user AS u
+WHERE u.username = '{username}'"""
+
+LOCK_USER = "UPDATE Communication_LTD_user SET failed_login_attempts = %s, is_locked = 1 WHERE id = %s"
+
+INSERT_PASSWORD_HISTORY = (
+    "INSERT INTO Communication_LTD_passwordhistory (user_id, password_hash, salt, created_at) VALUES (%s, %s, %s, %s)"
+)
+
+# A HashingQueueFull raised inside verify_password(), re-raised after the query
+_sql_errors = threading.local()
+
+
+def _sql_verify_password(password, salt, encoded):
+    if password is None or salt is None or encoded is None:
+        return 0
+    try:
+        return int(offload_verify_password(password, salt, encoded))
+    except HashingQueueFull as exc:
+        # sqlite3 would turn it into an OperationalError; the view must see it (503)
+        _sql_errors.exception = exc
+        return None
+
+
+def register_sql_functions(sender, connection, **kwargs):
+    """connection_created receiver (connected in apps.py)"""
+    if connection.vendor != "sqlite":
+        return
+    connection.connection.create_function("verify_password", 3, _sql_verify_password)
+
+
+def find_login(username, password):
+    """
+    The LoginRow of the user, with password_ok telling whether the password
+    matched, or None if there is no such user. One query.
+    """
+    _sql_errors.exception = None
+    with connection.cursor() as cursor:
+        # VULNERABLE: SQL Injection - username is not parameterized. With a
+        # parameter bound, a % in the SQL text must be written %%; the backend
+        # turns it back into %, so the injected SQL is exactly what was typed.
+        cursor.execute(LOGIN_QUERY.format(username=str(username).replace("%", "%%")), [password])
+        row = cursor.fetchone()
+    exception, _sql_errors.exception = _sql_errors.exception, None
+    if exception is not None:
+        raise exception
+    if row is None:
+        return None
+    return LoginRow(*row[:6], bool(row[6]))
+
+
+def lock_user(user_id, failed_attempts):
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_USER, [failed_attempts, user_id])
+
+
+def user_exists(username, email):
+    """True if the username or email is taken"""
+    with connection.cursor() as cursor:
+        # VULNERABLE: SQL Injection - NO ESCAPING
+        cursor.execute(
+            f"SELECT COUNT(*) FROM Communication_LTD_user WHERE username = '{username}' OR email = '{email}'"
+        )
+        return cursor.fetchone()[0] > 0
+
+
+def create_user(username, email, password_hash, salt):
+    """Insert the user and its first password history entry in one transaction; returns the new id"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # VULNERABLE: SQL Injection - NO ESCAPING
+            cursor.execute(
+                f"INSERT INTO Communication_LTD_user (username, email, password_hash, salt, failed_login_attempts, is_locked) VALUES ('{username}', '{email}', '{password_hash}', '{salt}', 0, 0)"
+            )
+            user_id = cursor.lastrowid
+            # A new user has no older entries to prune
+            cursor.execute(
+                INSERT_PASSWORD_HISTORY,
+                [user_id, password_hash, salt, connection.ops.adapt_datetimefield_value(timezone.now())],
+            )
+    return user_id
+
+
+def add_client(name, email, phone):
+    with connection.cursor() as cursor:
+        # VULNERABLE: SQL Injection - NO ESCAPING
+        cursor.execute(
+            f"INSERT INTO Communication_LTD_client (name, email, phone) VALUES ('{name}', '{email}', '{phone}')"
+        )
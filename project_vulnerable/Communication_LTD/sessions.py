@@ -0,0 +1,169 @@
+"""
+Database session store that writes less and cleans up after itself.
+
+SESSION_ENGINE = "Communication_LTD.sessions" (config/settings.py) keeps
+sessions in the django_session table like django.contrib.sessions' db
+backend, with these differences:
+
+- A session whose data did not change is not written again. Setting a key
+  to the value it already has (logging in again, for one) marks the session
+  modified; Django would UPDATE the row with the same data. Here it is only
+  rewritten once less than half of its lifetime is left, so an active
+  client still never gets logged out early.
+- Deleting a session (logout flushes it) is a single DELETE instead of a
+  SELECT and a DELETE, and a new session key is INSERTed straight away
+  instead of first checking that it is unused; the primary key still
+  rejects a duplicate and create() retries with another key.
+- Expired rows are deleted in batches of SESSION_STORE["PURGE_BATCH_SIZE"]
+  (one DELETE each, oldest first through the expire_date index), so
+  `manage.py clearsessions` never holds SQLite's write lock for long.
+  Every SESSION_STORE["PURGE_EVERY"] new sessions the process also deletes
+  one batch itself, which keeps the table from growing without bound even
+  when clearsessions is never run.
+
+Flash messages are kept in a cookie (MESSAGE_STORAGE in config/settings.py),
+so they never touch the session either.
+"""
+import itertools
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.base import VALID_KEY_CHARS
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import DatabaseError
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "PURGE_BATCH_SIZE": 200,
+    "PURGE_EVERY": 1000,  # new sessions per process between purges; 0 turns it off
+}
+
+_created = itertools.count(1)
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "SESSION_STORE", {})}
+
+
+def purge_expired_sessions(batch_size=None, pause=0.0, max_batches=None):
+    """Delete expired sessions batch by batch; return how many were deleted"""
+    from django.contrib.sessions.models import Session
+
+    batch_size = batch_size or get_options()["PURGE_BATCH_SIZE"]
+    expired = Session.objects.filter(expire_date__lt=timezone.now()).order_by("expire_date")
+    deleted = 0
+    batches = 0
+    while True:
+        # One statement per batch: a SELECT then a DELETE in one transaction
+        # would have to upgrade SQLite's read lock, which fails at once when
+        # another connection is writing
+        count, _ = Session.objects.filter(
+            session_key__in=Subquery(expired.values("session_key")[:batch_size])
+        ).delete()
+        deleted += count
+        batches += 1
+        if count < batch_size or (max_batches and batches >= max_batches):
+            return deleted
+        if pause:
+            # Let waiting writers in between batches
+            time.sleep(pause)
+
+
+def _purge_due():
+    every = get_options()["PURGE_EVERY"]
+    return bool(every) and next(_created) % every == 0
+
+
+def _purge_one_batch():
+    try:
+        purge_expired_sessions(max_batches=1)
+    except DatabaseError:
+        logger.exception("Purging expired sessions failed")
+
+
+class SessionStore(DBStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # (serialized data, expire_date) of the row as loaded
+        self._stored = None
+
+    def load(self):
+        session = self._get_session_from_db()
+        return self._remember(session)
+
+    async def aload(self):
+        session = await self._aget_session_from_db()
+        return self._remember(session)
+
+    def _remember(self, session):
+        if session is None:
+            self._stored = None
+            return {}
+        data = self.decode(session.session_data)
+        self._stored = (self.serializer().dumps(data), session.expire_date)
+        return data
+
+    def _unchanged(self):
+        """True if saving would write the data the row already has, long enough before it expires"""
+        if self._stored is None or self.session_key is None or not hasattr(self, "_session_cache"):
+            return False
+        data, expire_date = self._stored
+        if self.serializer().dumps(self._session_cache) != data:
+            return False
+        remaining = (expire_date - timezone.now()).total_seconds()
+        return remaining > self.get_expiry_age() / 2
+
+    def save(self, must_create=False):
+        if not must_create and self._unchanged():
+            return
+        super().save(must_create)
+
+    async def asave(self, must_create=False):
+        if not must_create and self._unchanged():
+            return
+        await super().asave(must_create)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self.model.objects.filter(session_key=session_key).delete()
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        await self.model.objects.filter(session_key=session_key).adelete()
+
+    def _get_new_session_key(self):
+        # A collision fails the INSERT with CreateError and create() retries
+        return get_random_string(32, VALID_KEY_CHARS)
+
+    async def _aget_new_session_key(self):
+        return get_random_string(32, VALID_KEY_CHARS)
+
+    def create(self):
+        super().create()
+        if _purge_due():
+            _purge_one_batch()
+
+    async def acreate(self):
+        await super().acreate()
+        if _purge_due():
+            await sync_to_async(_purge_one_batch)()
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired_sessions()
+
+    @classmethod
+    async def aclear_expired(cls):
+        await sync_to_async(purge_expired_sessions)()
@@ -0,0 +1,40 @@
+"""
+Per-connection SQLite tuning.
+
+apply_sqlite_pragmas() is a connection_created receiver (connected in
+apps.py) that runs the PRAGMAs in settings.SQLITE_PRAGMAS on every new
+SQLite connection. The default settings define none; see
+config/settings_production.py. journal_mode is left alone on read-only
+connections (the replica, see replica.py), which cannot change it.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PRAGMA_NAME_RE = re.compile(r"^[a-z_]+$")
+PRAGMA_VALUE_RE = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+
+def pragma_statements(pragmas):
+    """Validate a {name: value} dict and return the PRAGMA statements for it"""
+    statements = []
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME_RE.match(name) or not PRAGMA_VALUE_RE.match(str(value)):
+            raise ImproperlyConfigured(f"Invalid SQLite PRAGMA setting {name!r}: {value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver (connected in apps.py)"""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if not pragmas:
+        return
+    if "mode=ro" in str(connection.settings_dict["NAME"]):
+        pragmas = {name: value for name, value in pragmas.items() if name != "journal_mode"}
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
@@ -0,0 +1,705 @@
+"""
+Behaviour tests for the performance work: login throttling, the mail outbox,
+reset codes, keyset pagination, bulk import, sessions, the read replica
+router, the session user cache, provisioning and the production profile.
+The login tests also check that the SQL injection demo still works.
+
+Migrations are not committed, so create them first:
+
+    python manage.py makemigrations Communication_LTD
+    python manage.py test Communication_LTD
+"""
+import csv
+import importlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import dictionary, executor, mailqueue, provisioning, replica, resetcodes, throttle, usercache
+from .bulk import import_clients, iter_rows
+from .hashers import get_hasher
+from .models import Client, OutboundEmail, ResetCode, User
+from .pagination import decode_cursor, keyset_paginate
+from .policy import get_policy, reset_policy_cache
+from .sessions import SessionStore, purge_expired_sessions
+
+# Cheap hashing on the calling thread, like benchmarks/login.py --fast-hash
+FAST_HASH = {
+    "PASSWORD_HASHER": "pbkdf2_sha256",
+    "PASSWORD_HASHER_PARAMS": {"pbkdf2_sha256": {"iterations": 1000}},
+    "PASSWORD_HASHING_EXECUTOR": {"KIND": "inline"},
+}
+PASSWORD = "Zq8!vBn#1xLm2"
+
+
+def reset_state():
+    """Drop the process-wide throttle, caches and hashing pool built from earlier settings"""
+    throttle._throttle = None
+    usercache._cache = None
+    if executor._executor is not None:
+        executor._executor.shutdown()
+        executor._executor = None
+    cache.clear()
+    reset_policy_cache()
+
+
+def make_user(username, password=PASSWORD, algorithm=None, **fields):
+    salt = os.urandom(16).hex()
+    return User.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        password_hash=get_hasher(algorithm).encode(password, salt),
+        salt=salt,
+        **fields,
+    )
+
+
+def log_in(client, user):
+    session = client.session
+    session["user_id"] = user.pk
+    session["username"] = user.username
+    session.save()
+
+
+@override_settings(**FAST_HASH)
+class AppTestCase(TestCase):
+    def setUp(self):
+        reset_state()
+        self.addCleanup(reset_state)
+
+
+# LOGIN
+
+
+class LoginTests(AppTestCase):
+    def login(self, username, password, client=None, **extra):
+        response = (client or self.client).post("/", {"username": username, "password": password}, **extra)
+        return response["Location"]
+
+    def test_login_upgrades_a_legacy_hash(self):
+        user = make_user("legacy", algorithm="hmac_sha256")
+        self.assertEqual(self.login("legacy", PASSWORD), "/dashboard/")
+        user.refresh_from_db()
+        self.assertTrue(user.password_hash.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.login("legacy", PASSWORD), "/dashboard/")
+
+    def test_wrong_passwords_lock_the_account(self):
+        make_user("alice")
+        for _ in range(get_policy().max_failed_logins):
+            self.assertEqual(self.login("alice", "wrong"), "/")
+        user = User.objects.get(username="alice")
+        self.assertTrue(user.is_locked)
+        self.assertEqual(user.failed_login_attempts, get_policy().max_failed_logins)
+        self.assertEqual(self.login("alice", PASSWORD), "/")
+
+    def test_locking_ends_an_open_session(self):
+        user = make_user("alice")
+        log_in(self.client, user)
+        self.assertEqual(self.client.get("/dashboard/").status_code, 200)
+        other = self.client_class()
+        for _ in range(get_policy().max_failed_logins):
+            self.login("alice", "wrong", client=other)
+        self.assertRedirects(self.client.get("/dashboard/"), "/", fetch_redirect_response=False)
+
+    def test_successful_login_clears_the_failure_count(self):
+        make_user("alice", failed_login_attempts=2)
+        self.assertEqual(self.login("alice", PASSWORD), "/dashboard/")
+        self.assertEqual(User.objects.get(username="alice").failed_login_attempts, 0)
+
+    def test_injection_bypass_does_not_store_the_attackers_password(self):
+        user = make_user("admin", algorithm="hmac_sha256")
+        # VULNERABLE: the demo bypass still logs in...
+        self.assertEqual(self.login("admin' --", "attacker"), "/dashboard/")
+        # ...but the hash it matched is not replaced with one of "attacker"
+        self.assertEqual(User.objects.get(pk=user.pk).password_hash, user.password_hash)
+        self.client.post("/logout/")
+        self.assertEqual(self.login("admin", "attacker"), "/")
+        self.assertEqual(self.login("admin", PASSWORD), "/dashboard/")
+
+    def test_percent_in_the_username_is_sent_as_typed(self):
+        make_user("admin")
+        response = self.client.post("/", {"username": "100%sure", "password": "x"})
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        self.assertEqual(self.login("x' OR u.username LIKE 'adm%' --", "x"), "/dashboard/")
+
+    @override_settings(LOGIN_THROTTLE={**settings.LOGIN_THROTTLE, "IP_LIMIT": 2})
+    def test_failures_block_the_client_ip(self):
+        make_user("alice")
+        self.login("nobody", "x")
+        self.login("nobody", "x")
+        self.assertEqual(self.login("alice", PASSWORD), "/")
+        self.assertEqual(self.login("alice", PASSWORD, REMOTE_ADDR="10.0.0.2"), "/dashboard/")
+
+
+# LOGIN THROTTLE
+
+
+class LoginThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def make_throttle(self, **kwargs):
+        return throttle.LoginThrottle(throttle.LocMemBackend(), user_window=60, ip_limit=3, ip_window=60, **kwargs)
+
+    def request(self, forwarded=None, remote="127.0.0.1"):
+        extra = {"REMOTE_ADDR": remote}
+        if forwarded is not None:
+            extra["HTTP_X_FORWARDED_FOR"] = forwarded
+        return self.factory.post("/", **extra)
+
+    def test_failures_are_counted_per_username_and_reset(self):
+        login_throttle = self.make_throttle()
+        self.assertEqual(login_throttle.register_failure(self.request(), "alice"), 1)
+        self.assertEqual(login_throttle.register_failure(self.request(), "alice"), 2)
+        self.assertEqual(login_throttle.register_failure(self.request(), "bob"), 1)
+        login_throttle.reset("alice")
+        self.assertEqual(login_throttle.register_failure(self.request(), "alice"), 1)
+
+    def test_ip_is_blocked_after_ip_limit_failures(self):
+        login_throttle = self.make_throttle()
+        for _ in range(3):
+            self.assertFalse(login_throttle.ip_blocked(self.request()))
+            login_throttle.register_failure(self.request(), None)
+        self.assertTrue(login_throttle.ip_blocked(self.request()))
+        self.assertFalse(login_throttle.ip_blocked(self.request(remote="10.0.0.2")))
+
+    def test_forwarded_header_is_ignored_unless_trusted(self):
+        login_throttle = self.make_throttle()
+        self.assertEqual(login_throttle.client_ip(self.request("203.0.113.7")), "127.0.0.1")
+
+    def test_client_ip_is_the_entry_the_proxy_appended(self):
+        login_throttle = self.make_throttle(trust_forwarded=True)
+        self.assertEqual(login_throttle.client_ip(self.request("203.0.113.7")), "203.0.113.7")
+        # The client wrote the first entry itself
+        self.assertEqual(login_throttle.client_ip(self.request("1.2.3.4, 203.0.113.7")), "203.0.113.7")
+        self.assertEqual(login_throttle.client_ip(self.request("")), "127.0.0.1")
+
+    def test_client_ip_behind_two_proxies(self):
+        login_throttle = self.make_throttle(trust_forwarded=True, trusted_proxies=2)
+        self.assertEqual(login_throttle.client_ip(self.request("1.2.3.4, 203.0.113.7, 10.0.0.1")), "203.0.113.7")
+        self.assertEqual(login_throttle.client_ip(self.request("203.0.113.7")), "203.0.113.7")
+
+    def test_spoofed_first_entries_share_one_counter(self):
+        login_throttle = self.make_throttle(trust_forwarded=True)
+        for i in range(3):
+            login_throttle.register_failure(self.request(f"6.6.6.{i}, 203.0.113.7"), None)
+        self.assertTrue(login_throttle.ip_blocked(self.request("9.9.9.9, 203.0.113.7")))
+        self.assertFalse(login_throttle.ip_blocked(self.request("203.0.113.8")))
+
+    def test_shared_backend_is_seen_by_every_instance(self):
+        if throttle.fcntl is None:
+            self.skipTest("the shared backend needs fcntl")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "throttle.bin")
+            first = throttle.SharedMemoryBackend(file=path, slots=64)
+            second = throttle.SharedMemoryBackend(file=path, slots=64)
+            first.incr("key", ttl=60)
+            self.assertEqual(second.incr("key", ttl=60), 2)
+            second.delete(["key"])
+            self.assertEqual(first.get("key"), 0)
+
+
+# MAIL OUTBOX
+
+
+@override_settings(
+    EMAIL_BACKEND="Communication_LTD.mailqueue.QueuedEmailBackend",
+    MAIL_QUEUE={
+        **settings.MAIL_QUEUE,
+        "BACKEND": "Communication_LTD.mailqueue.StandInBackend",
+        "DISPATCHER": "command",
+        "MAX_ATTEMPTS": 2,
+    },
+)
+class MailQueueTests(TestCase):
+    def queue(self, body="Your code: 1234"):
+        mail.send_mail("Password reset", body, None, ["alice@example.com"])
+        return OutboundEmail.objects.get()
+
+    def test_send_mail_only_queues(self):
+        row = self.queue()
+        self.assertEqual(row.status, OutboundEmail.PENDING)
+        self.assertEqual(mail.outbox, [])
+
+    def test_dispatch_sends_and_blanks_the_body(self):
+        self.queue()
+        self.assertEqual(mailqueue.dispatch_due(), 1)
+        self.assertEqual(mail.outbox[0].body, "Your code: 1234")
+        row = OutboundEmail.objects.get()
+        self.assertEqual(row.status, OutboundEmail.SENT)
+        self.assertEqual((row.body, row.html_body), ("", ""))
+
+    def test_failed_send_is_retried_then_given_up(self):
+        self.queue()
+        with override_settings(MAIL_QUEUE={**mailqueue.get_options(), "STANDIN_FAILURE_RATE": 1.0}):
+            mailqueue.dispatch_due()
+            row = OutboundEmail.objects.get()
+            self.assertEqual((row.status, row.attempts), (OutboundEmail.PENDING, 1))
+            self.assertGreater(row.next_attempt_at, timezone.now())
+            self.assertEqual(row.body, "Your code: 1234")
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            mailqueue.dispatch_due()
+            row = OutboundEmail.objects.get()
+            self.assertEqual((row.status, row.attempts), (OutboundEmail.FAILED, 2))
+            self.assertEqual(row.body, "")
+        self.assertEqual(mail.outbox, [])
+
+    def test_purge_deletes_old_finished_mail_only(self):
+        old = timezone.now() - timedelta(seconds=mailqueue.get_options()["KEEP_FINISHED"] + 60)
+        for status, when in [
+            (OutboundEmail.SENT, old),
+            (OutboundEmail.FAILED, old),
+            (OutboundEmail.SENT, timezone.now()),
+            (OutboundEmail.PENDING, old),
+        ]:
+            OutboundEmail.objects.create(subject="s", body="", from_email="a@example.com", status=status,
+                                         next_attempt_at=when)
+        self.assertEqual(mailqueue.purge_finished_mail(batch_size=1), 2)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+
+# RESET CODES
+
+
+@override_settings(RESET_CODES={**settings.RESET_CODES, "MAX_ATTEMPTS": 2})
+class ResetCodeTests(TestCase):
+    def test_correct_code_is_single_use(self):
+        resetcodes.store_reset_code("alice", "a" * 40)
+        self.assertEqual(resetcodes.check_reset_code("alice", "a" * 40), resetcodes.VALID)
+        self.assertEqual(resetcodes.check_reset_code("alice", "a" * 40), resetcodes.MISSING)
+
+    def test_wrong_guesses_are_limited(self):
+        resetcodes.store_reset_code("alice", "a" * 40)
+        self.assertEqual(resetcodes.check_reset_code("alice", "b" * 40), resetcodes.INCORRECT)
+        self.assertEqual(resetcodes.check_reset_code("alice", "b" * 40), resetcodes.INCORRECT)
+        self.assertEqual(resetcodes.check_reset_code("alice", "b" * 40), resetcodes.TOO_MANY_ATTEMPTS)
+        self.assertEqual(resetcodes.check_reset_code("alice", "a" * 40), resetcodes.TOO_MANY_ATTEMPTS)
+
+    def test_new_code_starts_over(self):
+        resetcodes.store_reset_code("alice", "a" * 40)
+        resetcodes.check_reset_code("alice", "b" * 40)
+        resetcodes.check_reset_code("alice", "b" * 40)
+        resetcodes.store_reset_code("alice", "c" * 40)
+        self.assertEqual(resetcodes.check_reset_code("alice", "c" * 40), resetcodes.VALID)
+
+    def test_code_expires_after_ttl(self):
+        resetcodes.store_reset_code("alice", "a" * 40)
+        ResetCode.objects.update(created_at=resetcodes.expiry_cutoff() - timedelta(seconds=1))
+        self.assertEqual(resetcodes.check_reset_code("alice", "a" * 40), resetcodes.EXPIRED)
+        self.assertFalse(ResetCode.objects.exists())
+
+    def test_purge_deletes_expired_codes_only(self):
+        for name in ("a", "b", "c", "fresh"):
+            resetcodes.store_reset_code(name, "a" * 40)
+        ResetCode.objects.exclude(username="fresh").update(
+            created_at=resetcodes.expiry_cutoff() - timedelta(seconds=1)
+        )
+        self.assertEqual(resetcodes.purge_expired_reset_codes(batch_size=2), 3)
+        self.assertEqual(list(ResetCode.objects.values_list("username", flat=True)), ["fresh"])
+
+
+# KEYSET PAGINATION
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.ids = [Client.objects.create(name=f"client {i}", phone="1").pk for i in range(7)]
+
+    def ids_of(self, page):
+        return [client.pk for client in page]
+
+    def test_pages_forward_and_back(self):
+        first = keyset_paginate(Client.objects.all(), page_size=3)
+        self.assertEqual(self.ids_of(first), self.ids[:3])
+        self.assertFalse(first.has_previous)
+
+        second = keyset_paginate(Client.objects.all(), first.next_cursor, page_size=3)
+        self.assertEqual(self.ids_of(second), self.ids[3:6])
+        third = keyset_paginate(Client.objects.all(), second.next_cursor, page_size=3)
+        self.assertEqual(self.ids_of(third), self.ids[6:])
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(Client.objects.all(), third.previous_cursor, page_size=3)
+        self.assertEqual(self.ids_of(back), self.ids[3:6])
+        self.assertTrue(back.has_previous)
+
+    def test_tampered_cursor_starts_at_the_first_page(self):
+        first = keyset_paginate(Client.objects.all(), page_size=3)
+        tampered = first.next_cursor[:-2] + "xx"
+        self.assertIsNone(decode_cursor(tampered))
+        self.assertEqual(self.ids_of(keyset_paginate(Client.objects.all(), tampered, page_size=3)), self.ids[:3])
+
+
+# BULK IMPORT AND EXPORT
+
+
+class BulkImportTests(AppTestCase):
+    def rows(self, data, fmt="csv"):
+        return list(iter_rows(io.BytesIO(data), fmt))
+
+    def test_valid_and_invalid_rows(self):
+        result = import_clients(self.rows(b"name,email,phone\r\na,a@example.com,1\r\n,b@example.com,2\r\nc,bad,3\r\n"))
+        self.assertEqual((result.created, result.rejected), (1, 2))
+        self.assertEqual([error["line"] for error in result.errors], [3, 4])
+
+    def test_undecodable_line_is_a_row_error(self):
+        rows = self.rows(b"name,email,phone\r\na,a@example.com,1\r\nb\xff,b@example.com,2\r\nc,c@example.com,3\r\n")
+        self.assertEqual([line for line, row in rows if row is None], [3])
+        result = import_clients(rows)
+        self.assertEqual((result.created, result.rejected), (2, 1))
+
+    def test_nul_is_a_row_error(self):
+        rows = self.rows(b"name,email,phone\r\na\x00,a@example.com,1\r\nb,b@example.com,2\r\n")
+        self.assertEqual([line for line, row in rows if row is None], [2])
+
+    def test_csv_error_skips_only_its_line(self):
+        limit = csv.field_size_limit(20)
+        self.addCleanup(csv.field_size_limit, limit)
+        rows = self.rows(b"name,email,phone\r\n" + b"x" * 50 + b",a@example.com,1\r\nb,b@example.com,2\r\n")
+        self.assertIsNone(rows[0][1])
+        self.assertEqual(rows[-1][1]["name"], "b")
+
+    def test_ndjson_rows(self):
+        rows = self.rows(b'{"name": "a", "email": "a@example.com"}\n[1]\n{"name": "b\xff"}\nnot json\n', "ndjson")
+        self.assertEqual([row is None for _, row in rows], [False, True, True, True])
+
+    def test_import_view_reports_a_bad_byte_instead_of_failing(self):
+        log_in(self.client, make_user("alice"))
+        data = b"name,email,phone\r\n" + b"".join(b"n%d,n%d@example.com,1\r\n" % (i, i) for i in range(30))
+        data += b"bad\xff,x@example.com,1\r\nafter,after@example.com,1\r\n"
+        with override_settings(CLIENT_IMPORT_BATCH_SIZE=10):
+            response = self.client.post(
+                "/clients/import/", {"file": SimpleUploadedFile("clients.csv", data)}, HTTP_ACCEPT="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 31)
+        self.assertEqual(response.json()["errors"], [{"line": 32, "error": "Malformed row"}])
+        self.assertEqual(Client.objects.count(), 31)
+
+    def test_import_and_export_need_a_session(self):
+        upload = {"file": SimpleUploadedFile("clients.csv", b"name,email,phone\r\na,a@example.com,1\r\n")}
+        self.assertRedirects(self.client.post("/clients/import/", upload), "/", fetch_redirect_response=False)
+        self.assertRedirects(self.client.get("/clients/export/"), "/", fetch_redirect_response=False)
+        self.assertFalse(Client.objects.exists())
+
+    def test_export_neutralizes_formulas(self):
+        Client.objects.create(name="=HYPERLINK(1)", email="a@example.com", phone="+123")
+        log_in(self.client, make_user("alice"))
+        content = b"".join(self.client.get("/clients/export/").streaming_content).decode()
+        self.assertEqual(content.splitlines(), ["name,email,phone", "'=HYPERLINK(1),a@example.com,'+123"])
+
+
+# SESSIONS
+
+
+class SessionStoreTests(TestCase):
+    def test_unchanged_session_is_not_written(self):
+        store = SessionStore()
+        store["user_id"] = 1
+        store.create()
+        again = SessionStore(store.session_key)
+        self.assertEqual(again["user_id"], 1)
+        with self.assertNumQueries(0):
+            again["user_id"] = 1
+            again.save()
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"expired{i}", session_data="", expire_date=now - timedelta(hours=1))
+        Session.objects.create(session_key="live", session_data="", expire_date=now + timedelta(hours=1))
+        self.assertEqual(purge_expired_sessions(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
+
+
+# READ REPLICA
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.stamp = time.time()
+        for name, value in [("is_configured", True), ("is_copy", True), ("start_refresher", None)]:
+            patcher = mock.patch.object(replica, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(replica, "refreshed_at", side_effect=lambda options=None: self.stamp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        replica._thread_writes.__dict__.pop("at", None)
+        self.addCleanup(replica._thread_writes.__dict__.pop, "at", None)
+        self.router = replica.ReplicaRouter()
+
+    def test_fresh_copy_serves_reads(self):
+        self.assertEqual(self.router.db_for_read(Client), "replica")
+        self.assertEqual(self.router.db_for_write(Client), "default")
+
+    def test_other_models_stay_on_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), "default")
+
+    def test_old_copy_is_not_read(self):
+        self.stamp = time.time() - replica.get_options()["MAX_LAG"] - 1
+        self.assertEqual(self.router.db_for_read(Client), "default")
+
+    def test_use_primary(self):
+        with replica.use_primary():
+            self.assertEqual(self.router.db_for_read(Client), "default")
+        self.assertEqual(self.router.db_for_read(Client), "replica")
+
+    def test_read_after(self):
+        with replica.read_after(self.stamp - 1):
+            self.assertEqual(self.router.db_for_read(Client), "replica")
+        with replica.read_after(self.stamp):
+            self.assertEqual(self.router.db_for_read(Client), "default")
+
+    def test_thread_that_wrote_reads_its_writes(self):
+        replica._mark_thread_write()
+        self.assertEqual(self.router.db_for_read(Client), "default")
+        self.stamp = time.time() + 1
+        self.assertEqual(self.router.db_for_read(Client), "replica")
+
+    def test_middleware_pins_unsafe_requests_and_writers(self):
+        factory = RequestFactory()
+
+        def view(request):
+            replica._request.get().wrote = request.method == "POST"
+            return self.router.db_for_read(Client)
+
+        middleware = replica.ReplicaPinMiddleware(lambda request: mock.Mock(database=view(request)))
+        self.assertEqual(middleware(factory.get("/")).database, "replica")
+        response = middleware(factory.post("/"))
+        self.assertEqual(response.database, "default")
+        response.set_cookie.assert_called_once()
+        request = factory.get("/")
+        request.COOKIES["replica_pin"] = "1"
+        self.assertEqual(middleware(request).database, "default")
+
+
+class ReplicaRefreshTests(SimpleTestCase):
+    def test_refresh_replaces_the_copy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {"default": os.path.join(tmp, "primary.sqlite3"), "replica": os.path.join(tmp, "copy.sqlite3")}
+            primary = sqlite3.connect(paths["default"])
+            primary.execute("PRAGMA journal_mode = WAL")
+            primary.execute("CREATE TABLE t (x)")
+            primary.execute("INSERT INTO t VALUES (1)")
+            primary.commit()
+            primary.close()
+
+            with mock.patch.object(replica, "_database_path", side_effect=paths.get):
+                before = time.time()
+                replica.refresh_replica()
+
+            copy = sqlite3.connect(f"file:{paths['replica']}?mode=ro", uri=True)
+            self.assertEqual(copy.execute("SELECT x FROM t").fetchall(), [(1,)])
+            self.assertEqual(copy.execute("PRAGMA journal_mode").fetchone(), ("delete",))
+            copy.close()
+            self.assertGreaterEqual(os.path.getmtime(paths["replica"]), before - 1)
+            self.assertFalse([name for name in os.listdir(tmp) if name.endswith(".tmp")])
+
+
+# SESSION USER CACHE
+
+
+class UserCacheTests(AppTestCase):
+    def test_user_is_cached_until_saved(self):
+        user = make_user("alice")
+        cache_ = usercache.UserCache(ttl=30)
+        self.assertEqual(cache_.get(user.pk).username, "alice")
+        with self.assertNumQueries(0):
+            cache_.get(user.pk)
+        usercache._cache = cache_
+        user.is_locked = True
+        user.save()
+        self.assertTrue(cache_.get(user.pk).is_locked)
+
+    def test_invalidation_in_a_transaction_is_repeated_on_commit(self):
+        user = make_user("alice")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            usercache.invalidate_user(user.pk)
+            # A read before the commit still sees the old row
+            usercache._get_cache().put(user)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(usercache.user_cache_stats()["size"], 0)
+
+    def test_locked_user_has_no_session_user(self):
+        user = make_user("alice")
+        log_in(self.client, user)
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        self.assertEqual(usercache.get_session_user(request), user)
+        User.objects.filter(pk=user.pk).update(is_locked=True)
+        usercache.invalidate_user(user.pk)
+        self.assertIsNone(usercache.get_session_user(request))
+
+
+class UserCacheReplicaTests(SimpleTestCase):
+    def setUp(self):
+        self.stamp = time.time()
+        for name in ("is_configured", "is_copy"):
+            patcher = mock.patch.object(replica, name, return_value=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in [("start_refresher", None)]:
+            patcher = mock.patch.object(replica, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(replica, "refreshed_at", side_effect=lambda options=None: self.stamp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        replica._thread_writes.__dict__.pop("at", None)
+        self.cache = usercache.UserCache()
+
+    def database_after_invalidation(self):
+        with self.cache._reading(self.cache._invalidated.get(1)):
+            return replica.ReplicaRouter().db_for_read(User)
+
+    def test_copy_older_than_the_invalidation_is_not_read(self):
+        self.assertEqual(self.database_after_invalidation(), "replica")
+        self.cache.invalidate(1)
+        self.assertEqual(self.database_after_invalidation(), "default")
+        self.stamp = time.time() + 1
+        self.assertEqual(self.database_after_invalidation(), "replica")
+
+    def test_row_read_before_an_invalidation_is_not_cached(self):
+        user = User(pk=1, username="alice")
+        started = time.time()
+        self.cache.invalidate(1)
+        self.cache._put_read(user, started - 1)
+        self.assertEqual(self.cache.stats()["size"], 0)
+        self.cache._put_read(user, time.time() + 1)
+        self.assertEqual(self.cache.stats()["size"], 1)
+
+    @override_settings(READ_REPLICA={**settings.READ_REPLICA, "MAX_LAG": 0})
+    def test_invalidations_are_forgotten_after_max_lag(self):
+        self.cache.invalidate(1)
+        time.sleep(0.01)
+        self.cache.invalidate(2)
+        self.assertEqual(list(self.cache._invalidated), [2])
+
+    def test_nothing_is_remembered_without_a_copy(self):
+        with mock.patch.object(replica, "is_copy", return_value=False):
+            self.cache.invalidate(1)
+        self.assertEqual(list(self.cache._invalidated), [])
+
+
+# METRICS
+
+
+class MetricsTests(TestCase):
+    def test_allowed_addresses(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_empty_token_allows_nobody(self):
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+
+# PROVISIONING
+
+
+class ProvisioningTests(AppTestCase):
+    def test_pool_is_kept_between_runs(self):
+        pool = provisioning.hashing_pool("thread", 2)
+        self.assertIs(provisioning.hashing_pool("thread", 2), pool)
+        self.assertIsNone(provisioning.hashing_pool("inline", 2))
+        with self.assertRaises(ImproperlyConfigured):
+            provisioning.hashing_pool("fork", 2)
+
+    def test_provision_users(self):
+        make_user("taken")
+        data = (
+            "username,email,password\r\n"
+            f"alice,alice@example.com,{PASSWORD}\r\n"
+            f"alice,other@example.com,{PASSWORD}\r\n"
+            f"taken,new@example.com,{PASSWORD}\r\n"
+            "weak,weak@example.com,short\r\n"
+            f"bob,bob@example.com,{PASSWORD}\r\n"
+        )
+        result = provisioning.provision_users(iter_rows(io.BytesIO(data.encode()), "csv"), pool="inline")
+        self.assertEqual((result.created, result.rejected), (2, 3))
+        self.assertEqual([error["line"] for error in result.errors], [3, 4, 5])
+        self.assertEqual(sorted(User.objects.values_list("username", flat=True)), ["alice", "bob", "taken"])
+
+
+# COMMON-PASSWORD INDEX
+
+
+class PasswordIndexTests(SimpleTestCase):
+    def build(self, tmp, numpy):
+        source = os.path.join(tmp, "common.txt")
+        if not os.path.exists(source):
+            with open(source, "w") as f:
+                f.write("".join(f"password{i}\n" for i in range(2000)) + "Secret\nsecret\n\n")
+        output = os.path.join(tmp, f"common-{bool(numpy)}.idx")
+        with mock.patch.object(dictionary, "_numpy", numpy):
+            self.assertEqual(dictionary.build_index(source, output), 2001)
+        with open(output, "rb") as f:
+            return output, f.read()
+
+    def test_lookup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output, _ = self.build(tmp, None)
+            index = dictionary.IndexedDictionary(output)
+            try:
+                self.assertIn("SECRET", index)
+                self.assertIn("password1999", index)
+                self.assertNotIn("password2000", index)
+                self.assertEqual(index.contains_many(["secret", "nope"]), [True, False])
+            finally:
+                index.close()
+
+    def test_numpy_build_is_identical(self):
+        numpy = dictionary.optional_numpy()
+        if numpy is None:
+            self.skipTest("numpy is not installed")
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(self.build(tmp, numpy)[1], self.build(tmp, None)[1])
+
+
+# PRODUCTION PROFILE
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def load(self, secret_key=None):
+        environ = {name: value for name, value in os.environ.items() if name != "DJANGO_SECRET_KEY"}
+        if secret_key:
+            environ["DJANGO_SECRET_KEY"] = secret_key
+        sys.modules.pop("config.settings_production", None)
+        try:
+            with mock.patch.dict(os.environ, environ, clear=True):
+                return importlib.import_module("config.settings_production")
+        finally:
+            sys.modules.pop("config.settings_production", None)
+
+    def test_signed_cookie_sessions_need_a_secret_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load()
+
+    def test_profile(self):
+        production = self.load("a-real-secret")
+        self.assertEqual(production.SECRET_KEY, "a-real-secret")
+        self.assertTrue(production.LOGIN_THROTTLE["TRUST_X_FORWARDED_FOR"])
+        self.assertEqual(production.LOGIN_THROTTLE["BACKEND"], "shared")
+        self.assertEqual(production.METRICS_TOKEN, "")
@@ -0,0 +1,295 @@
+"""
+Failed-login counters kept outside the database.
+
+Every failed login used to rewrite the User row. Now failures are counted in
+a sliding window per username and per client IP in a counter backend, and
+the database is only written when an account actually gets locked.
+
+Backends (settings.LOGIN_THROTTLE["BACKEND"]):
+
+- "locmem": per-process LRU dictionary; fine for a single worker.
+- "shared": fixed-size hash table in a memory-mapped file, guarded by flock,
+  so every worker process on the host shares the same counters (Unix only).
+- "cache": the Django cache ("default" or LOGIN_THROTTLE["CACHE"]), using
+  add() + incr(), which are atomic on memcached/Redis.
+
+The sliding window is approximated with two fixed windows: the previous
+window's count is weighted by how much of it still overlaps the last
+WINDOW seconds. That needs only one atomic increment per failure.
+
+Behind a reverse proxy REMOTE_ADDR is the proxy, so every client would share
+one IP counter. With TRUST_X_FORWARDED_FOR the client IP is read from
+X-Forwarded-For instead: each of the TRUSTED_PROXIES proxies appends the
+address it received the request from, so the entry TRUSTED_PROXIES from the
+right is the one the outermost proxy saw. Everything left of it comes from
+the client and is ignored.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULTS = {
+    "BACKEND": "locmem",
+    "USER_WINDOW": 86400,  # failures within this many seconds count towards a lock
+    "IP_LIMIT": 20,  # failed attempts from one IP ...
+    "IP_WINDOW": 300,  # ... within this many seconds block that IP
+    "MAX_ENTRIES": 100000,  # locmem: LRU size
+    "FILE": None,  # shared: path of the counters file
+    "SLOTS": 65536,  # shared: hash table size (16 bytes each)
+    "CACHE": "default",  # cache: cache alias
+    "TRUST_X_FORWARDED_FOR": False,
+    "TRUSTED_PROXIES": 1,  # reverse proxies that append to X-Forwarded-For
+}
+
+
+class LocMemBackend:
+    """Counters in a per-process LRU dict"""
+
+    def __init__(self, max_entries=100000, **kwargs):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def incr(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            count, expires = self._data.get(key, (0, 0))
+            if expires <= now:
+                count = 0
+            count += 1
+            self._data[key] = (count, now + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return count
+
+    def get(self, key):
+        with self._lock:
+            count, expires = self._data.get(key, (0, 0))
+            return count if expires > time.monotonic() else 0
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class SharedMemoryBackend:
+    """
+    Counters in an mmap'ed file shared by all worker processes.
+
+    The file is an open-addressing hash table of SLOTS entries
+    (key hash u64, count u32, expiry u32 unix time). A key probes up to
+    PROBES consecutive slots; when they are all taken, the entry closest
+    to expiry is evicted.
+    """
+
+    SLOT = struct.Struct("<QII")
+    PROBES = 16
+
+    def __init__(self, file=None, slots=65536, **kwargs):
+        if fcntl is None:
+            raise ImproperlyConfigured("The 'shared' login throttle backend needs fcntl (Unix)")
+        self.path = file or os.path.join(settings.BASE_DIR, "login_throttle.bin")
+        self.slots = slots
+        size = self.SLOT.size * slots
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        # flock only excludes other processes; threads of this process share the lock
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _hash(self, key):
+        value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        return value or 1  # 0 marks an empty slot
+
+    def _find(self, key_hash, now):
+        """Return (offset, count) of the key's live slot, or of the slot to use for it"""
+        first = key_hash % self.slots
+        candidate = None
+        oldest = None
+        for probe in range(self.PROBES):
+            offset = ((first + probe) % self.slots) * self.SLOT.size
+            slot_hash, count, expires = self.SLOT.unpack_from(self._mm, offset)
+            if slot_hash == key_hash and expires > now:
+                return offset, count
+            if candidate is None and (slot_hash == 0 or expires <= now or slot_hash == key_hash):
+                candidate = offset
+            if oldest is None or expires < oldest[1]:
+                oldest = (offset, expires)
+        return (candidate if candidate is not None else oldest[0]), 0
+
+    def incr(self, key, ttl):
+        key_hash = self._hash(key)
+        now = int(time.time())
+        with self._locked():
+            offset, count = self._find(key_hash, now)
+            count += 1
+            self.SLOT.pack_into(self._mm, offset, key_hash, count, now + int(ttl))
+            return count
+
+    def get(self, key):
+        key_hash = self._hash(key)
+        now = int(time.time())
+        with self._locked():
+            offset, count = self._find(key_hash, now)
+            return count
+
+    def delete(self, keys):
+        now = int(time.time())
+        with self._locked():
+            for key in keys:
+                offset, count = self._find(self._hash(key), now)
+                if count:
+                    self.SLOT.pack_into(self._mm, offset, 0, 0, 0)
+
+
+class CacheBackend:
+    """Counters in a Django cache"""
+
+    def __init__(self, cache="default", **kwargs):
+        from django.core.cache import caches
+        self.cache = caches[cache]
+
+    def incr(self, key, ttl):
+        self.cache.add(key, 0, timeout=ttl)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, 1, timeout=ttl)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+    def delete(self, keys):
+        self.cache.delete_many(list(keys))
+
+
+BACKENDS = {
+    "locmem": LocMemBackend,
+    "shared": SharedMemoryBackend,
+    "cache": CacheBackend,
+}
+
+
+class SlidingWindow:
+    def __init__(self, backend, prefix, window):
+        self.backend = backend
+        self.prefix = prefix
+        self.window = window
+
+    def _buckets(self, key, now):
+        index = int(now // self.window)
+        weight = 1 - (now % self.window) / self.window
+        base = f"throttle:{self.prefix}:{key}"
+        return f"{base}:{index}", f"{base}:{index - 1}", weight
+
+    def count(self, key):
+        current, previous, weight = self._buckets(key, time.time())
+        return self.backend.get(current) + self.backend.get(previous) * weight
+
+    def hit(self, key):
+        """Record one event and return the number of events in the window"""
+        current, previous, weight = self._buckets(key, time.time())
+        return self.backend.incr(current, ttl=2 * self.window) + self.backend.get(previous) * weight
+
+    def reset(self, key):
+        current, previous, _ = self._buckets(key, time.time())
+        self.backend.delete([current, previous])
+
+
+def _key(value):
+    # Fixed-length key that is safe for any cache backend
+    return hashlib.blake2b(value.encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+
+
+class LoginThrottle:
+    def __init__(self, backend, user_window, ip_limit, ip_window, trust_forwarded=False, trusted_proxies=1):
+        self.users = SlidingWindow(backend, "user", user_window)
+        self.ips = SlidingWindow(backend, "ip", ip_window)
+        self.ip_limit = ip_limit
+        self.trust_forwarded = trust_forwarded
+        self.trusted_proxies = max(trusted_proxies, 1)
+
+    def client_ip(self, request):
+        if self.trust_forwarded:
+            hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+            hops = [hop for hop in hops if hop]
+            if hops:
+                # The entries the trusted proxies appended are on the right
+                return hops[max(len(hops) - self.trusted_proxies, 0)]
+        return request.META.get("REMOTE_ADDR", "")
+
+    def ip_blocked(self, request):
+        """True if this client IP has too many recent failures"""
+        return self.ips.count(_key(self.client_ip(request))) >= self.ip_limit
+
+    def register_failure(self, request, username):
+        """Count a failed login and return the username's failures in the window"""
+        self.ips.hit(_key(self.client_ip(request)))
+        if not username:
+            return 0
+        return int(self.users.hit(_key(username)))
+
+    def user_failures(self, username):
+        return int(self.users.count(_key(username)))
+
+    def reset(self, username):
+        self.users.reset(_key(username))
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """The process-wide LoginThrottle configured by settings.LOGIN_THROTTLE"""
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                options = {**DEFAULTS, **getattr(settings, "LOGIN_THROTTLE", {})}
+                try:
+                    backend_class = BACKENDS[options["BACKEND"]]
+                except KeyError:
+                    raise ImproperlyConfigured(f"Unknown login throttle backend '{options['BACKEND']}'")
+                backend = backend_class(
+                    max_entries=options["MAX_ENTRIES"],
+                    file=options["FILE"],
+                    slots=options["SLOTS"],
+                    cache=options["CACHE"],
+                )
+                _throttle = LoginThrottle(
+                    backend,
+                    user_window=options["USER_WINDOW"],
+                    ip_limit=options["IP_LIMIT"],
+                    ip_window=options["IP_WINDOW"],
+                    trust_forwarded=options["TRUST_X_FORWARDED_FOR"],
+                    trusted_proxies=options["TRUSTED_PROXIES"],
+                )
+    return _throttle
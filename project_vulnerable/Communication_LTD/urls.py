@@ -1,15 +1,19 @@
 from django.urls import path
-from Communication_LTD import views
+from Communication_LTD import metrics, views
 
 urlpatterns = [
     path('', views.login_view, name='login'),
     path('register/', views.register_view, name='register'),
     path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('clients/import/', views.clients_import_view, name='clients_import'),
+    path('clients/export/', views.clients_export_view, name='clients_export'),
+    path('users/provision/', views.users_provision_view, name='users_provision'),
     path('forgot_password/', views.forgot_password_view, name='forgot_password'),
     path('verify/', views.verify_code_view, name='verify'),
     path('reset_password/', views.reset_password_view, name='reset_password'),
     path('change_password/', views.change_password_view, name='change_password'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
 
 
@@ -14,13 +14,42 @@ import secrets
 from django.conf import settings
 from django.contrib import messages
 from django.core.mail import send_mail
-from django.db import connection
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
-
-from .models import Client, PasswordHistory, ResetCode, User
-from .utils import check_password_rules, hash_code, hash_password, load_password_rules
+from django.template.loader import render_to_string
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.views.decorators.csrf import csrf_exempt
+
+from .bulk import (
+    detect_format,
+    import_clients,
+    iter_csv_export,
+    iter_ndjson_export,
+    iter_rows,
+)
+from . import resetcodes
+from .clientcache import (
+    client_list_fragment,
+    clients_changed,
+    dashboard_etag,
+    get_clients_version,
+)
+from .models import Client, User
+from .pagination import keyset_paginate
+from .provisioning import provision_users, token_matches
+from .repository import add_client, create_user, find_login, lock_user, user_exists
+from .search import search_clients
+from .policy import get_policy
+from .resetcodes import check_reset_code, store_reset_code
+from .throttle import get_login_throttle
+from .executor import offload_hash_password, offload_verify_password
+from .usercache import get_session_user, invalidate_user, login_session
+from .utils import add_password_history, check_password_rules, hash_code, password_needs_rehash
 
 
 def generate_sha1_code():
@@ -43,63 +72,42 @@ def login_view(request):
         username = request.POST.get("username")
         password = request.POST.get("password")
 
-        # STEP 1: Get salt for the user (first query)
-        # VULNERABLE: SQL Injection - using raw SQL without parameterization
-        with connection.cursor() as cursor:
-            query = (
-                f"SELECT salt FROM Communication_LTD_user WHERE username = '{username}'"
-            )
-            cursor.execute(query)
-            salt_row = cursor.fetchone()
-
-        if not salt_row:
+        throttle = get_login_throttle()
+        if throttle.ip_blocked(request):
             messages.error(request, "Invalid username or password")
             return redirect("login")
 
-        salt = salt_row[0]
+        # One query: the user row and whether the password matches
+        # VULNERABLE: SQL Injection - username and password check in one query
+        # This allows bypass with: admin' --
+        row = find_login(username, password)
+
+        if not row:
+            throttle.register_failure(request, None)
+            messages.error(request, "Invalid username or password")
+            return redirect("login")
 
-        # STEP 2: Hash the password with the retrieved salt
-        hashed, _ = hash_password(password, salt)
+        max_attempts = get_policy().max_failed_logins
 
-        # STEP 3: Query for user with this username AND password hash (VULNERABLE!)
-        # VULNERABLE: SQL Injection - checking both username and password in one query
-        # This allows bypass with: admin' --
-        with connection.cursor() as cursor:
-            query = f"SELECT id, username, email, failed_login_attempts, is_locked FROM Communication_LTD_user WHERE username = '{username}' AND password_hash = '{hashed}'"
-            cursor.execute(query)
-            row = cursor.fetchone()
+        if not row.password_ok:
+            # Wrong password - count the failure for this user
+            # Failures are counted in the throttle; the row is only written on lock
+            failed_attempts = throttle.register_failure(request, username)
+            new_is_locked = failed_attempts >= max_attempts
 
-        # Check if login failed (wrong password)
-        rules = load_password_rules()
-        max_attempts = rules.get("max_failed_logins", 3)
+            if new_is_locked:
+                lock_user(row.id, failed_attempts)
+                invalidate_user(row.id)
 
-        if not row:
-            # Wrong password - increment failed attempts for this user
-            with connection.cursor() as cursor:
-                # Get current failed attempts
-                query = f"SELECT id, failed_login_attempts, is_locked FROM Communication_LTD_user WHERE username = '{username}'"
-                cursor.execute(query)
-                user_data = cursor.fetchone()
-
-            if user_data:
-                user_id, failed_attempts, is_locked = user_data
-                failed_attempts += 1
-                new_is_locked = 1 if failed_attempts >= max_attempts else 0
-
-                with connection.cursor() as cursor:
-                    cursor.execute(f"UPDATE Communication_LTD_user SET failed_login_attempts = {failed_attempts}, is_locked = {new_is_locked} WHERE id = {user_id}")
-
-                if new_is_locked:
-                    messages.error(request, f"Account locked due to {max_attempts} failed login attempts. Contact administrator.")
-                else:
-                    remaining = max_attempts - failed_attempts
-                    messages.error(request, f"Invalid username or password. {remaining} attempts remaining.")
+            if new_is_locked:
+                messages.error(request, f"Account locked due to {max_attempts} failed login attempts. Contact administrator.")
             else:
-                messages.error(request, "Invalid username or password")
+                remaining = max_attempts - failed_attempts
+                messages.error(request, f"Invalid username or password. {remaining} attempts remaining.")
 
             return redirect("login")
 
-        user_id, db_username, _email, failed_attempts, is_locked = row
+        user_id, db_username, failed_attempts, is_locked, stored_hash = row[:5]
 
         # Check if user is locked
         if is_locked:
@@ -110,12 +118,25 @@ def login_view(request):
             return redirect("login")
 
         # Successful login - reset failed attempts
-        with connection.cursor() as cursor:
-            cursor.execute(
-                f"UPDATE Communication_LTD_user SET failed_login_attempts = 0 WHERE id = {user_id}"
+        throttle.reset(db_username)
+        # Upgrade the stored hash to the current hasher while we have the password.
+        # Written now, and only over the hash just verified, so it can never
+        # put an old password back over a change made in the meantime.
+        # password_ok is also true after an injected `admin' --`, so the password
+        # is checked again here: an attacker's password must never be stored.
+        if password_needs_rehash(stored_hash) and offload_verify_password(password, row.salt, stored_hash):
+            password_hash, salt = offload_hash_password(password)
+            User.objects.filter(pk=user_id, password_hash=stored_hash).update(
+                password_hash=password_hash, salt=salt
             )
+            invalidate_user(user_id)
+
+        # Failures are counted in the throttle; the column only needs clearing
+        # after a lock was lifted, so most logins write nothing here
+        if failed_attempts:
+            User.objects.filter(pk=user_id).update(failed_login_attempts=0)
 
-        request.session["username"] = db_username
+        login_session(request, user_id, db_username)
         return redirect("dashboard")
 
     return render(request, "login.html")
@@ -142,28 +163,15 @@ def register_view(request):
 
         # VULNERABLE: SQL Injection - checking if user exists
         # NO ESCAPING - allows SQL injection!
-        with connection.cursor() as cursor:
-            query = f"SELECT COUNT(*) FROM Communication_LTD_user WHERE username = '{username}' OR email = '{email}'"
-            cursor.execute(query)
-            count = cursor.fetchone()[0]
-
-        if count > 0:
+        if user_exists(username, email):
             messages.error(request, "Username or email already used")
             return redirect("register")
 
-        hashed, salt = hash_password(password)
+        hashed, salt = offload_hash_password(password)
 
-        # VULNERABLE: SQL Injection - inserting user
+        # VULNERABLE: SQL Injection - inserting user (and its password history)
         # NO ESCAPING - allows SQL injection!
-        with connection.cursor() as cursor:
-            query = f"INSERT INTO Communication_LTD_user (username, email, password_hash, salt, failed_login_attempts, is_locked) VALUES ('{username}', '{email}', '{hashed}', '{salt}', 0, 0)"
-            cursor.execute(query)
-
-        # Get the user we just created for password history
-        user = User.objects.get(username=username)
-
-        # Save password to history
-        PasswordHistory.objects.create(user=user, password_hash=hashed, salt=salt)
+        create_user(username, email, hashed, salt)
 
         messages.success(request, "Registration successful")
         return redirect("login")
@@ -175,12 +183,10 @@ def register_view(request):
 
 
 def dashboard_view(request):
-    if "username" not in request.session:
+    user = get_session_user(request)
+    if user is None:
         return redirect("login")
 
-    username = request.session["username"]
-    user = User.objects.get(username=username)
-
     if request.method == "POST":
         client_name = request.POST.get("client_name", "").strip()
         # VULNERABLE: No XSS sanitization - user can inject HTML/JavaScript
@@ -195,23 +201,132 @@ def dashboard_view(request):
 
         # VULNERABLE: SQL Injection - using raw SQL
         # NO ESCAPING - allows SQL injection!
-        with connection.cursor() as cursor:
-            query = f"INSERT INTO Communication_LTD_client (name, email, phone) VALUES ('{client_name}', '{client_email}', '{client_phone}')"
-            cursor.execute(query)
+        add_client(client_name, client_email, client_phone)
+        # Raw SQL sends no post_save signal
+        clients_changed()
 
         messages.success(request, "Client added successfully")
         return redirect("dashboard")
 
-    clients = Client.objects.all()
+    # A browser that already shows the current page gets a 304, before any query
+    version = get_clients_version()
+    etag = dashboard_etag(request, user, version)
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    query = request.GET.get("q", "").strip()
+    page_number = request.GET.get("page", "1")
+    page_number = int(page_number) if page_number.isdigit() else 1
+    cursor = request.GET.get("cursor")
+
+    def render_page():
+        if query:
+            page = search_clients(
+                query,
+                page_number=page_number,
+                page_size=settings.DASHBOARD_PAGE_SIZE,
+            )
+        else:
+            page = keyset_paginate(
+                Client.objects.all(),
+                cursor=cursor,
+                page_size=settings.DASHBOARD_PAGE_SIZE,
+            )
+        return render_to_string(
+            "client_list.html",
+            {"clients": page.object_list, "page": page, "q": query},
+        )
 
-    return render(
+    page_key = ("search", query, page_number) if query else ("list", cursor)
+    response = render(
         request,
         "dashboard.html",
         {
             "username": user.username,
-            "clients": clients,
+            "client_list": client_list_fragment(version, page_key, render_page),
+            "q": query,
         },
     )
+    if etag:
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+# BULK CLIENT IMPORT / EXPORT
+
+
+def clients_import_view(request):
+    if get_session_user(request) is None:
+        return redirect("login")
+
+    if request.method != "POST" or "file" not in request.FILES:
+        messages.error(request, "Choose a CSV or NDJSON file to import")
+        return redirect("dashboard")
+
+    upload = request.FILES["file"]
+    # VULNERABLE: rows are stored without XSS sanitization, like the dashboard form
+    result = import_clients(
+        iter_rows(upload.file, detect_format(upload.name, request.POST.get("format"))),
+        batch_size=settings.CLIENT_IMPORT_BATCH_SIZE,
+    )
+
+    if request.headers.get("Accept") == "application/json":
+        return JsonResponse(result.as_dict())
+
+    messages.success(
+        request,
+        f"Imported {result.created} clients ({result.rows_per_second:.0f} rows/s)",
+    )
+    if result.rejected:
+        first = result.errors[0]
+        messages.error(
+            request,
+            f"{result.rejected} rows rejected (line {first['line']}: {first['error']})",
+        )
+    return redirect("dashboard")
+
+
+def clients_export_view(request):
+    if get_session_user(request) is None:
+        return redirect("login")
+
+    chunk_size = settings.CLIENT_EXPORT_CHUNK_SIZE
+    if request.GET.get("format") == "ndjson":
+        response = StreamingHttpResponse(
+            iter_ndjson_export(chunk_size), content_type="application/x-ndjson"
+        )
+        response["Content-Disposition"] = 'attachment; filename="clients.ndjson"'
+    else:
+        response = StreamingHttpResponse(
+            iter_csv_export(chunk_size), content_type="text/csv"
+        )
+        response["Content-Disposition"] = 'attachment; filename="clients.csv"'
+    return response
+
+
+# BULK USER PROVISIONING (API, bearer token instead of a session)
+
+
+@csrf_exempt
+def users_provision_view(request):
+    if not token_matches(request):
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    if request.method != "POST" or "file" not in request.FILES:
+        return JsonResponse(
+            {"error": "POST a CSV or NDJSON user file as 'file'"}, status=400
+        )
+
+    upload = request.FILES["file"]
+    # Stored as given, like the register form of this build
+    result = provision_users(
+        iter_rows(upload.file, detect_format(upload.name, request.POST.get("format")))
+    )
+    return JsonResponse(result.as_dict())
 
 
 # LOGOUT
@@ -237,9 +352,7 @@ def forgot_password_view(request):
         code = generate_sha1_code()
         code_hash = sha1_hex(code)
 
-        ResetCode.objects.update_or_create(
-            username=username, defaults={"code_hash": code_hash}
-        )
+        store_reset_code(username, code_hash)
 
         # English comment: Send the plain code, store only the hash
         send_mail(
@@ -269,12 +382,20 @@ def verify_code_view(request):
             messages.error(request, "Please request a new code")
             return redirect("forgot_password")
 
-        reset_obj = ResetCode.objects.filter(username=username).first()
-        if not reset_obj:
+        result = check_reset_code(username, sha1_hex(code_input))
+        if result == resetcodes.MISSING:
             messages.error(request, "Invalid request")
             return redirect("forgot_password")
 
-        if sha1_hex(code_input) != reset_obj.code_hash:
+        if result == resetcodes.EXPIRED:
+            messages.error(request, "The code has expired, please request a new one")
+            return redirect("forgot_password")
+
+        if result == resetcodes.TOO_MANY_ATTEMPTS:
+            messages.error(request, "Too many attempts, please request a new code")
+            return redirect("forgot_password")
+
+        if result == resetcodes.INCORRECT:
             messages.error(request, "Incorrect code")
             return redirect("verify")
 
@@ -314,16 +435,14 @@ def reset_password_view(request):
             messages.error(request, msg)
             return redirect("reset_password")
 
-        hashed, salt = hash_password(password)
+        hashed, salt = offload_hash_password(password)
 
         # Save old password to history before updating
-        PasswordHistory.objects.create(
-            user=user, password_hash=user.password_hash, salt=user.salt
-        )
+        add_password_history(user, user.password_hash, user.salt)
 
         user.password_hash = hashed
         user.salt = salt
-        user.save()
+        user.save(update_fields=["password_hash", "salt"])
 
         request.session.pop("reset_username", None)
         request.session.pop("reset_verified", None)
@@ -337,19 +456,16 @@ def reset_password_view(request):
 
 
 def change_password_view(request):
-    if "username" not in request.session:
+    user = get_session_user(request)
+    if user is None:
         return redirect("login")
 
-    username = request.session["username"]
-    user = User.objects.get(username=username)
-
     if request.method == "POST":
         old = request.POST.get("old_password")
         new = request.POST.get("new_password")
         confirm = request.POST.get("confirm")
 
-        hashed_old, _ = hash_password(old, user.salt)
-        if hashed_old != user.password_hash:
+        if not offload_verify_password(old, user.salt, user.password_hash):
             messages.error(request, "Incorrect, old password")
             return redirect("change_password")
 
@@ -363,16 +479,14 @@ def change_password_view(request):
             messages.error(request, "Passwords do not match")
             return redirect("change_password")
 
-        hashed, salt = hash_password(new)
+        hashed, salt = offload_hash_password(new)
 
         # Save old password to history before updating
-        PasswordHistory.objects.create(
-            user=user, password_hash=user.password_hash, salt=user.salt
-        )
+        add_password_history(user, user.password_hash, user.salt)
 
         user.password_hash = hashed
         user.salt = salt
-        user.save()
+        user.save(update_fields=["password_hash", "salt"])
 
         messages.success(request, "Password changed successfully")
         return redirect("dashboard")
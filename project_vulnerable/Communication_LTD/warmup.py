@@ -0,0 +1,71 @@
+"""
+Start-up warm-up.
+
+Without it, the first requests a new worker serves pay for work that is the
+same every time: importing the views and everything they import (when the
+URLconf is first resolved), compiling the templates, reading
+passwordConfig.json and opening the common-passwords dictionary. With
+STARTUP_WARMUP["ENABLED"] (see config/settings_production.py), AppConfig.ready()
+calls warm_up(), so that work happens while the worker boots (or once in
+the master, with gunicorn --preload) instead of on a user's request.
+
+The compiled templates stay in the cached template loader (listed in
+config/settings_production.py; Django also uses it whenever TEMPLATES lists
+no loaders). warm_up() records how long each step took in `timings`;
+`manage.py startup_profile` reports them, `manage.py bench_templates` the
+compile and render time of each template.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULTS = {
+    "ENABLED": False,
+    # Template names to compile; None means every template of this app
+    "TEMPLATES": None,
+}
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+timings = {}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "STARTUP_WARMUP", {})}
+
+
+@contextmanager
+def _timed(step):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = time.perf_counter() - started
+
+
+def app_templates():
+    return sorted(name for name in os.listdir(TEMPLATE_DIR) if name.endswith(".html"))
+
+
+def warm_up(templates=None):
+    """Import the URLconf and compile the templates, policy and dictionary; returns the step timings"""
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    from .dictionary import get_dictionary
+    from .policy import get_policy
+
+    with _timed("urlconf"):
+        # Imports config.urls and, through it, every view module
+        get_resolver().url_patterns
+    with _timed("templates"):
+        for name in templates or app_templates():
+            get_template(name)
+    with _timed("policy"):
+        get_policy()
+    with _timed("dictionary"):
+        # The first lookup also pages in the Bloom filter of an indexed dictionary
+        "warm-up" in get_dictionary()
+    return dict(timings)
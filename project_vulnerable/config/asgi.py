@@ -3,6 +3,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Serves the async variants of the password-hashing views (config/asgi_urls.py)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings_asgi')
 
 application = get_asgi_application()
@@ -0,0 +1,17 @@
+from django.urls import include, path
+
+from Communication_LTD import async_views
+
+# Async views shadow the sync ones at the same paths; everything else
+# (bulk import/export, metrics, admin) falls through to the regular URLconf.
+urlpatterns = [
+    path('', async_views.login_view, name='login'),
+    path('register/', async_views.register_view, name='register'),
+    path('dashboard/', async_views.dashboard_view, name='dashboard'),
+    path('logout/', async_views.logout_view, name='logout'),
+    path('forgot_password/', async_views.forgot_password_view, name='forgot_password'),
+    path('verify/', async_views.verify_code_view, name='verify'),
+    path('reset_password/', async_views.reset_password_view, name='reset_password'),
+    path('change_password/', async_views.change_password_view, name='change_password'),
+    path('', include('config.urls')),
+]
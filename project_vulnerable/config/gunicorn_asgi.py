@@ -0,0 +1,30 @@
+"""
+gunicorn settings for serving config/asgi.py with uvicorn workers:
+
+    pip install gunicorn "uvicorn[standard]"
+    DJANGO_SECRET_KEY=... gunicorn -c config/gunicorn_asgi.py
+
+Each worker process runs one event loop. Password hashing runs in the
+hashing pool (PASSWORD_HASHING_EXECUTOR), so the loop keeps accepting
+requests while hashes are computed; use about one worker per CPU core.
+Override with WEB_CONCURRENCY, GUNICORN_BIND and DJANGO_SETTINGS_MODULE.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings_production_asgi')
+
+wsgi_app = 'config.asgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# The mail dispatcher and replica refresher threads are per process; keep workers
+# long-lived and let a slow request (a queued hash) finish on shutdown
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = '-'
@@ -0,0 +1,9 @@
+"""
+Settings for the ASGI entry point (config/asgi.py).
+
+Identical to settings.py except that the URLconf routes the account and
+dashboard views to their async variants in Communication_LTD/async_views.py.
+"""
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'config.asgi_urls'
@@ -0,0 +1,164 @@
+"""
+Production profile:
+
+    DJANGO_SETTINGS_MODULE=config.settings_production gunicorn config.wsgi
+
+Same application as settings.py, with DEBUG off and SQLite tuned for
+concurrent requests:
+
+- WAL journal, so readers never block the writer and vice versa;
+- synchronous=NORMAL (safe with WAL), a 256 MB mmap window and a larger
+  page cache, applied to every new connection (Communication_LTD/sqlite.py);
+- a busy timeout and BEGIN IMMEDIATE transactions, so concurrent writers
+  queue up instead of failing with "database is locked";
+- persistent connections (CONN_MAX_AGE) instead of one per request;
+- Client and User reads on GET requests from a read-only copy of the
+  database, refreshed every few seconds (Communication_LTD/replica.py);
+- static files fingerprinted and gzipped by collectstatic and served with
+  far-future Cache-Control (Communication_LTD/assets.py);
+- templates looked up in one place and compiled once per process, while
+  the worker boots (STARTUP_WARMUP, Communication_LTD/warmup.py);
+- sessions in signed cookies, so together with the user cache
+  (Communication_LTD/usercache.py) an authenticated page view needs no
+  query to identify the user.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],  # noqa: F405
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # seconds to wait for the write lock
+            'transaction_mode': 'IMMEDIATE',
+            # Compiled statements kept per connection (sqlite3 default 128)
+            'cached_statements': 256,
+        },
+    }
+}
+
+# Read-only copy of db.sqlite3 for the dashboard's Client and User reads,
+# refreshed with the SQLite backup API. To read the primary's file through
+# a separate read-only (WAL reader) connection instead, point NAME at
+# db.sqlite3; that never lags but shares the file's locks. Every refresh
+# replaces the file, so replica connections are not kept between requests.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': f"file:{BASE_DIR / 'db.replica.sqlite3'}?mode=ro",  # noqa: F405
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {
+        'timeout': 20,
+        'cached_statements': 256,
+    },
+}
+DATABASE_ROUTERS = ['Communication_LTD.replica.ReplicaRouter']
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -65536,  # KiB, i.e. 64 MB
+    'busy_timeout': 20000,
+    'temp_store': 'MEMORY',
+}
+
+# Right after the request metrics, before anything that reads
+MIDDLEWARE = [
+    *MIDDLEWARE[:1],  # noqa: F405
+    'Communication_LTD.replica.ReplicaPinMiddleware',
+    *MIDDLEWARE[1:],  # noqa: F405
+]
+
+# Templates come from the app directories only (settings.py also lists the
+# app's own template directory in DIRS, so every miss was looked up twice)
+# and are compiled once by the cached loader. STARTUP_WARMUP compiles all of
+# them in AppConfig.ready(); `manage.py bench_templates` measures them.
+TEMPLATES = [
+    {
+        **engine,
+        'DIRS': [],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **engine['OPTIONS'],
+            'debug': False,
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    }
+    for engine in TEMPLATES  # noqa: F405
+]
+
+STARTUP_WARMUP = {
+    **STARTUP_WARMUP,  # noqa: F405
+    'ENABLED': True,
+}
+
+# `manage.py collectstatic` before starting: {% static %} needs the manifest
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'Communication_LTD.assets.CompressedManifestStaticFilesStorage'},
+}
+
+STATIC_ASSETS = {
+    **STATIC_ASSETS,  # noqa: F405
+    'SERVE': True,
+}
+
+# The session travels in a signed (not encrypted) cookie: no session table
+# reads or writes. Logging out deletes the cookie but cannot revoke a copy of
+# it, so keep the lifetime short.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+SESSION_COOKIE_AGE = 8 * 60 * 60
+SESSION_COOKIE_HTTPONLY = True
+
+# Whoever knows SECRET_KEY can sign a session cookie for any user, so the
+# development key committed in config/settings.py must never sign them
+if SESSION_ENGINE == 'django.contrib.sessions.backends.signed_cookies' and not os.environ.get('DJANGO_SECRET_KEY'):
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY: sessions are signed cookies in this profile.')
+
+# Shared by all worker processes on the host, so a client added through one
+# worker invalidates the cached dashboard list in all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'django_cache',  # noqa: F405
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# Failed-login counters in a memory-mapped file shared by all worker processes.
+# With the per-process "locmem" default every gunicorn worker would count on
+# its own, allowing the policy's max failed logins (and IP_LIMIT) per worker.
+# Behind the reverse proxy every client comes from 127.0.0.1, so IP_LIMIT
+# counts the address the proxy appends to X-Forwarded-For instead: one proxy,
+# which must append (nginx: proxy_add_x_forwarded_for), not pass the header on.
+LOGIN_THROTTLE = {
+    **LOGIN_THROTTLE,  # noqa: F405
+    'BACKEND': 'shared',
+    'FILE': BASE_DIR / 'login_throttle.bin',  # noqa: F405
+    'TRUST_X_FORWARDED_FOR': True,
+    'TRUSTED_PROXIES': 1,
+}
+
+# Behind the reverse proxy every client comes from 127.0.0.1, so
+# METRICS_ALLOWED_IPS lets everyone through: /metrics needs this bearer token
+# as well, and answers 403 to everyone while METRICS_TOKEN is not set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Bearer token for POST /users/provision/; the endpoint answers 401 without it
+USER_PROVISIONING = {
+    **USER_PROVISIONING,  # noqa: F405
+    'TOKEN': os.environ.get('PROVISIONING_TOKEN'),
+}
@@ -1,10 +1,19 @@
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
+from Communication_LTD.assets import static_urlpatterns
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('Communication_LTD.urls')),
+    # STATIC_URL, when STATIC_ASSETS["SERVE"] is on
+    *static_urlpatterns(),
 ]
 
+# The lean profile (config/settings_lean.py) does not install the admin
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
 
 